@@ -0,0 +1,129 @@
+"""Align extract text (e.g. Gemini viral picks) to word timestamps from a Whisper transcript."""
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+# n-gram sizes tried in order; longer n-grams are more selective, shorter ones catch paraphrases
+_NGRAM_SIZES = (3, 2, 1)
+# Candidate alignments (diagonals) scored in detail per extract
+_MAX_CANDIDATES = 8
+# Minimum share of extract tokens that must match for an alignment to be accepted
+MIN_SCORE = 0.6
+
+
+class Alignment(BaseModel):
+    start: float  # seconds, millisecond precision
+    end: float
+    score: float  # share of extract tokens matched in order (0-1)
+    first_word: int
+    last_word: int
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with punctuation dropped ("Don't," -> "don't")."""
+    return _TOKEN_RE.findall(text.lower().replace("’", "'"))
+
+
+def words_from_whisper_result(result: dict) -> List[dict]:
+    """
+    Flatten Whisper output into [{'word', 'start', 'end'}, ...]. Segments without word timestamps
+    are split into words with their time spread evenly across the segment.
+    """
+    words = []
+    for segment in result.get("segments", []):
+        if segment.get("words"):
+            for w in segment["words"]:
+                words.append({"word": w["word"], "start": w["start"], "end": w["end"]})
+            continue
+        parts = segment.get("text", "").split()
+        if not parts:
+            continue
+        step = (segment["end"] - segment["start"]) / len(parts)
+        for i, part in enumerate(parts):
+            start = segment["start"] + i * step
+            words.append({"word": part, "start": start, "end": start + step})
+    return words
+
+
+class WordAligner:
+    """Token / n-gram index over a transcript's words, reusable for many extracts."""
+
+    def __init__(self, words: List[dict]):
+        self.words = words
+        self.tokens: List[str] = []
+        self.token_word: List[int] = []  # token position -> index into words
+        for wi, w in enumerate(words):
+            for tok in tokenize(w.get("word", "")):
+                self.tokens.append(tok)
+                self.token_word.append(wi)
+        self._indexes: Dict[int, Dict[Tuple[str, ...], List[int]]] = {}
+
+    def _index(self, n: int) -> Dict[Tuple[str, ...], List[int]]:
+        index = self._indexes.get(n)
+        if index is None:
+            index = defaultdict(list)
+            for p in range(len(self.tokens) - n + 1):
+                index[tuple(self.tokens[p:p + n])].append(p)
+            self._indexes[n] = index
+        return index
+
+    def _candidate_offsets(self, query: List[str]) -> List[int]:
+        """Vote for transcript offsets (transcript position - query position) using shared n-grams."""
+        for n in _NGRAM_SIZES:
+            if len(query) < n:
+                continue
+            index = self._index(n)
+            votes: Dict[int, int] = defaultdict(int)
+            for i in range(len(query) - n + 1):
+                for p in index.get(tuple(query[i:i + n]), ()):
+                    votes[p - i] += 1
+            if votes:
+                # Smooth over nearby offsets: insertions/deletions shift the diagonal a little
+                smoothed = {d: sum(votes.get(d + k, 0) for k in range(-3, 4)) for d in votes}
+                ranked = sorted(smoothed, key=lambda d: (-smoothed[d], d))
+                picked: List[int] = []
+                for d in ranked:
+                    if all(abs(d - other) > 3 for other in picked):
+                        picked.append(d)
+                    if len(picked) == _MAX_CANDIDATES:
+                        break
+                return picked
+        return []
+
+    def align(self, text: str, min_score: float = MIN_SCORE) -> Optional[Alignment]:
+        """Return the transcript span best matching `text`, or None if no span matches well enough."""
+        query = tokenize(text)
+        if not query or not self.tokens:
+            return None
+        slack = max(5, len(query) // 4)
+        best = None
+        for offset in self._candidate_offsets(query):
+            lo = max(0, offset - slack)
+            hi = min(len(self.tokens), offset + len(query) + slack)
+            matcher = SequenceMatcher(None, query, self.tokens[lo:hi], autojunk=False)
+            blocks = [b for b in matcher.get_matching_blocks() if b.size]
+            if not blocks:
+                continue
+            matched = sum(b.size for b in blocks)
+            first = lo + blocks[0].b
+            last = lo + blocks[-1].b + blocks[-1].size - 1
+            score = matched / len(query)
+            # Prefer higher score, then the tighter span, then the earlier one (deterministic)
+            key = (-score, last - first, first)
+            if best is None or key < best[0]:
+                best = (key, score, first, last)
+        if best is None or best[1] < min_score:
+            return None
+        _, score, first, last = best
+        first_word, last_word = self.token_word[first], self.token_word[last]
+        return Alignment(
+            start=round(self.words[first_word]["start"], 3),
+            end=round(self.words[last_word]["end"], 3),
+            score=round(score, 4),
+            first_word=first_word,
+            last_word=last_word,
+        )
@@ -1,36 +1,36 @@
 
 import os
 import sys
-import subprocess
 import logging
 import asyncio
-from pathlib import Path
+import re
+import shutil
+import uuid
 
 # Add viral_crew to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'viral_crew'))
 
 # Import viral crew modules
 # using dynamic imports or just standard imports if path is correct
-from viral_crew import extracts, crew, local_transcribe
+from viral_crew import extracts, crew
 
-from video_processor import render_timeline_clips, ClipData, FILES_DIR, generate_video_thumbnail
+from video_processor import render_timeline_clips, ClipData, FILES_DIR
+from media_probe import get_duration_seconds
+from transcripts import transcript_store
+import thumbnails
+from aligner import WordAligner, words_from_whisper_result
 
 
-def _get_duration_seconds(filepath: str):
-    """Return video duration in seconds via ffprobe, or None."""
-    try:
-        out = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", filepath],
-            capture_output=True, text=True, timeout=15
-        )
-        if out.returncode == 0 and out.stdout and out.stdout.strip():
-            return float(out.stdout.strip())
-    except (subprocess.TimeoutExpired, ValueError, OSError):
-        pass
-    return None
-
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Whisper model used when a media file has no transcript of at least AUTO_GENERATE_MIN_MODEL quality
+AUTO_GENERATE_MODEL = os.getenv("AUTO_GENERATE_MODEL", "medium.en")
+# By default only a transcript as good as AUTO_GENERATE_MODEL is reused (set to base to reuse the upload's)
+AUTO_GENERATE_MIN_MODEL = os.getenv("AUTO_GENERATE_MIN_MODEL", AUTO_GENERATE_MODEL)
+
+# Per-run workspaces (one subdirectory per auto-generate request, removed when it finishes)
+WORKSPACES_DIR = "auto_generate_runs"
+
 
 def _srt_timestamp_to_seconds(timestamp: str) -> float:
     """Convert SRT timestamp 'HH:MM:SS,mmm' to seconds."""
@@ -50,7 +50,6 @@ def parse_srt_time_range(srt_path: str) -> tuple:
     Read an SRT file and return (start_seconds, end_seconds) for the full segment.
     Uses the first cue's start and the last cue's end.
     """
-    import re
     if not os.path.exists(srt_path):
         return 0.0, 10.0
     with open(srt_path, "r", encoding="utf-8", errors="ignore") as f:
@@ -62,9 +61,13 @@ def parse_srt_time_range(srt_path: str) -> tuple:
         return 0.0, 10.0
     start_sec = _srt_timestamp_to_seconds(matches[0][0])
     end_sec = _srt_timestamp_to_seconds(matches[-1][1])
+    return _clamp_clip_range(start_sec, end_sec)
+
+
+def _clamp_clip_range(start_sec: float, end_sec: float) -> tuple:
+    """Clamp segment duration to 3–30 seconds (viral clips target 10–20 sec)."""
     if end_sec <= start_sec:
         end_sec = start_sec + 10.0
-    # Clamp segment duration to 3–30 seconds (viral clips target 10–20 sec)
     duration = end_sec - start_sec
     if duration > 30:
         end_sec = start_sec + 30
@@ -73,52 +76,78 @@ def parse_srt_time_range(srt_path: str) -> tuple:
     return start_sec, end_sec
 
 
+def _crew_output_number(filename: str) -> int:
+    """Segment number from a crew output name like new_file_return_subtitles_3_<ts>.srt."""
+    match = re.search(r"subtitles_(\d+)_", filename)
+    return int(match.group(1)) if match else 0
+
+
+def align_extracts(words: list, extracts_text: list) -> list:
+    """
+    Map each extract onto the transcript's word timestamps.
+    Returns one (start, end) or None per extract, in the same order.
+    """
+    word_aligner = WordAligner(words)
+    ranges = []
+    for i, text in enumerate(extracts_text):
+        alignment = word_aligner.align(text)
+        if alignment is None:
+            logging.warning(f"Extract {i+1} could not be aligned locally")
+            ranges.append(None)
+        else:
+            logging.info(f"Extract {i+1} aligned at {alignment.start:.3f}s - {alignment.end:.3f}s (score {alignment.score:.2f})")
+            ranges.append((alignment.start, alignment.end))
+    return ranges
+
+
 async def generate_viral_clips(video_filename: str, concept: str | None = None):
     """
     Full pipeline (per README: Upload → Normalize → Transcribe → Analyze → Viral Segments → Render):
     1. Transcribe (Whisper)
     2. Identify viral segments (Gemini), optionally guided by user concept/description
-    3. Get timestamps (Crew)
+    3. Get timestamps (local word alignment; Crew only for extracts that cannot be aligned)
     4. Render each segment as a single vertical clip (one file per viral moment)
+    Each run works in its own workspace, so several videos can be processed at once.
     """
     logging.info(f"Starting auto-generation for {video_filename}")
-    
-    # 1. Setup workspace (use backend CWD)
-    # viral_crew reads from whisper_output (first .srt) and writes to crew_output
-    whisper_dir = "whisper_output"
-    crew_dir = "crew_output"
-    os.makedirs(whisper_dir, exist_ok=True)
-    os.makedirs(crew_dir, exist_ok=True)
-    # Clear old outputs so this run's files are the only ones
-    for d in (whisper_dir, crew_dir):
-        for f in os.listdir(d):
-            try:
-                os.remove(os.path.join(d, f))
-            except OSError:
-                pass
 
     video_path = os.path.join(FILES_DIR, video_filename)
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
-        
-    # Copy video to a place where local_transcribe expects inputs? 
-    # local_transcribe.local_whisper_process iterates over 'input_files' folder. 
-    # Let's bypass that and call transcribe_main directly if possible, or adapt.
-    # local_transcribe.transcribe_main(file) returns transcript, subtitles
-    
+
+    workspace = _create_workspace()
+    try:
+        return await _generate_viral_clips(video_filename, video_path, concept, workspace)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+def _create_workspace() -> str:
+    """Create a private directory for one auto-generate run (relative to CWD, as CrewAI requires)."""
+    workspace = os.path.join(WORKSPACES_DIR, uuid.uuid4().hex)
+    os.makedirs(workspace)
+    return workspace
+
+
+async def _generate_viral_clips(video_filename: str, video_path: str, concept: str | None, workspace: str):
     logging.info("Step 1: Transcribing...")
-    # We can use the transcribe_main from local_transcribe
-    # It uses a global model which loads on import or first call.
+    # Reuse the transcript made at upload (or one still in progress) when its model is good enough;
+    # otherwise transcribe once with AUTO_GENERATE_MODEL, which also upgrades the editor's transcript.
     try:
-        transcript, subtitles = local_transcribe.transcribe_main(video_path)
+        future = await asyncio.to_thread(
+            transcript_store.ensure, video_path, AUTO_GENERATE_MODEL, AUTO_GENERATE_MIN_MODEL
+        )
+        stored = await asyncio.wrap_future(future)
+        transcript, subtitles = stored.read_text(), stored.read_subtitles()
+        logging.info(f"Using transcript made with Whisper '{stored.model}'")
     except Exception as e:
         logging.error(f"Transcription failed: {e}")
         return {"status": "error", "message": f"Transcription failed: {str(e)}"}
 
     logging.info("Step 2: Identifying Viral Clips...")
-    duration_sec = _get_duration_seconds(video_path)
-    viral_response = extracts.call_gemini_api(
-        transcript, duration_seconds=duration_sec, concept=concept
+    duration_sec = get_duration_seconds(video_path)
+    viral_response = await asyncio.to_thread(
+        extracts.call_gemini_api, transcript, duration_seconds=duration_sec, concept=concept
     )
     if not viral_response or 'clips' not in viral_response:
         return {"status": "error", "message": "Failed to identify viral clips."}
@@ -129,41 +158,36 @@ async def generate_viral_clips(video_filename: str, concept: str | None = None):
     logging.info(f"Identified {len(top_extracts)} viral extracts (ranked by virality).")
 
     logging.info("Step 3: Getting Timestamps...")
-    # crew.main(extracts) reads subtitles from 'whisper_output' folder.
-    # It uses 'get_subtitles()' which reads the first *.srt file.
-    # So we must ensure only our current file is there or we modify crew.py.
-    # For MVP, let's rely on the file existence.
-    
-    # We need to mock the arg passing or call main.
-    # crew.main(extracts) returns the result string, but it writes to crew_output/*.srt
-    
-    # NOTE: crew.py uses 'gemini-1.5-pro-exp-0801' which might be deprecated or gated. 
-    # We should probably update crew.py model to 'gemini-1.5-pro' or 'gemini-2.0-flash'.
-    # I'll check crew.py content later.
-    
-    try:
-        crew_result = crew.main(top_extracts)
-    except Exception as e:
-        logging.error(f"Crew execution failed: {e}")
-        return {"status": "error", "message": f"Timestamping failed: {str(e)}"}
-        
+    # Align extracts to word timestamps locally; only extracts that cannot be aligned
+    # (e.g. paraphrased by Gemini) are sent to the Crew subtitle matcher.
+    words = words_from_whisper_result(stored.read_result())
+    clip_ranges = align_extracts(words, top_extracts)
+    unmatched = [i for i, r in enumerate(clip_ranges) if r is None]
+    if unmatched:
+        crew_output_dir = os.path.join(workspace, "crew_output")
+        try:
+            await asyncio.to_thread(crew.main, [top_extracts[i] for i in unmatched], subtitles=subtitles, output_dir=crew_output_dir)
+            srt_files = sorted((f for f in os.listdir(crew_output_dir) if f.endswith(".srt")), key=_crew_output_number)
+            # Crew numbers its outputs 1..N in the order the extracts were given
+            for i, srt_file in zip(unmatched, srt_files):
+                clip_ranges[i] = parse_srt_time_range(os.path.join(crew_output_dir, srt_file))
+        except Exception as e:
+            logging.error(f"Crew execution failed: {e}")
+
     # Step 4: Render each viral segment as a single clip (vertical 9:16), not split-screen
     final_outputs = []
-    crew_output_dir = "crew_output"
-    srt_files = [f for f in os.listdir(crew_output_dir) if f.endswith(".srt")]
-    srt_files.sort()
-
-    logging.info(f"Found {len(srt_files)} generated subtitle files for rendering.")
-
-    for i, srt_file in enumerate(srt_files):
-        srt_path = os.path.join(crew_output_dir, srt_file)
+    for i, clip_range in enumerate(clip_ranges):
+        if clip_range is None:
+            logging.error(f"No timestamps for clip {i+1}; skipping")
+            continue
         try:
-            start_time, end_time = parse_srt_time_range(srt_path)
-            logging.info(f"Clip {i+1}: {start_time:.1f}s - {end_time:.1f}s")
+            start_time, end_time = _clamp_clip_range(*clip_range)
+            logging.info(f"Clip {i+1}: {start_time:.3f}s - {end_time:.3f}s")
             # One clip per viral segment → one version file per segment (no split-screen)
             clip = ClipData(filename=video_filename, start=start_time, end=end_time)
-            output_name = render_timeline_clips([clip])
-            generate_video_thumbnail(output_name)
+            output_name = await asyncio.to_thread(render_timeline_clips, [clip])
+            # Queued, not awaited: the thumbnails of several clips are made in one batch
+            thumbnails.request_thumbnail(os.path.join(FILES_DIR, output_name))
             final_outputs.append(output_name)
         except Exception as e:
             logging.error(f"Render failed for clip {i+1}: {e}")
@@ -0,0 +1,126 @@
+"""
+Benchmark keep-interval cutting at 10, 100 and 1000 intervals.
+
+Compares the select-expression engine (interval_cut.build_cut_command) with the previous
+per-interval trim/atrim + concat filter graph. Reports wall time, peak ffmpeg memory and
+the output's video/audio durations (which should match).
+
+    cd backend && python benchmarks/interval_cut_benchmark.py [--duration 120] [--counts 10,100,1000] [--no-legacy]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from interval_cut import build_cut_command  # noqa: E402
+
+
+def make_source(path: str, duration: float) -> None:
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", "testsrc2=size=640x360:rate=30",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+        "-t", str(duration),
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "60",
+        "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def make_intervals(count: int, duration: float, seed: int = 0) -> list:
+    """`count` disjoint intervals keeping about half of the source."""
+    rng = random.Random(seed)
+    slot = duration / count
+    intervals = []
+    for i in range(count):
+        length = slot * rng.uniform(0.3, 0.7)
+        start = i * slot + rng.uniform(0, slot - length)
+        intervals.append({"start": round(start, 3), "end": round(start + length, 3)})
+    return intervals
+
+
+def legacy_command(input_path: str, output_path: str, intervals: list) -> list:
+    """The trim/atrim-per-interval + concat graph edit_video_intervals used to build."""
+    parts, inputs = [], []
+    for i, interval in enumerate(intervals):
+        start, end = interval["start"], interval["end"]
+        parts.append(f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[v{i}]")
+        parts.append(f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[a{i}]")
+        inputs.append(f"[v{i}][a{i}]")
+    graph = ";".join(parts) + ";" + f"{''.join(inputs)}concat=n={len(intervals)}:v=1:a=1[outv][outa]"
+    script = output_path + ".filter"
+    # Large graphs exceed the argument length limit, so pass them as a script
+    with open(script, "w") as f:
+        f.write(graph)
+    return ["ffmpeg", "-y", "-i", input_path, "-filter_complex_script", script,
+            "-map", "[outv]", "-map", "[outa]",
+            "-c:v", "libx264", "-crf", "23", "-preset", "fast",
+            "-c:a", "aac", "-b:a", "192k", output_path]
+
+
+def run(command: list, timeout: float) -> dict:
+    """Run ffmpeg, returning wall time and peak RSS of that process (MB)."""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = started + timeout
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.perf_counter() > deadline:
+            process.kill()
+            os.wait4(process.pid, 0)
+            return {"seconds": None, "peak_mb": None, "error": "timeout"}
+        time.sleep(0.05)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - started
+    stderr = process.stderr.read().decode(errors="replace")
+    if process.returncode != 0:
+        return {"seconds": seconds, "peak_mb": usage.ru_maxrss / 1024, "error": stderr.strip().splitlines()[-1:]}
+    return {"seconds": seconds, "peak_mb": usage.ru_maxrss / 1024, "error": None}
+
+
+def stream_durations(path: str) -> dict:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,duration", "-of", "json", path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return {s["codec_type"]: float(s["duration"]) for s in json.loads(out)["streams"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=120.0, help="Source length in seconds")
+    parser.add_argument("--counts", default="10,100,1000")
+    parser.add_argument("--no-legacy", action="store_true", help="Skip the trim/concat engine")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-run timeout in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.mp4")
+        make_source(source, args.duration)
+        print(f"source: {args.duration:.0f}s 640x360@30 + 44.1 kHz audio")
+        print(f"{'engine':<8} {'intervals':>9} {'seconds':>9} {'peak MB':>9} {'video s':>9} {'audio s':>9}")
+        for count in [int(c) for c in args.counts.split(",")]:
+            intervals = make_intervals(count, args.duration)
+            engines = [("select", lambda out: build_cut_command(source, out, intervals)[0])]
+            if not args.no_legacy:
+                engines.append(("legacy", lambda out: legacy_command(source, out, intervals)))
+            for name, build in engines:
+                output = os.path.join(tmp, f"{name}_{count}.mp4")
+                result = run(build(output), args.timeout)
+                if result["error"]:
+                    print(f"{name:<8} {count:>9} {'-':>9} {'-':>9}  failed: {result['error']}")
+                    continue
+                durations = stream_durations(output)
+                print(f"{name:<8} {count:>9} {result['seconds']:>9.2f} {result['peak_mb']:>9.1f} "
+                      f"{durations.get('video', 0):>9.3f} {durations.get('audio', 0):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
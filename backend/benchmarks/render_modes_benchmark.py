@@ -0,0 +1,97 @@
+"""
+Benchmark timeline export modes by clip count.
+
+Compares the single-pass render (one ffmpeg, one filter graph for the whole timeline) with
+parallel per-clip mode (clips rendered concurrently to intermediates, joined with stream copy),
+without the render cache, cold with it, and with it warm. Every third clip comes from a source without audio, so the silent
+filler is exercised. Reports wall time and the output's frame count and video/audio durations
+(which should match between modes).
+
+    cd backend && python benchmarks/render_modes_benchmark.py [--counts 5,15,30] [--clip-seconds 4] [--workers N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import media_probe  # noqa: E402
+import video_processor  # noqa: E402
+from video_processor import ClipData, render_timeline_clips  # noqa: E402
+
+
+def make_source(path: str, duration: float, audio: bool) -> None:
+    command = ["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=30"]
+    if audio:
+        command += ["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100", "-c:a", "aac"]
+    command += ["-t", str(duration), "-c:v", "libx264", "-preset", "ultrafast", "-g", "60", path]
+    subprocess.run(command, check=True)
+
+
+def make_clips(count: int, clip_seconds: float, source_seconds: float) -> list:
+    """`count` zoomed clips spread over the two sources."""
+    clips = []
+    for i in range(count):
+        start = (i * clip_seconds * 1.5) % (source_seconds - clip_seconds)
+        clips.append(ClipData(
+            filename="silent.mp4" if i % 3 == 2 else "source.mp4",
+            start=round(start, 3), end=round(start + clip_seconds, 3), scale=1.1,
+        ))
+    return clips
+
+
+def stream_info(path: str) -> dict:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-count_packets", "-show_entries", "stream=codec_type,duration,nb_read_packets",
+         "-of", "json", path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    streams = {s["codec_type"]: s for s in json.loads(out)["streams"]}
+    return {
+        "frames": int(streams["video"]["nb_read_packets"]),
+        "video": float(streams["video"]["duration"]),
+        "audio": float(streams.get("audio", {}).get("duration", 0)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", default="5,15,30")
+    parser.add_argument("--clip-seconds", type=float, default=4.0)
+    parser.add_argument("--workers", type=int, default=video_processor.CLIP_RENDER_WORKERS,
+                        help="Concurrent clip renders in per-clip mode")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source_seconds = 120.0
+        make_source(os.path.join(tmp, "source.mp4"), source_seconds, audio=True)
+        make_source(os.path.join(tmp, "silent.mp4"), source_seconds, audio=False)
+        video_processor.FILES_DIR = tmp
+        media_probe.INDEX_PATH = os.path.join(tmp, "index.sqlite3")
+        video_processor.CLIP_RENDER_WORKERS = args.workers
+        video_processor.CLIP_RENDER_THREADS = max(1, (os.cpu_count() or 2) // args.workers)
+        print(f"sources: {source_seconds:.0f}s 1280x720@30 (one without audio); {args.clip_seconds:g}s clips; "
+              f"{args.workers} workers x {video_processor.CLIP_RENDER_THREADS} threads in parallel mode")
+        print(f"{'mode':<10} {'clips':>6} {'seconds':>9} {'frames':>7} {'video s':>9} {'audio s':>9}")
+        for count in [int(c) for c in args.counts.split(",")]:
+            clips = make_clips(count, args.clip_seconds, source_seconds)
+            video_processor.RENDER_CACHE_DIR = os.path.join(tmp, f".render_cache_{count}")
+            # The warm run re-renders the same timeline with every clip already cached
+            for mode, parallel, cached in [("single", False, False), ("parallel", True, False),
+                                           ("cached", True, True), ("warm", True, True)]:
+                video_processor.CLIP_RENDER_PARALLEL = parallel
+                video_processor.RENDER_CACHE = cached
+                output = f"{mode}_{count}.mp4"
+                started = time.perf_counter()
+                render_timeline_clips(clips, output)
+                seconds = time.perf_counter() - started
+                info = stream_info(os.path.join(tmp, output))
+                print(f"{mode:<10} {count:>6} {seconds:>9.2f} {info['frames']:>7} {info['video']:>9.3f} {info['audio']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
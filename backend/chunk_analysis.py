@@ -0,0 +1,95 @@
+"""Concurrent, rate-limited LLM calls over transcript chunks, with retries and interval merging."""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Chunks analysed at the same time
+CHUNK_CONCURRENCY = int(os.getenv("GEMINI_CHUNK_CONCURRENCY", "8"))
+# Request budget shared by all chunk calls in this process
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+# Attempts per chunk (first try included)
+CHUNK_ATTEMPTS = int(os.getenv("GEMINI_CHUNK_ATTEMPTS", "4"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Block until `tokens` are available, then take them."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+# Shared by every analysis so concurrent /query requests stay inside one budget
+gemini_rate_limiter = TokenBucket(rate=REQUESTS_PER_MINUTE / 60.0, capacity=max(1.0, min(float(CHUNK_CONCURRENCY), REQUESTS_PER_MINUTE)))
+
+
+def call_with_retry(fn: Callable[[], T], attempts: int = CHUNK_ATTEMPTS, base_delay: float = 1.0, max_delay: float = 30.0,
+                    limiter: Optional[TokenBucket] = None, sleep: Callable[[float], None] = time.sleep) -> T:
+    """Call fn, retrying on any exception with exponential backoff plus jitter. Re-raises the last error."""
+    for attempt in range(attempts):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fn()
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            sleep(delay + random.uniform(0, delay / 2))
+    raise RuntimeError("attempts must be at least 1")
+
+
+def map_concurrently(fn: Callable[[int, T], list], items: Sequence[T], max_workers: int = CHUNK_CONCURRENCY) -> List[list]:
+    """Run fn(index, item) for every item on a thread pool; results come back in input order."""
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))), thread_name_prefix="chunk") as executor:
+        return list(executor.map(fn, range(len(items)), items))
+
+
+def merge_intervals(intervals: list, gap: float = 0.0) -> List[dict]:
+    """
+    Sort and merge {'start', 'end'} intervals into a non-overlapping list. Intervals closer than
+    `gap` seconds are joined. Malformed entries (missing or non-numeric bounds, end <= start) are dropped.
+    """
+    cleaned = []
+    for interval in intervals:
+        if not isinstance(interval, dict):
+            continue
+        try:
+            start, end = float(interval["start"]), float(interval["end"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if end > start:
+            cleaned.append((start, end))
+    cleaned.sort()
+    merged: List[dict] = []
+    for start, end in cleaned:
+        if merged and start <= merged[-1]["end"] + gap:
+            merged[-1]["end"] = max(merged[-1]["end"], end)
+        else:
+            merged.append({"start": start, "end": end})
+    return merged
@@ -0,0 +1,155 @@
+"""
+Filmstrips for the timeline: frames sampled every FILMSTRIP_INTERVAL seconds, tiled into a few
+sprite sheets by one ffmpeg run, with a map (JSON or WebVTT) from time to sheet region. Only
+keyframes are decoded, from the proxy when there is one (short GOPs, already low resolution).
+"""
+import math
+import os
+import shutil
+import threading
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+import media_probe
+import proxies
+from render_cache import cache_key
+from render_jobs import run_ffmpeg
+from video_processor import FILES_DIR
+
+# Filmstrips live next to the masters in a hidden directory (not listed by /media)
+FILMSTRIP_DIR = os.getenv("FILMSTRIP_DIR", os.path.join(FILES_DIR, ".filmstrips"))
+# Seconds between sampled frames
+FILMSTRIP_INTERVAL = float(os.getenv("FILMSTRIP_INTERVAL", "1.0"))
+# Tile height in pixels (width follows the aspect ratio)
+FILMSTRIP_HEIGHT = int(os.getenv("FILMSTRIP_HEIGHT", "72"))
+# Tiles per sheet
+FILMSTRIP_COLUMNS = int(os.getenv("FILMSTRIP_COLUMNS", "10"))
+FILMSTRIP_ROWS = int(os.getenv("FILMSTRIP_ROWS", "10"))
+
+_in_flight: Dict[str, threading.Event] = {}
+_lock = threading.Lock()
+
+
+class Filmstrip(BaseModel):
+    """Geometry of a generated filmstrip: tile k covers [k * interval, (k + 1) * interval)."""
+    key: str
+    interval: float
+    duration: float
+    count: int
+    columns: int
+    rows: int
+    tile_width: int
+    tile_height: int
+
+    @property
+    def sheets(self) -> int:
+        return math.ceil(self.count / (self.columns * self.rows))
+
+    def region(self, tile: int) -> tuple:
+        """(sheet, x, y) of a tile."""
+        sheet, cell = divmod(tile, self.columns * self.rows)
+        row, column = divmod(cell, self.columns)
+        return sheet, column * self.tile_width, row * self.tile_height
+
+    def webvtt(self, sheet_url: Callable[[int], str]) -> str:
+        """WebVTT thumbnail track: one cue per tile with the sheet URL and #xywh= region."""
+        lines = ["WEBVTT", ""]
+        for tile in range(self.count):
+            sheet, x, y = self.region(tile)
+            start, end = tile * self.interval, min((tile + 1) * self.interval, self.duration)
+            lines += [f"{_timestamp(start)} --> {_timestamp(end)}",
+                      f"{sheet_url(sheet)}#xywh={x},{y},{self.tile_width},{self.tile_height}", ""]
+        return "\n".join(lines)
+
+
+def _timestamp(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def _media_dir(media_path: str) -> str:
+    return os.path.join(FILMSTRIP_DIR, os.path.basename(media_path))
+
+
+def sheet_path(media_path: str, key: str, sheet: int) -> str:
+    return os.path.join(_media_dir(media_path), key, f"sheet_{sheet:03d}.jpg")
+
+
+def filmstrip_command(source_path: str, output_pattern: str, tile_size: tuple, interval: float,
+                      columns: int, rows: int) -> List[str]:
+    """One ffmpeg run: decode keyframes only, sample one frame per interval, scale and tile them."""
+    return [
+        "ffmpeg", "-y", "-v", "error",
+        "-skip_frame", "nokey", "-i", source_path,
+        "-map", "0:v:0",
+        "-vf", f"fps=1/{interval:g},scale={tile_size[0]}:{tile_size[1]},setsar=1,tile={columns}x{rows}",
+        "-q:v", "4", "-start_number", "0",
+        output_pattern,
+    ]
+
+
+def _read(media_path: str, key: str) -> Optional[Filmstrip]:
+    try:
+        with open(os.path.join(_media_dir(media_path), key, "map.json"), "r", encoding="utf-8") as f:
+            return Filmstrip.model_validate_json(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def generate_filmstrip(media_path: str) -> Filmstrip:
+    """
+    The filmstrip of a video, made unless a current one exists. Concurrent calls for the same file
+    share one run. Raises ValueError if the file has no video stream or its duration is unknown.
+    """
+    info = media_probe.probe_media(media_path)
+    if info is None or not info.has_video or not info.duration or info.display_size is None:
+        raise ValueError(f"{os.path.basename(media_path)} has no video to make a filmstrip from")
+    stat = os.stat(media_path)
+    interval, columns, rows = FILMSTRIP_INTERVAL, FILMSTRIP_COLUMNS, FILMSTRIP_ROWS
+    key = cache_key(size=stat.st_size, mtime_ns=stat.st_mtime_ns, interval=interval, height=FILMSTRIP_HEIGHT,
+                    columns=columns, rows=rows)[:16]
+    while True:
+        strip = _read(media_path, key)
+        if strip is not None:
+            return strip
+        with _lock:
+            event = _in_flight.get(key)
+            owner = event is None
+            if owner:
+                event = _in_flight[key] = threading.Event()
+        if owner:
+            break
+        event.wait()
+
+    try:
+        width, height = info.display_size
+        tile_size = (max(2, 2 * round(width * FILMSTRIP_HEIGHT / height / 2)), FILMSTRIP_HEIGHT)
+        count = max(1, math.ceil(info.duration / interval - 1e-6))
+        source = proxies.proxy_path(media_path) if proxies.has_proxy(media_path) else media_path
+        media_dir = _media_dir(media_path)
+        tmp_dir = os.path.join(media_dir, f"{key}.partial")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            run_ffmpeg(filmstrip_command(source, os.path.join(tmp_dir, "sheet_%03d.jpg"), tile_size, interval, columns, rows))
+            strip = Filmstrip(key=key, interval=interval, duration=info.duration, count=count, columns=columns,
+                              rows=rows, tile_width=tile_size[0], tile_height=tile_size[1])
+            with open(os.path.join(tmp_dir, "map.json"), "w", encoding="utf-8") as f:
+                f.write(strip.model_dump_json())
+            os.replace(tmp_dir, os.path.join(media_dir, key))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        # Filmstrips of earlier versions of the file
+        for name in os.listdir(media_dir):
+            if name != key:
+                shutil.rmtree(os.path.join(media_dir, name), ignore_errors=True)
+        return strip
+    finally:
+        with _lock:
+            del _in_flight[key]
+        event.set()
+
+
+def delete_filmstrip(media_path: str) -> None:
+    shutil.rmtree(_media_dir(media_path), ignore_errors=True)
@@ -0,0 +1,289 @@
+"""Background ingest: uploads are normalized on a job queue, then transcribed and thumbnailed as dependent jobs."""
+import asyncio
+import os
+import subprocess
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import media_probe
+from render_jobs import CANCELLED, DONE, FAILED, RenderJob, RenderJobManager, run_ffmpeg
+from segmented_transcode import SEGMENTED_TRANSCODE_MIN_SECONDS, SegmentJoinError, transcode_segmented
+
+# Concurrent normalizations. Each libx264 encode already uses several threads.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) // 4))))
+# Concurrent follow-up jobs (transcription hand-off, thumbnails); these mostly wait on other work
+INGEST_FOLLOWUP_WORKERS = int(os.getenv("INGEST_FOLLOWUP_WORKERS", "4"))
+# Finished ingests are forgotten after this many seconds (the media itself stays listed)
+_INGEST_TTL_SECONDS = 3600
+
+# Media states
+PROCESSING = "processing"
+READY = "ready"
+
+# Normalization methods, cheapest first
+REMUX = "remux"  # already conforms: copy streams, move the index to the front
+AUDIO_ONLY = "audio"  # video conforms: copy it, re-encode the audio
+TRANSCODE = "transcode"  # full re-encode
+LOUDNORM = "loudnorm"  # audio uploads are always loudness-normalized
+DEDUPLICATED = "deduplicated"  # same bytes as stored media: linked to it, nothing run
+
+# The editor's working format
+_WIDTH, _HEIGHT, _FPS = 1920, 1080, 30.0
+_SAMPLE_RATE = 44100
+_TRANSCODE_VIDEO_ARGS = [
+    "-vf", f"scale={_WIDTH}:{_HEIGHT}:force_original_aspect_ratio=decrease,pad={_WIDTH}:{_HEIGHT}:-1:-1,setsar=1",
+    "-c:v", "libx264", "-preset", "fast", "-crf", "23",
+]
+_TRANSCODE_AUDIO_ARGS = ["-c:a", "aac", "-b:a", "128k", "-ar", str(_SAMPLE_RATE)]
+
+
+def _video_conforms(stream: Optional[media_probe.StreamInfo]) -> Optional[str]:
+    """None if the video stream can be copied as is, else why not."""
+    if stream is None:
+        return "no video stream"
+    if stream.codec_name != "h264" or stream.pix_fmt != "yuv420p":
+        return f"video is {stream.codec_name}/{stream.pix_fmt}"
+    if (stream.width, stream.height) != (_WIDTH, _HEIGHT) or stream.rotation:
+        return f"video is {stream.width}x{stream.height} rotated {stream.rotation}"
+    if stream.sample_aspect_ratio not in (None, "1:1", "0:1"):
+        return f"sample aspect ratio {stream.sample_aspect_ratio}"
+    if not stream.cfr or stream.fps is None or abs(stream.fps - _FPS) > 0.01:
+        return f"frame rate {stream.fps} ({'constant' if stream.cfr else 'variable'})"
+    return None
+
+
+def _audio_conforms(stream: Optional[media_probe.StreamInfo]) -> Optional[str]:
+    """None if the audio stream (or its absence) can be kept as is, else why not."""
+    if stream is None:
+        return None
+    if stream.codec_name != "aac" or stream.sample_rate != _SAMPLE_RATE:
+        return f"audio is {stream.codec_name} at {stream.sample_rate} Hz"
+    return None
+
+
+def plan_normalization(info: Optional[media_probe.MediaInfo], video: bool) -> Tuple[str, str]:
+    """Cheapest normalization that yields the working format, and the reason it was picked."""
+    if not video:
+        return LOUDNORM, "audio upload"
+    if info is None:
+        return TRANSCODE, "probe failed"
+    video_stream = next((s for s in info.streams if s.codec_type == "video" and s.width), None)
+    audio_stream = next((s for s in info.streams if s.codec_type == "audio"), None)
+    video_problem = _video_conforms(video_stream)
+    if video_problem:
+        return TRANSCODE, video_problem
+    audio_problem = _audio_conforms(audio_stream)
+    if audio_problem:
+        return AUDIO_ONLY, audio_problem
+    return REMUX, "already conforms"
+
+
+def normalize_command(input_path: str, output_path: str, video: bool, method: str = TRANSCODE) -> List[str]:
+    """ffmpeg command bringing an upload to the editor's working format with the given method."""
+    if method == REMUX:
+        return [
+            "ffmpeg", "-y",
+            "-i", input_path,
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-c", "copy",
+            "-movflags", "+faststart",
+            output_path,
+        ]
+    if method == AUDIO_ONLY:
+        return [
+            "ffmpeg", "-y",
+            "-i", input_path,
+            "-map", "0:v:0", "-map", "0:a:0",
+            "-c:v", "copy",
+            "-c:a", "aac", "-b:a", "128k", "-ar", str(_SAMPLE_RATE),
+            "-movflags", "+faststart",
+            output_path,
+        ]
+    if video:
+        return (["ffmpeg", "-y", "-i", input_path, "-r", f"{_FPS:g}"] + _TRANSCODE_VIDEO_ARGS + _TRANSCODE_AUDIO_ARGS
+                + ["-movflags", "+faststart", output_path])
+    return [
+        "ffmpeg", "-y",
+        "-i", input_path,
+        "-af", "loudnorm=I=-16:TP=-1.5:LRA=11",
+        "-b:a", "192k", "-ar", "44100",
+        output_path,
+    ]
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _transcode_in_segments(job: RenderJob, item: "MediaIngest", source_path: str, output_path: str,
+                           info: Optional[media_probe.MediaInfo]) -> bool:
+    """Transcode a long source in parallel segments. False if it is too short or the joined result was unusable."""
+    if SEGMENTED_TRANSCODE_MIN_SECONDS <= 0 or info is None or not info.duration or info.duration < SEGMENTED_TRANSCODE_MIN_SECONDS:
+        return False
+    try:
+        segments = transcode_segmented(source_path, output_path, info.duration, _FPS, info.has_audio,
+                                       _TRANSCODE_VIDEO_ARGS, _TRANSCODE_AUDIO_ARGS, job)
+    except (SegmentJoinError, subprocess.CalledProcessError) as e:
+        print(f"Segmented transcode of {item.id} failed ({e}); transcoding in one pass")
+        return False
+    print(f"Normalized {item.id} in {segments} segments")
+    return True
+
+
+# How often each normalization method was used since startup
+method_counts: Counter = Counter()
+
+
+def _normalize(job: RenderJob, item: "MediaIngest", source_path: str, final_path: str, video: bool,
+               info: Optional[media_probe.MediaInfo]) -> str:
+    """Normalize source_path into final_path (replacing any file already there)."""
+    if info is None:
+        info = media_probe.probe_partial(source_path)
+    method, reason = plan_normalization(info, video)
+    item.method = method
+    method_counts[method] += 1
+    print(f"Normalizing {item.id}: {method} ({reason}); totals {dict(method_counts)}")
+    output_path = f"{os.path.splitext(source_path)[0]}.normalized{os.path.splitext(final_path)[1]}"
+    duration = info.duration if info is not None else None
+    try:
+        if not (method == TRANSCODE and _transcode_in_segments(job, item, source_path, output_path, info)):
+            command = normalize_command(source_path, output_path, video, method)
+            print(f"Running normalization: {command}")
+            run_ffmpeg(command, job=job, duration=duration)
+        os.replace(output_path, final_path)
+    finally:
+        _remove(output_path)
+    media_probe.forget(final_path)
+    return os.path.basename(final_path)
+
+
+class MediaIngest:
+    """One upload moving through normalize -> follow-ups. Its id is the final filename, as in /media."""
+
+    def __init__(self, media_id: str, media_type: str):
+        self.id = media_id
+        self.type = media_type
+        self.normalize: Optional[RenderJob] = None
+        self.followups: Dict[str, RenderJob] = {}
+        self.method: Optional[str] = None  # normalization method, once chosen
+        self.created_at = time.time()
+
+    @property
+    def jobs(self) -> List[RenderJob]:
+        return [self.normalize] + list(self.followups.values())
+
+    @property
+    def status(self) -> str:
+        """PROCESSING until the normalized file is in place, then READY (follow-ups may still run)."""
+        if self.normalize.status == DONE:
+            return READY
+        if self.normalize.status in (FAILED, CANCELLED):
+            return FAILED
+        return PROCESSING
+
+    @property
+    def finished(self) -> bool:
+        return all(job.finished for job in self.jobs)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.id,
+            "type": self.type,
+            "status": self.status,
+            "progress": round(self.normalize.progress, 4),
+            "error": self.normalize.error,
+            "method": self.method,
+            "jobs": {"normalize": self.normalize.to_dict(), **{name: job.to_dict() for name, job in self.followups.items()}},
+        }
+
+
+class IngestManager:
+    """Normalization pool plus a pool for the jobs chained after it, and the table of recent ingests."""
+
+    def __init__(self, workers: int = INGEST_WORKERS, followup_workers: int = INGEST_FOLLOWUP_WORKERS):
+        self._normalize_jobs = RenderJobManager(max_workers=workers, name="ingest")
+        self._followup_jobs = RenderJobManager(max_workers=followup_workers, name="ingest-followup")
+        self._items: Dict[str, MediaIngest] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, source_path: str, final_path: str, video: bool, info: Optional[media_probe.MediaInfo] = None,
+               followups: Optional[Dict[str, Callable[[str], None]]] = None) -> MediaIngest:
+        """
+        Queue normalization of source_path into final_path, then each `followups[name](final_path)`
+        as its own job once the normalized file exists. `info` is the source's probe, if already
+        known. Raises ValueError if the same media is already being processed.
+        """
+        media_id = os.path.basename(final_path)
+        with self._lock:
+            self._prune()
+            existing = self._items.get(media_id)
+            if existing is not None and existing.status == PROCESSING:
+                raise ValueError(f"{media_id} is already being processed.")
+            item = MediaIngest(media_id, "video" if video else "audio")
+            item.normalize = self._normalize_jobs.submit(
+                "normalize", lambda job: _normalize(job, item, source_path, final_path, video, info)
+            )
+            # The upload is not needed once normalization has finished, failed or been cancelled
+            item.normalize.add_done_callback(lambda job: _remove(source_path))
+            item.followups = {
+                name: self._followup_jobs.submit(name, lambda job, fn=fn: fn(final_path), after=item.normalize)
+                for name, fn in (followups or {}).items()
+            }
+            self._items[media_id] = item
+        return item
+
+    def get(self, media_id: str) -> Optional[MediaIngest]:
+        with self._lock:
+            return self._items.get(media_id)
+
+    def get_job(self, job_id: str) -> Optional[RenderJob]:
+        return self._normalize_jobs.get(job_id) or self._followup_jobs.get(job_id)
+
+    def pending(self) -> List[MediaIngest]:
+        """Ingests whose media is not usable yet (still processing, or failed)."""
+        with self._lock:
+            return [item for item in self._items.values() if item.status != READY]
+
+    def cancel(self, media_id: str) -> bool:
+        """Cancel every job of an ingest. Returns False if there is none or it already finished."""
+        item = self.get(media_id)
+        if item is None or item.finished:
+            return False
+        for job in item.jobs:
+            job.cancel()
+        return True
+
+    async def wait_normalized(self, media_id: str) -> Optional[MediaIngest]:
+        """Wait until the media's normalization has finished (at once if there is none)."""
+        item = self.get(media_id)
+        if item is None:
+            return None
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def wake(job: RenderJob) -> None:
+            loop.call_soon_threadsafe(lambda: done.done() or done.set_result(None))
+
+        item.normalize.add_done_callback(wake)
+        await done
+        return item
+
+    def _prune(self) -> None:
+        cutoff = time.time() - _INGEST_TTL_SECONDS
+        stale = [media_id for media_id, item in self._items.items()
+                 if item.finished and max(job.finished_at or 0 for job in item.jobs) < cutoff]
+        for media_id in stale:
+            del self._items[media_id]
+
+    def shutdown(self) -> None:
+        self._normalize_jobs.shutdown()
+        self._followup_jobs.shutdown()
+
+
+ingest_jobs = IngestManager()
@@ -0,0 +1,149 @@
+"""Keep-interval cutting whose cost does not grow with the number of intervals."""
+import math
+import os
+from typing import List, Optional, Tuple
+
+from chunk_analysis import merge_intervals
+from media_probe import probe_media
+from render_graph import Clip, Filter, Render, Track, compile_render
+from render_jobs import RenderJob, run_ffmpeg
+
+# Assumed when the probe cannot tell (uploads are normalized to 30 fps / 44.1 kHz)
+_DEFAULT_FPS = 30.0
+_DEFAULT_SAMPLE_RATE = 44100
+# Upper bound on audio frame size used for selection; smaller = finer cuts, more frames to evaluate
+_MAX_AUDIO_CHUNK_SAMPLES = 256
+
+
+def normalize_intervals(intervals: list, duration: Optional[float] = None) -> List[Tuple[float, float]]:
+    """Merge overlapping intervals, clamp them to [0, duration] and drop empty ones."""
+    result = []
+    for interval in merge_intervals(intervals):
+        start, end = max(0.0, interval["start"]), interval["end"]
+        if duration is not None:
+            end = min(end, duration)
+        if end > start:
+            result.append((start, end))
+    return result
+
+
+def snap_to_grid(intervals: List[Tuple[float, float]], step: float) -> List[Tuple[int, int]]:
+    """Round interval bounds to whole multiples of `step` (e.g. video frames); returns step indices."""
+    snapped = []
+    for start, end in intervals:
+        a, b = round(start / step), round(end / step)
+        if b <= a:
+            continue
+        if snapped and a <= snapped[-1][1]:
+            snapped[-1] = (snapped[-1][0], max(snapped[-1][1], b))
+        else:
+            snapped.append((a, b))
+    return snapped
+
+
+def select_expression(intervals: List[Tuple[float, float]]) -> str:
+    """
+    ffmpeg expression that is 1 when t is inside one of the sorted, disjoint [start, end) intervals.
+    Built as a balanced tree of if(lt(t,pivot),...) so each frame costs O(log n) comparisons,
+    not one between() per interval.
+    """
+    if not intervals:
+        return "0"
+    if len(intervals) == 1:
+        start, end = intervals[0]
+        return f"gte(t,{start:.6f})*lt(t,{end:.6f})"
+    mid = len(intervals) // 2
+    pivot = intervals[mid][0]
+    return f"if(lt(t,{pivot:.6f}),{select_expression(intervals[:mid])},{select_expression(intervals[mid:])})"
+
+
+def _audio_chunk_samples(sample_rate: int, fps: float) -> int:
+    """Largest audio frame size (<= _MAX_AUDIO_CHUNK_SAMPLES) that divides one video frame's worth of samples."""
+    per_frame = sample_rate / fps
+    if abs(per_frame - round(per_frame)) > 1e-6:
+        return 64
+    per_frame = int(round(per_frame))
+    for n in range(min(_MAX_AUDIO_CHUNK_SAMPLES, per_frame), 0, -1):
+        if per_frame % n == 0:
+            return n
+    return 1
+
+
+def bounded_input(path: str, grid: List[Tuple[int, int]], fps: float) -> List[str]:
+    """
+    -i options for `path` that skip decoding before the first kept frame and after the last one.
+    -copyts keeps t absolute so select expressions built from grid still apply.
+    """
+    first, last = grid[0][0] / fps, grid[-1][1] / fps
+    seek = max(0.0, math.floor(first) - 1.0)
+    options = ["-ss", f"{seek:.3f}"] if seek > 0 else []
+    return options + ["-to", f"{last + 1.0:.3f}", "-copyts", "-i", path]
+
+
+def video_select_filter(grid: List[Tuple[int, int]], fps: float) -> str:
+    """select + setpts chain keeping frames [a, b) for each (a, b) in grid (video frame indices)."""
+    frame = 1.0 / fps
+    # Test at half-frame offsets so float rounding of t can never pick a neighbouring frame
+    ranges = [((a - 0.5) * frame, (b - 0.5) * frame) for a, b in grid]
+    return f"select='{select_expression(ranges)}',setpts=N/FRAME_RATE/TB"
+
+
+def audio_select_filter(grid: List[Tuple[int, int]], fps: float, sample_rate: int) -> str:
+    """
+    asetnsamples + aselect + asetpts chain keeping the audio of video frames [a, b) for each (a, b)
+    in grid. Audio is cut in frames that divide a video frame exactly, so it stays in sync with
+    video_select_filter across any number of cuts.
+    """
+    frame = 1.0 / fps
+    chunk = _audio_chunk_samples(sample_rate, fps)
+    half_chunk = 0.5 * chunk / sample_rate
+    ranges = [(a * frame - half_chunk, b * frame - half_chunk) for a, b in grid]
+    return f"asetnsamples=n={chunk}:p=0,aselect='{select_expression(ranges)}',asetpts=N/SR/TB"
+
+
+def build_cut_command(input_path: str, output_path: str, intervals: list, fps: float = _DEFAULT_FPS,
+                      sample_rate: Optional[int] = _DEFAULT_SAMPLE_RATE, duration: Optional[float] = None) -> Tuple[List[str], float]:
+    """
+    Build one ffmpeg command keeping `intervals` of the input. The source is decoded once and frames
+    are kept or dropped by a select expression, so decode time and memory follow the source duration
+    rather than the interval count. Bounds snap to video frames.
+    Returns (command, output duration in seconds).
+    """
+    frame = 1.0 / fps
+    grid = snap_to_grid(normalize_intervals(intervals, duration), frame)
+    if not grid:
+        raise ValueError("No valid intervals to keep")
+    kept = sum(b - a for a, b in grid) * frame
+    clip = Clip(
+        path=input_path, end=kept, input_args=bounded_input(input_path, grid, fps), has_audio=bool(sample_rate),
+        video=[Filter(expr=video_select_filter(grid, fps))],
+        audio=[audio_select_filter(grid, fps, sample_rate)] if sample_rate else [],
+    )
+    graph = compile_render(Render(tracks=[Track(clips=[clip])], audio=bool(sample_rate)))
+    output_args = ["-c:v", "libx264", "-crf", "23", "-preset", "fast"]
+    if sample_rate:
+        output_args += ["-c:a", "aac", "-b:a", "192k"]
+    return graph.command(output_path, output_args), kept
+
+
+def source_rates(path: str) -> Tuple[float, Optional[int], Optional[float]]:
+    """(fps, audio sample rate or None without audio, duration) of a media file, with defaults for unknowns."""
+    info = probe_media(path)
+    if info is None:
+        return _DEFAULT_FPS, _DEFAULT_SAMPLE_RATE, None
+    fps = info.fps or _DEFAULT_FPS
+    sample_rate = None
+    if info.has_audio:
+        audio = next((s for s in info.streams if s.codec_type == "audio"), None)
+        sample_rate = (audio.sample_rate if audio else None) or _DEFAULT_SAMPLE_RATE
+    return fps, sample_rate, info.duration
+
+
+def cut_intervals(input_path: str, output_path: str, intervals: list, job: Optional[RenderJob] = None) -> float:
+    """Write the kept intervals of input_path to output_path. Returns the output duration."""
+    fps, sample_rate, duration = source_rates(input_path)
+    command, kept = build_cut_command(input_path, output_path, intervals, fps=fps, sample_rate=sample_rate, duration=duration)
+    run_ffmpeg(command, job=job, duration=kept)
+    if not os.path.exists(output_path):
+        raise RuntimeError(f"ffmpeg did not produce {output_path}")
+    return kept
@@ -1,26 +1,27 @@
 
-from fastapi import FastAPI, File, UploadFile, BackgroundTasks, HTTPException
+from fastapi import FastAPI, File, UploadFile, BackgroundTasks, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from google import genai
 from google.genai import types
-import shutil
 from dotenv import load_dotenv
 import os
 import sys
 from pydantic import BaseModel
-from typing import Tuple, Union
+from typing import Callable, Dict, Optional, Set, Tuple, Union
 import subprocess
 from constants import SYSTEM_PROMPT, AUDIO_DESCRIPTION_SYSPROMPT
 import time
+import threading
+import hashlib
 import uuid
 import base64
 import asyncio
 import edge_tts
 import re
 import json
-import math
+import contextvars
 from concurrent.futures import ThreadPoolExecutor
 import auto_generator  # requires Python 3.10+ (CrewAI)
 
@@ -43,38 +44,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Media-Version", "X-Next-Cursor"],
 )
 
-from video_processor import FILES_DIR, ClipData, SplitTimelineRequest, render_split_timeline as render_split_timeline_logic, render_timeline_clips
+from video_processor import FILES_DIR, ClipData, SplitTimelineRequest, render_split_timeline_clips, render_timeline_clips
+from render_jobs import render_jobs, RenderJob, DONE
+from ingest import ingest_jobs, DEDUPLICATED, FAILED as INGEST_FAILED, PROCESSING as INGEST_PROCESSING, READY as INGEST_READY
+from media_catalog import get_catalog
+from media_store import get_store
+import proxies
+import thumbnails
+import filmstrips
+import waveforms
+import media_probe
+from transcription import transcription_service, WHISPER_PRELOAD
+from transcripts import transcript_store, UPLOAD_MODEL
+from interval_cut import cut_intervals, normalize_intervals, source_rates
+from smart_render import smart_render
+from uploads import UploadManager, OffsetMismatch, UploadRejected, UPLOAD_CHUNK_SIZE, UPLOAD_WRITE_BUFFER
+from versions import allocate_version, allocate_version_filename, version_filename
+from chunk_analysis import call_with_retry, gemini_rate_limiter, map_concurrently, merge_intervals
 
 # Mount the files directory to serve static files
 app.mount("/files", StaticFiles(directory=FILES_DIR), name="files")
-
-
-def _get_media_duration_seconds(filepath: str) -> Union[float, None]:
-    """Return duration in seconds via ffprobe, or None on failure."""
-    try:
-        out = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", filepath],
-            capture_output=True, text=True, timeout=10
-        )
-        if out.returncode == 0 and out.stdout and out.stdout.strip():
-            return float(out.stdout.strip())
-    except (subprocess.TimeoutExpired, ValueError, OSError):
-        pass
-    return None
-
-
-def _has_audio_stream(filepath: str) -> bool:
-    """Return True if the file has at least one audio stream."""
-    try:
-        out = subprocess.run(
-            ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_type", "-of", "default=noprint_wrappers=1:nokey=1", filepath],
-            capture_output=True, text=True, timeout=10
-        )
-        return out.returncode == 0 and out.stdout is not None and "audio" in out.stdout
-    except (subprocess.TimeoutExpired, OSError):
-        return False
+# Low-resolution proxies for editor playback, served separately from the masters
+os.makedirs(proxies.PROXY_DIR, exist_ok=True)
+app.mount("/proxies", StaticFiles(directory=proxies.PROXY_DIR), name="proxies")
 
 
 def audio_description(file: str, output_file: str):
@@ -128,32 +123,6 @@ def audio_description(file: str, output_file: str):
 
 
 
-def generate_snapshot(filename: str):
-    """
-    Generates a thumbnail snapshot for the given video file.
-    Saves it as {filename}.jpg in the same directory.
-    """
-    print(f"Generating snapshot for {filename}")
-    video_path = os.path.join(FILES_DIR, filename)
-    image_filename = f"{filename}.jpg"
-    image_path = os.path.join(FILES_DIR, image_filename)
-    
-    # Capture frame at 1 second mark
-    command = [
-        "ffmpeg", "-y",
-        "-ss", "00:00:01",
-        "-i", video_path,
-        "-vframes", "1",
-        "-q:v", "2",
-        image_path
-    ]
-    
-    try:
-        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        print(f"Snapshot generated: {image_filename}")
-    except subprocess.CalledProcessError as e:
-        print(f"Snapshot generation failed: {e.stderr}")
-
 # os.makedirs(UPLOAD_DIR, exist_ok=True)
 _FILES_DIR_PLACEHOLDER = "\0__FILES_DIR__\0"
 
@@ -271,6 +240,9 @@ def read_transcript(video_filename: str):
         print(f"Failed to read transcript: {e}")
         return f"Error reading transcript: {str(e)}"
 
+# Version reserved by the /query request being handled (tools called by the model write to it)
+_query_version: contextvars.ContextVar = contextvars.ContextVar("query_version", default=None)
+
 def edit_video_intervals(video_filename: str, intervals: list[dict[str, float]]):
     """
     Cuts the video to keep ONLY the specified intervals.
@@ -289,63 +261,25 @@ def edit_video_intervals(video_filename: str, intervals: list[dict[str, float]])
     if not intervals:
         return "Error: No intervals provided."
         
-    # Calculate next version number
-    num_files = 0
-    for name in os.listdir(FILES_DIR):
-        if os.path.isfile(os.path.join(FILES_DIR, name)) and name.startswith("version") and name[7:-4].isdigit():
-            num_files += 1
-    
-    output_filename = f"version{num_files+1}.mp4"
+    # Inside /query the version was reserved up front and promised to the model
+    reserved = _query_version.get()
+    output_filename = version_filename(reserved) if reserved is not None else allocate_version_filename(FILES_DIR)
     output_path = os.path.join(FILES_DIR, output_filename)
     
-    # Build complex filter
-    filter_parts = []
-    concat_inputs = []
-    
-    for i, interval in enumerate(intervals):
-        start = interval.get('start')
-        end = interval.get('end')
-        
-        # Validation
-        if start is None or end is None:
-            continue
-            
-        # Segment filter
-        # [0:v]trim=start=S:end=E,setpts=PTS-STARTPTS[vI];[0:a]atrim=start=S:end=E,asetpts=PTS-STARTPTS[aI]
-        segment_v = f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[v{i}]"
-        segment_a = f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[a{i}]"
-        
-        filter_parts.append(segment_v)
-        filter_parts.append(segment_a)
-        concat_inputs.append(f"[v{i}][a{i}]")
-        
-    # Concat part
-    concat_filter = f"{''.join(concat_inputs)}concat=n={len(intervals)}:v=1:a=1[outv][outa]"
-    full_filter = ";".join(filter_parts) + ";" + concat_filter
-    
-    command = [
-        "ffmpeg", "-y",
-        "-i", input_path,
-        "-filter_complex", full_filter,
-        "-map", "[outv]",
-        "-map", "[outa]",
-        "-c:v", "libx264", "-crf", "23", "-preset", "fast",
-        "-c:a", "aac", "-b:a", "192k",
-        output_path
-    ]
-    
-    # Convert command list to string for logging/debugging consistency with existing code style if needed, 
-    # but subprocess requires list for safety generally or string for shell=True. 
-    # The existing codebase mixes them. I'll use list and no shell=True for safety with complex filters.
-    
-    print(f"Running ffmpeg command for intervals...")
+    print(f"Running ffmpeg command for {len(intervals)} intervals...")
     try:
-        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        # Stream-copy whole GOPs when the cut allows it; otherwise re-encode with one select pass
+        _, _, duration = source_rates(input_path)
+        ranges = [(input_path, start, end) for start, end in normalize_intervals(intervals, duration)]
+        if not smart_render(ranges, output_path):
+            cut_intervals(input_path, output_path, intervals)
         print(f"Created {output_filename}")
         return output_filename
+    except ValueError as e:
+        return f"Error: {e}"
     except subprocess.CalledProcessError as e:
-        print(f"FFmpeg interval edit failed: {e.output}")
-        return f"Error running ffmpeg: {e.output}"
+        print(f"FFmpeg interval edit failed: {e.stderr or e}")
+        return f"Error running ffmpeg: {e.stderr or e}"
 
 def analyze_transcript_in_chunks(video_filename: str, criteria: str, chunk_duration: int):
     """
@@ -367,24 +301,12 @@ def analyze_transcript_in_chunks(video_filename: str, criteria: str, chunk_durat
 
     if not words:
         return "Error: Empty transcript."
-        
-    # 2. Split into chunks by time
-    try:
-        video_end = words[-1].get('end', 0)
-    except Exception:
-        video_end = 0
 
-    if video_end == 0:
-        # Fallback if end time missing, just use list length approx
-        num_chunks = max(1, math.ceil(len(words) / 200))  # Approx 200 words per min??
-        # Better to just iterate
-        pass
+    if not chunk_duration or chunk_duration <= 0:
+        chunk_duration = 60
 
-    # Better grouping logic:
+    # 2. Split into chunks by time
     chunks = []
-    current_chunk = []
-    current_chunk_index = 0
-    
     for word in words:
         if 'start' not in word:
             continue
@@ -398,19 +320,10 @@ def analyze_transcript_in_chunks(video_filename: str, criteria: str, chunk_durat
         chunks[chunk_idx].append(word)
             
     # 3. Analyze each chunk
-    all_keep_intervals = []
-    
-    # Helper to process one chunk (can be parallelized later if needed)
-    def process_chunk(index, chunk_words):
-        if not chunk_words:
-            return []
-            
+    def ask_model(index, chunk_words):
         start_time = index * chunk_duration
         end_time = (index + 1) * chunk_duration
         
-        # simplified transcript for this chunk
-        chunk_text = " ".join([w['word'] for w in chunk_words if 'word' in w])
-        
         chunk_prompt = f"""
         Analyze this transcript segment (from {start_time}s to {end_time}s).
         Goal: {criteria}
@@ -427,31 +340,33 @@ def analyze_transcript_in_chunks(video_filename: str, criteria: str, chunk_durat
         {json.dumps(chunk_words)}
         """
         
-        try:
-            # We use a synchronous call here since this is inside a tool
-            # Assuming 'client' is available in global scope or we create a new one
-            # Ideally we reuse the global client but use the sync method
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-lite", # Use consistent model
-                contents=chunk_prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.1
-                )
+        response = client.models.generate_content(
+            model="gemini-2.5-flash-lite", # Use consistent model
+            contents=chunk_prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                temperature=0.1
             )
-            
-            result = json.loads(response.text)
-            return result if isinstance(result, list) else []
-        except Exception as e:
-            print(f"Error processing chunk {index}: {e}")
+        )
+        result = json.loads(response.text)
+        if not isinstance(result, list):
+            raise ValueError(f"Expected a JSON list, got {type(result).__name__}")
+        return result
+
+    def process_chunk(index, chunk_words):
+        if not chunk_words:
             return []
+        try:
+            # Retries with backoff; every attempt waits for the shared Gemini rate limiter
+            return call_with_retry(lambda: ask_model(index, chunk_words), limiter=gemini_rate_limiter)
+        except Exception as e:
+            # Keep the chunk untouched rather than cutting speech we could not analyse
+            print(f"Error processing chunk {index}, keeping it whole: {e}")
+            return [{"start": chunk_words[0]['start'], "end": max(w.get('end', w['start']) for w in chunk_words)}]
 
-    # Process all chunks
-    # Simple serial processing for reliability first
-    for i, chunk in enumerate(chunks):
-        if chunk:
-            intervals = process_chunk(i, chunk)
-            all_keep_intervals.extend(intervals)
+    # Chunks are sent concurrently (GEMINI_CHUNK_CONCURRENCY) and merged into one sorted, non-overlapping list
+    results = map_concurrently(process_chunk, chunks)
+    all_keep_intervals = merge_intervals([interval for intervals in results for interval in intervals])
         
     print(f"Batch analysis complete. Found {len(all_keep_intervals)} intervals.")
     return all_keep_intervals
@@ -461,86 +376,159 @@ def is_error(s):
         return s
     return None
 
-from fastapi import BackgroundTasks
+def _media_catalog():
+    return get_catalog(FILES_DIR)
+
+
+# Seconds between syncs of the media catalog while clients follow GET /media/events
+MEDIA_WATCH_SECONDS = float(os.getenv("MEDIA_WATCH_SECONDS", "1"))
+
+# Wake-up events of the /media/events streams, and the one task that syncs the catalog for all of them
+_media_subscribers: Set[asyncio.Event] = set()
+_media_watch: Optional[asyncio.Task] = None
+# Normalization progress of pending uploads at the last sync (streamed apart from the catalog version)
+_media_progress: Dict[str, float] = {}
+
+
+async def _sync_media() -> None:
+    """Update the media catalog; new videos without a proxy get one, new viral clips a thumbnail."""
+    global _media_progress
+    # Uploads still being normalized (or that failed) are listed without a playable url. Their
+    # progress is left out of the entry, or every percent would be a new catalog version.
+    pending = [dict(item.to_dict(), url=None, proxyUrl=None, uploadDate=item.created_at, thumbnailUrl=None,
+                    size=None, durationSeconds=None, isViralClip=False) for item in ingest_jobs.pending()]
+    _media_progress = {entry["id"]: entry.pop("progress") for entry in pending}
+    changed = await asyncio.to_thread(_media_catalog().sync, pending)
+    for entry in changed:
+        if entry["status"] != "ready":
+            continue
+        if entry["isViralClip"] and not entry["thumbnailUrl"]:
+            thumbnails.request_thumbnail(os.path.join(FILES_DIR, entry["filename"]))
+        if entry["type"] == "video" and not entry["proxyUrl"]:
+            # Media from before proxies existed, and rendered versions
+            proxies.request_proxy(os.path.join(FILES_DIR, entry["filename"]))
+
+
+async def _watch_media() -> None:
+    """Sync the catalog every MEDIA_WATCH_SECONDS while /media/events has subscribers, waking them after each sync."""
+    while _media_subscribers:
+        await asyncio.sleep(MEDIA_WATCH_SECONDS)
+        try:
+            await _sync_media()
+        except Exception as e:
+            print(f"Media sync failed: {e}")
+        for wake in _media_subscribers:
+            wake.set()
+
+
+def _subscribe_media() -> asyncio.Event:
+    """An event set after each sync of the catalog; starts the sync task unless it is running."""
+    global _media_watch
+    wake = asyncio.Event()
+    _media_subscribers.add(wake)
+    if _media_watch is None or _media_watch.done() or _media_watch.get_loop() is not asyncio.get_running_loop():
+        _media_watch = asyncio.create_task(_watch_media())
+    return wake
+
+
+def _media_etag(*parts) -> str:
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:16] + '"'
+
 
 @app.get("/media")
-async def list_media(background_tasks: BackgroundTasks):
-    """List all available media files in the files directory."""
-    files = []
-    if os.path.exists(FILES_DIR):
-        all_names = os.listdir(FILES_DIR)
-        for filename in all_names:
-            if filename.startswith("normalized_"):
-                # We show the original name (part after normalized_) but allow accessing via normalized path if needed
-                # Actually, our upload logic renames normalized_X to X at the end.
-                # So we just look for files.
-                pass
-            
-            filepath = os.path.join(FILES_DIR, filename)
-            if os.path.isfile(filepath) and not filename.startswith("."):
-                # Basic filter for media types
-                if filename.lower().endswith(('.mp4', '.mp3', '.wav', '.mkv', '.mov')):
-                    # Determine type
-                    media_type = "video" if filename.lower().endswith(('.mp4', '.mkv', '.mov')) else "audio"
-                    url = f"http://127.0.0.1:8001/files/{filename}"
-                    size_bytes = os.path.getsize(filepath)
-                    duration_seconds = _get_media_duration_seconds(filepath)
-                    is_viral_clip = filename.startswith("version") and filename.endswith(".mp4")
-                    thumb_path = os.path.join(FILES_DIR, f"{filename}.jpg")
-                    has_thumb = os.path.exists(thumb_path)
-                    if is_viral_clip and not has_thumb:
-                        background_tasks.add_task(generate_snapshot, filename)
-                    files.append({
-                        "id": filename,
-                        "filename": filename,
-                        "url": url,
-                        "type": media_type,
-                        "uploadDate": os.path.getmtime(filepath),
-                        "thumbnailUrl": f"http://127.0.0.1:8001/files/{filename}.jpg" if has_thumb else None,
-                        "size": size_bytes,
-                        "durationSeconds": duration_seconds,
-                        "isViralClip": is_viral_clip
-                    })
-    # Sort by date desc
-    files.sort(key=lambda x: x['uploadDate'], reverse=True)
-    return files
-
-async def process_transcription(file_path: str):
-    print(f"Starting transcription for {file_path}")
-    output_dir = os.path.dirname(file_path)
-    # Run Whisper
-    # We use --model base to be faster, but user can change to medium/large if needed for accuracy
-    # --output_format json is critical for processing
-    # --word_timestamps True is critical for future cue-based editing
-    command = f'whisper "{file_path}" --model base --output_dir "{output_dir}" --output_format json --word_timestamps True'
-    
+async def list_media(request: Request, type: Optional[str] = None, cursor: Optional[str] = None,
+                     limit: Optional[int] = None):
+    """
+    List media files (and uploads still processing), newest first. `type` filters by media type
+    (comma-separated), `limit` pages the list: the next page starts at the X-Next-Cursor header's
+    value, passed as `cursor`. Responses carry an ETag (304 for a matching If-None-Match) and the
+    catalog version in X-Media-Version, from which GET /media/events streams changes.
+    """
+    await _sync_media()
+    catalog = _media_catalog()
+    version = catalog.version
+    etag = _media_etag(catalog.instance, version, type, cursor, limit)
+    headers = {"ETag": etag, "X-Media-Version": f"{catalog.instance}:{version}", "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
     try:
-        process = subprocess.run(
-            command,
-            shell=True,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True
-        )
-        print(f"Transcription completed for {file_path}")
-        print(process.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"Transcription failed for {file_path}: {e.output}")
+        files, next_cursor = catalog.items(type.split(",") if type else None, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return JSONResponse(files, headers=headers)
+
+
+@app.get("/media/events")
+async def media_events(since: Optional[str] = None):
+    """
+    Server-sent events with changes to the media list after version `since` (the X-Media-Version
+    of a listing): `upsert` with the entry, or `remove` with its id. A `reset` event means the
+    changes since then are no longer known and the client should list again. `progress` events
+    carry the normalization progress of uploads still processing and have no version.
+    """
+    catalog = _media_catalog()
+    await _sync_media()
+    instance, _, number = (since or "").partition(":")
+    version = int(number) if instance == catalog.instance and number.isdigit() else None
+
+    async def event_stream():
+        nonlocal version
+        if version is None:
+            version = catalog.version
+            yield f"event: reset\ndata: {json.dumps({'version': f'{catalog.instance}:{version}'})}\n\n"
+        last_sent = time.monotonic()
+        sent_progress: Dict[str, float] = {}
+        wake = _subscribe_media()
+        try:
+            while True:
+                changes = catalog.changes_since(version)
+                if changes is None:
+                    version = catalog.version
+                    yield f"event: reset\ndata: {json.dumps({'version': f'{catalog.instance}:{version}'})}\n\n"
+                    last_sent = time.monotonic()
+                for change_version, media_id, entry in changes or []:
+                    event = {"version": f"{catalog.instance}:{change_version}", "id": media_id}
+                    if entry is None:
+                        yield f"event: remove\ndata: {json.dumps(event)}\n\n"
+                    else:
+                        yield f"event: upsert\ndata: {json.dumps(dict(event, item=entry))}\n\n"
+                    version = change_version
+                    last_sent = time.monotonic()
+                progress = _media_progress
+                for media_id, value in progress.items():
+                    if sent_progress.get(media_id) != value:
+                        yield f"event: progress\ndata: {json.dumps({'id': media_id, 'progress': value})}\n\n"
+                        last_sent = time.monotonic()
+                sent_progress = progress
+                if time.monotonic() - last_sent > 15:
+                    # Comment line keeps proxies from closing an idle stream
+                    last_sent = time.monotonic()
+                    yield ": keep-alive\n\n"
+                await wake.wait()
+                wake.clear()
+        finally:
+            _media_subscribers.discard(wake)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 _MAX_VIDEO_DURATION_SECONDS = 4 * 3600  # 4 hours
 _ALLOWED_VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".webm")
+# Resumable uploads in progress (hidden directory: not listed by /media)
+upload_manager = UploadManager(os.path.join(FILES_DIR, ".uploads"))
 
-@app.post("/upload")
-async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    print(f"Uploading file: {file.filename}")
-    if not file.filename:
+def _check_upload_filename(filename: str) -> str:
+    """Return the lowercased extension of an upload, or raise ValueError if it is not accepted."""
+    if not filename:
         raise ValueError("No filename provided")
-    ext = os.path.splitext(file.filename)[1].lower()
+    ext = os.path.splitext(filename)[1].lower()
     if ext not in _ALLOWED_VIDEO_EXTENSIONS and ext != ".mp3":
         raise ValueError("Format not supported. Use one of: MP4, MOV, AVI, WebM, or MP3.")
+    return ext
 
-    # Ensure FILES_DIR exists
+
+def _ensure_files_dir() -> None:
     if not os.path.exists(FILES_DIR):
         try:
             os.makedirs(FILES_DIR)
@@ -548,94 +536,324 @@ async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = Fil
             print(f"Error creating files directory: {e}")
             raise ValueError(f"Server configuration error: Could not create upload directory.")
 
-    file_path = os.path.join(FILES_DIR, file.filename)
+
+def _transcribe_upload(file_path: str) -> None:
+    # Word-level transcript (critical for cue-based editing) with the faster upload model; auto-generate reuses it
+    transcript_store.ensure(file_path, UPLOAD_MODEL).result()
+    print(f"Transcription completed for {file_path}")
+
+
+def _media_store():
+    """Normalized uploads and their derived files by content hash (hidden directory: not listed by /media)."""
+    return get_store(os.path.join(FILES_DIR, ".store"))
+
+
+# Name choice and its reservation (submission, or a place in _reserved_names while a stored upload
+# is linked) happen together, so concurrent uploads cannot take one name
+_ingest_lock = threading.Lock()
+_reserved_names: Set[str] = set()
+
+
+def _available_name(filename: str) -> str:
+    """filename, or filename with a _N suffix if other media already has (or is being processed as) that name."""
+    stem, ext = os.path.splitext(filename)
+    name, n = filename, 1
+    while os.path.exists(os.path.join(FILES_DIR, name)) or name in _reserved_names or (
+            ingest_jobs.get(name) is not None and ingest_jobs.get(name).status == INGEST_PROCESSING):
+        n += 1
+        name = f"{stem}_{n}{ext}"
+    return name
+
+
+def _store_when_finished(item, digest: str, final_path: str) -> None:
+    """Add an ingest's media and derived files to the store once all its jobs are done."""
+    store = _media_store()
+
+    def done(job) -> None:
+        if not item.finished:
+            return
+        if item.status == INGEST_READY:
+            store.add(digest, final_path)
+        else:
+            store.release(digest, os.path.splitext(final_path)[1])
+
+    for job in item.jobs:
+        job.add_done_callback(done)
+
+
+def _start_ingest(filename: str, staged_path: str, digest: Optional[str] = None) -> dict:
+    """
+    Check an upload saved at staged_path and queue its normalization into FILES_DIR, followed by
+    transcription and a thumbnail. With the upload's sha256 (digest), media already stored (or
+    being ingested) from the same bytes is reused instead. Returns the media's status; raises
+    ValueError if the upload is refused.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    video = ext in _ALLOWED_VIDEO_EXTENSIONS
+    # MOV/AVI/WebM become MP4
+    final_filename = f"{os.path.splitext(filename)[0]}.mp4" if video else filename
+    final_ext = os.path.splitext(final_filename)[1]
+    store = _media_store()
+    if digest and store.lookup(digest, final_ext):
+        existing = os.path.join(FILES_DIR, final_filename)
+        if not store.holds(existing, digest):
+            with _ingest_lock:
+                final_filename = _available_name(final_filename)
+                _reserved_names.add(final_filename)
+            try:
+                store.link(digest, os.path.join(FILES_DIR, final_filename))
+            finally:
+                with _ingest_lock:
+                    _reserved_names.discard(final_filename)
+        os.remove(staged_path)
+        print(f"Upload of {filename} is already stored; linked as {final_filename}")
+        return {"id": final_filename, "filename": final_filename, "type": "video" if video else "audio",
+                "status": INGEST_READY, "progress": 1.0, "error": None, "method": DEDUPLICATED, "jobs": {}}
+
+    info = media_probe.probe_partial(staged_path)
+    duration = info.duration if info is not None else None
+    # Enforce max duration for video (4 hours)
+    if video and duration is not None and duration > _MAX_VIDEO_DURATION_SECONDS:
+        os.remove(staged_path)
+        raise ValueError(f"Video exceeds maximum duration of 4 hours (got {int(duration // 3600)}h).")
+
+    with _ingest_lock:
+        final_filename = _available_name(final_filename)
+        if digest:
+            first = store.claim(digest, final_ext, final_filename)
+            if first is not None and ingest_jobs.get(first) is not None:
+                # The same bytes are being ingested right now: resolve to that media
+                os.remove(staged_path)
+                return ingest_jobs.get(first).to_dict()
+        followups = {"transcription": _transcribe_upload}
+        if video:
+            followups["thumbnail"] = thumbnails.generate_thumbnail
+            followups["proxy"] = proxies.generate_proxy
+        try:
+            item = ingest_jobs.submit(staged_path, os.path.join(FILES_DIR, final_filename), video, info, followups)
+        except ValueError:
+            os.remove(staged_path)
+            if digest:
+                store.release(digest, final_ext)
+            raise
+    if digest:
+        _store_when_finished(item, digest, os.path.join(FILES_DIR, final_filename))
+    return item.to_dict()
+
+
+def _staging_path(filename: str) -> str:
+    """Unique path for a received upload waiting to be normalized (hidden directory: not listed by /media)."""
+    staging_dir = os.path.join(FILES_DIR, ".ingest")
+    os.makedirs(staging_dir, exist_ok=True)
+    return os.path.join(staging_dir, uuid.uuid4().hex + os.path.splitext(filename)[1].lower())
+
+
+def _upload_message(status: dict) -> str:
+    return "File already stored" if status["method"] == DEDUPLICATED else "File uploaded; processing"
+
+
+@app.post("/upload")
+async def upload_video(file: UploadFile = File(...)):
+    """Save the file and queue its processing; returns at once with the media id and status "processing"."""
+    print(f"Uploading file: {file.filename}")
+    filename = os.path.basename(file.filename or "")
+    try:
+        _check_upload_filename(filename)
+        _ensure_files_dir()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    file_path = _staging_path(filename)
+    hasher = hashlib.sha256()
     try:
+        # Large blocks, written and hashed off the event loop
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            while True:
+                block = await file.read(UPLOAD_WRITE_BUFFER)
+                if not block:
+                    break
+                await asyncio.to_thread(lambda: (buffer.write(block), hasher.update(block)))
     except IOError as e:
         print(f"Error saving uploaded file: {e}")
         raise ValueError(f"Failed to save uploaded file: {e}")
 
-    # Enforce max duration for video (4 hours)
-    if ext in _ALLOWED_VIDEO_EXTENSIONS:
-        dur = _get_media_duration_seconds(file_path)
-        if dur is not None and dur > _MAX_VIDEO_DURATION_SECONDS:
-            try:
-                os.remove(file_path)
-            except OSError:
-                pass
-            raise ValueError(f"Video exceeds maximum duration of 4 hours (got {int(dur // 3600)}h).")
-
-    final_filename = file.filename
-    # Normalize/transcode video to standard format for processing.
-    if ext in _ALLOWED_VIDEO_EXTENSIONS:
-        try:
-            input_path = os.path.join(FILES_DIR, file.filename)
-            # Output as MP4; for non-MP4 inputs we write to .mp4 and replace
-            base = os.path.splitext(file.filename)[0]
-            out_name = f"normalized_{base}.mp4"
-            output_path = os.path.join(FILES_DIR, out_name)
-            
-            # Use list format for command
-            command = [
-                "ffmpeg", "-y",
-                "-i", input_path,
-                "-vf", "scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:-1:-1,setsar=1",
-                "-r", "30",
-                "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-                "-c:a", "aac", "-b:a", "128k", "-ar", "44100",
-                "-movflags", "+faststart",
-                output_path
-            ]
-            
-            print(f"Running normalization: {command}")
-            result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            # If successful: remove original, store as base.mp4 (MOV/AVI/WebM become MP4)
-            os.remove(input_path)
-            final_mp4 = os.path.join(FILES_DIR, f"{base}.mp4")
-            if os.path.exists(final_mp4):
-                os.remove(final_mp4)
-            os.rename(output_path, final_mp4)
-            final_filename = f"{base}.mp4"
-            
-        except subprocess.CalledProcessError as e:
-            print(f"Video normalization failed. Return code: {e.returncode}")
-            print(f"STDOUT: {e.stdout}")
-            print(f"STDERR: {e.stderr}")
-            # Identify common errors
-            if "Permission denied" in e.stderr:
-                raise ValueError("Server permission error during video processing.")
-            raise ValueError(f"Video processing failed: {e.stderr[:200]}...") # Return partial error to user
-            
-    elif file.filename.endswith(".mp3"):
-        try:
-            input_path = os.path.join(FILES_DIR, file.filename)
-            output_path = os.path.join(FILES_DIR, f"normalized_{file.filename}")
-            
-            command = [
-                "ffmpeg", "-y",
-                "-i", input_path,
-                "-af", "loudnorm=I=-16:TP=-1.5:LRA=11",
-                "-b:a", "192k", "-ar", "44100",
-                output_path
-            ]
-            
-            print(f"Running normalization: {command}")
-            result = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            
-            os.remove(input_path)
-            os.rename(output_path, input_path)
-            
-        except subprocess.CalledProcessError as e:
-            print(f"MP3 Normalization failed: {e.stderr}")
-            raise ValueError(f"Audio processing failed: {e.stderr[:200]}...")
+    try:
+        status = await asyncio.to_thread(_start_ingest, filename, file_path, hasher.hexdigest())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return dict(status, sha256=hasher.hexdigest(), message=_upload_message(status))
+
+
+@app.get("/media/{media_id}/status")
+async def media_status(media_id: str):
+    """Processing state of an upload: "processing" (with normalization progress), "ready" or "failed"."""
+    item = ingest_jobs.get(media_id)
+    if item is not None:
+        return item.to_dict()
+    if os.path.isfile(os.path.join(FILES_DIR, os.path.basename(media_id))):
+        return {"id": media_id, "filename": media_id, "status": "ready", "progress": 1.0, "error": None, "jobs": {}}
+    raise HTTPException(status_code=404, detail="Media not found")
+
+
+def _existing_media_path(media_id: str):
+    media_path = os.path.join(FILES_DIR, os.path.basename(media_id))
+    if not os.path.isfile(media_path):
+        raise HTTPException(status_code=404, detail="Media not found")
+    return media_path
+
+
+def _filmstrip_sheet_url(media_id: str, key: str) -> Callable[[int], str]:
+    return lambda sheet: f"http://127.0.0.1:8001/media/{media_id}/filmstrip/{key}/{sheet}.jpg"
+
+
+async def _generate_filmstrip(media_path: str):
+    try:
+        return await asyncio.to_thread(filmstrips.generate_filmstrip, media_path)
+    except (ValueError, subprocess.CalledProcessError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/media/{media_id}/filmstrip")
+async def media_filmstrip(media_id: str):
+    """
+    Filmstrip of a video for the timeline, made on first request: sprite sheets of frames taken
+    every `interval` seconds. Tile k (time k * interval) is at column k % columns, row
+    (k // columns) % rows of sheet k // (columns * rows).
+    """
+    media_path = _existing_media_path(media_id)
+    strip = await _generate_filmstrip(media_path)
+    sheet_url = _filmstrip_sheet_url(os.path.basename(media_path), strip.key)
+    return {
+        "interval": strip.interval, "duration": strip.duration, "count": strip.count,
+        "columns": strip.columns, "rows": strip.rows, "tileWidth": strip.tile_width, "tileHeight": strip.tile_height,
+        "sheets": [sheet_url(i) for i in range(strip.sheets)],
+    }
+
+
+@app.get("/media/{media_id}/filmstrip.vtt")
+async def media_filmstrip_vtt(media_id: str):
+    """The filmstrip as a WebVTT thumbnail track (cue text: sheet URL with #xywh= region)."""
+    media_path = _existing_media_path(media_id)
+    strip = await _generate_filmstrip(media_path)
+    return Response(strip.webvtt(_filmstrip_sheet_url(os.path.basename(media_path), strip.key)), media_type="text/vtt")
+
+
+@app.get("/media/{media_id}/filmstrip/{key}/{sheet}.jpg")
+async def media_filmstrip_sheet(media_id: str, key: str, sheet: int):
+    """One sprite sheet. Its URL changes with the media, so it can be cached for good."""
+    path = filmstrips.sheet_path(_existing_media_path(media_id), os.path.basename(key), sheet)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Filmstrip sheet not found")
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+@app.get("/media/{media_id}/waveform")
+async def media_waveform(media_id: str):
+    """
+    Waveform peaks of a media file's audio, made on first request. `url` is one binary file holding
+    every level: a level is `count` int8 (min, max) pairs starting at byte `offset`, and peak k
+    covers [k, k + 1) / peaksPerSecond seconds, so a zoom level or a stretch of one is fetched
+    with a Range request (bytes offset + 2 * first to offset + 2 * last - 1).
+    """
+    media_path = _existing_media_path(media_id)
+    try:
+        waveform = await asyncio.to_thread(waveforms.generate_waveform, media_path)
+    except (ValueError, subprocess.CalledProcessError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "sampleRate": waveform.sample_rate, "duration": waveform.duration,
+        "url": f"http://127.0.0.1:8001/media/{os.path.basename(media_path)}/waveform/{waveform.key}.peaks",
+        "levels": [
+            {"samplesPerPeak": waveform.level_samples(level), "peaksPerSecond": waveform.sample_rate / waveform.level_samples(level),
+             "count": count, "offset": waveform.offset(level)}
+            for level, count in enumerate(waveform.counts)
+        ],
+    }
+
+
+@app.get("/media/{media_id}/waveform/{key}.peaks")
+async def media_waveform_peaks(media_id: str, key: str):
+    """The peak file (Range requests supported). Its URL changes with the media, so it can be cached for good."""
+    path = waveforms.peaks_path(_existing_media_path(media_id), os.path.basename(key))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Waveform not found")
+    return FileResponse(path, media_type="application/octet-stream",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+class UploadStartRequest(BaseModel):
+    filename: str
+    size: Optional[int] = None  # total bytes; lets the server check the upload is whole
+
+
+class UploadCompleteRequest(BaseModel):
+    sha256: Optional[str] = None  # checked against the hash computed while writing
 
-    # Trigger background transcription and snapshot generation
-    final_path = os.path.join(FILES_DIR, final_filename)
-    background_tasks.add_task(process_transcription, final_path)
-    background_tasks.add_task(generate_snapshot, final_filename)
 
-    return {"filename": final_filename, "message": "File uploaded successfully"}
+def _upload_error(e: Exception) -> HTTPException:
+    if isinstance(e, KeyError):
+        return HTTPException(status_code=404, detail="Upload not found")
+    if isinstance(e, OffsetMismatch):
+        return HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected})
+    return HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/uploads")
+async def start_upload(request: UploadStartRequest):
+    """Start a resumable upload. Send the bytes with PUT /uploads/{id}?offset=N, then POST /uploads/{id}/complete."""
+    filename = os.path.basename(request.filename or "")
+    try:
+        ext = _check_upload_filename(filename)
+        _ensure_files_dir()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    max_duration = _MAX_VIDEO_DURATION_SECONDS if ext in _ALLOWED_VIDEO_EXTENSIONS else None
+    session = await asyncio.to_thread(upload_manager.create, filename, request.size, max_duration)
+    return dict(session.model_dump(), chunk_size=UPLOAD_CHUNK_SIZE)
+
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Upload state; `received` is the offset to resume from."""
+    session = upload_manager.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session.model_dump()
+
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    """Append the request body at `offset`. 409 with the expected offset if it does not match."""
+    try:
+        session = await upload_manager.write_chunk(upload_id, offset, request.stream())
+    except (KeyError, OffsetMismatch, UploadRejected) as e:
+        raise _upload_error(e)
+    return session.model_dump()
+
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, request: Optional[UploadCompleteRequest] = None):
+    """Verify the upload and queue its processing like /upload."""
+    try:
+        session, part_path = await upload_manager.finish(upload_id, request.sha256 if request else None)
+    except (KeyError, OffsetMismatch, UploadRejected) as e:
+        raise _upload_error(e)
+    staged_path = _staging_path(session.filename)
+    os.replace(part_path, staged_path)
+    upload_manager.discard(upload_id)
+    try:
+        status = await asyncio.to_thread(_start_ingest, session.filename, staged_path, session.sha256)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return dict(status, sha256=session.sha256, message=_upload_message(status))
+
+
+@app.delete("/uploads/{upload_id}")
+async def cancel_upload(upload_id: str):
+    if upload_manager.get(upload_id) is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    upload_manager.discard(upload_id)
+    return {"message": "Upload cancelled"}
 
 class Query(BaseModel):
     prompt: str
@@ -656,32 +874,31 @@ async def user_query(query: Query) -> Tuple[bool, Union[int, str]]:
 
     query.prompt = query.prompt.replace("@", "")
     print(query)
-    num_files = 0
-    for name in os.listdir(FILES_DIR):
-        if os.path.isfile(os.path.join(FILES_DIR, name)) and name.startswith("version") and name[7:-4].isdigit():
-            num_files += 1
-    print(num_files)
+    # Reserved up front so concurrent queries never write the same version
+    version = allocate_version(FILES_DIR)
+    _query_version.set(version)
+    print(version)
 
-# For some queries, you'll need to work on the latest edit, so you've to work on the current file: ../files/edit/{query.video_version}. Save the new file as {num_files+1}
+# For some queries, you'll need to work on the latest edit, so you've to work on the current file: ../files/edit/{query.video_version}. Save the new file as {version}
 
     chat = client.aio.chats.create(
         model="gemini-2.5-flash-lite",
         config=types.GenerateContentConfig(
-            system_instruction=SYSTEM_PROMPT.format(num_files+1, num_files+1, num_files+1, query.video_version),
+            system_instruction=SYSTEM_PROMPT.format(version, version, version, query.video_version),
             tools=[ffmpeg_runner, scene_detect_runner, whisper_runner, audio_description, read_transcript, edit_video_intervals, analyze_transcript_in_chunks],
             temperature=0,
         ),
     )
 
-    prompt_suffix = f" - You are editing '{query.video_version}'. The new output file must be named 'version{num_files+1}.mp4'."
+    prompt_suffix = f" - You are editing '{query.video_version}'. The new output file must be named '{version_filename(version)}'."
     response = await chat.send_message(query.prompt + prompt_suffix)
     print(response)
 
     try:
         # Check if the expected output file was actually created
-        expected_output = f"version{num_files+1}.mp4"
+        expected_output = version_filename(version)
         if os.path.exists(os.path.join(FILES_DIR, expected_output)):
-            return True, num_files+1
+            return True, version
         else:
             # If the model returned a text response explaining why it couldn't do it, use that.
             error_msg = "The model could not process your request."
@@ -755,161 +972,165 @@ def _ensure_path_under_files_dir(filepath: str) -> str:
     return resolved
 
 
+def _export_response(output_filename: str, download_basename: str) -> FileResponse:
+    output_path = _ensure_path_under_files_dir(os.path.join(FILES_DIR, output_filename))
+    return FileResponse(
+        path=output_path,
+        media_type="video/mp4",
+        filename=download_basename,
+        headers={"Content-Disposition": f'attachment; filename="{download_basename}"'}
+    )
+
+
+async def _await_render(job: RenderJob) -> FileResponse:
+    """Wait (without blocking the event loop) for a render job and return its file."""
+    try:
+        await asyncio.wrap_future(job.future)
+    except asyncio.CancelledError:
+        # Client went away: stop the ffmpeg child, or mark a job that never started as cancelled
+        job.cancel()
+        raise
+    if job.status != DONE:
+        raise ValueError(job.error or f"Render {job.status}")
+    return _export_response(job.output_filename, job.download_name)
+
+
+def _submit_timeline_render(request: TimelineRequest) -> RenderJob:
+    from video_processor import _safe_export_basename
+    if not request.clips:
+        raise ValueError("No clips provided")
+    download_basename = _safe_export_basename()
+    return render_jobs.submit(
+        "timeline",
+        lambda job: render_timeline_clips(request.clips, output_filename=download_basename, job=job),
+        download_name=download_basename,
+    )
+
+
 @app.post("/render_timeline")
 async def render_timeline(request: TimelineRequest):
     print(f"Rendering timeline with clips: {request.clips}")
     try:
-        from video_processor import _safe_export_basename
-        download_basename = _safe_export_basename()
-        output_filename = render_timeline_clips(request.clips, output_filename=download_basename)
-        output_path = os.path.join(FILES_DIR, output_filename)
-        output_path = _ensure_path_under_files_dir(output_path)
-        return FileResponse(
-            path=output_path,
-            media_type="video/mp4",
-            filename=download_basename,
-            headers={"Content-Disposition": f'attachment; filename="{download_basename}"'}
-        )
+        job = _submit_timeline_render(request)
+        return await _await_render(job)
     except Exception as e:
         print(f"Timeline render failed: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
-class SplitTimelineRequest(BaseModel):
-    top_clips: list[ClipData]
-    bottom_clips: list[ClipData]
-    audio_clips: list[ClipData] = []
-    top_zoom: float = 1.0
-    top_pan_y: float = 0.0
-    bottom_zoom: float = 1.0
-    bottom_pan_y: float = 0.0
+
+def _submit_split_timeline_render(request: SplitTimelineRequest) -> RenderJob:
+    from video_processor import _safe_export_basename
+    if not request.top_clips and not request.bottom_clips:
+        raise ValueError("No clips provided for either timeline")
+    download_basename = _safe_export_basename()
+    return render_jobs.submit(
+        "split_timeline",
+        lambda job: render_split_timeline_clips(request, download_basename, job=job),
+        download_name=download_basename,
+    )
+
 
 @app.post("/render_split_timeline")
 async def render_split_timeline(request: SplitTimelineRequest):
     print(f"Rendering split timeline.")
     try:
-        if not request.top_clips and not request.bottom_clips:
-            raise ValueError("No clips provided for either timeline")
-        from video_processor import _safe_export_basename
-        download_basename = _safe_export_basename()
-        output_filename = download_basename
-        output_path = os.path.join(FILES_DIR, output_filename)
-        num_files = len([n for n in os.listdir(FILES_DIR) if n.startswith("version") and n.endswith(".mp4")])
-
-        temp_top = os.path.join(FILES_DIR, f"temp_top_{num_files+1}.mp4")
-        temp_bottom = os.path.join(FILES_DIR, f"temp_bottom_{num_files+1}.mp4")
-
-        def process_track(clips, output_temp):
-            """Render one track (top or bottom) to a temp file."""
-            if not clips:
-                subprocess.run(
-                    [
-                        "ffmpeg", "-y",
-                        "-f", "lavfi", "-i", "color=c=black:s=1920x1080:d=5",
-                        "-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo",
-                        "-shortest", output_temp
-                    ],
-                    check=True,
-                )
-                return
-            inputs = []
-            filter_parts = []
-            for i, clip in enumerate(clips):
-                filename = clip.filename
-                if filename.startswith("version") and not filename.endswith(".mp4"):
-                    filename += ".mp4"
-                inputs.extend(["-i", os.path.join(FILES_DIR, filename)])
-                filter_parts.append(
-                    f"[{i}:v]trim=start={clip.start}:end={clip.end},setpts=PTS-STARTPTS,"
-                    f"scale=1080:960:force_original_aspect_ratio=increase,crop=1080:960,setsar=1[v{i}];"
-                )
-                filter_parts.append(
-                    f"[{i}:a]atrim=start={clip.start}:end={clip.end},asetpts=PTS-STARTPTS[a{i}];"
-                )
-            concat_inputs = "".join([f"[v{i}][a{i}]" for i in range(len(clips))])
-            final_filter = "".join(filter_parts) + f"{concat_inputs}concat=n={len(clips)}:v=1:a=1[v][a]"
-            cmd = ["ffmpeg", "-y"] + inputs + ["-filter_complex", final_filter, "-map", "[v]", "-map", "[a]", output_temp]
-            subprocess.run(cmd, check=True)
-
-        process_track(request.top_clips, temp_top)
-        process_track(request.bottom_clips, temp_bottom)
-
-        temp_audio = None
-        if request.audio_clips:
-            temp_audio = os.path.join(FILES_DIR, f"temp_audio_{num_files+1}.mp3")
-            inputs = []
-            filter_parts = []
-            for i, clip in enumerate(request.audio_clips):
-                filename = clip.filename
-                inputs.extend(["-i", os.path.join(FILES_DIR, filename)])
-                filter_parts.append(f"[{i}:a]atrim=start={clip.start}:end={clip.end},asetpts=PTS-STARTPTS[a{i}];")
-            concat_inputs = "".join([f"[a{i}]" for i in range(len(request.audio_clips))])
-            final_filter = "".join(filter_parts) + f"{concat_inputs}concat=n={len(request.audio_clips)}:v=0:a=1[outa]"
-            cmd = ["ffmpeg", "-y"] + inputs + ["-filter_complex", final_filter, "-map", "[outa]", temp_audio]
-            subprocess.run(cmd, check=True)
-
-        dur_top = sum([c.end - c.start for c in request.top_clips])
-        dur_bottom = sum([c.end - c.start for c in request.bottom_clips])
-        if not request.top_clips:
-            dur_top = 5
-        if not request.bottom_clips:
-            dur_bottom = 5
-        max_dur = max(dur_top, dur_bottom)
-        inputs = []
-        if dur_top < max_dur:
-            inputs.extend(["-stream_loop", "-1", "-i", temp_top])
-        else:
-            inputs.extend(["-i", temp_top])
-        if dur_bottom < max_dur:
-            inputs.extend(["-stream_loop", "-1", "-i", temp_bottom])
-        else:
-            inputs.extend(["-i", temp_bottom])
-
-        def get_filter(idx, zoom, pan_y, label):
-            offset = f"(960*({pan_y}/100))"
-            chain = f"[{idx}:v]scale=1080:960:force_original_aspect_ratio=increase,crop=1080:960,setsar=1,scale=iw*{zoom}:-1[z{label}];"
-            if zoom >= 1:
-                chain += f"[z{label}]crop=1080:960:(iw-1080)/2:(ih-960)/2-({offset})[{label}];"
-            else:
-                chain += f"[z{label}]pad=1080:960:(1080-iw)/2:(960-ih)/2+({offset}):black[{label}];"
-            return chain
-
-        top_filter = get_filter(0, request.top_zoom, request.top_pan_y, "topv")
-        bot_filter = get_filter(1, request.bottom_zoom, request.bottom_pan_y, "botv")
-        complex_filter = [top_filter, bot_filter, "[topv][botv]vstack=inputs=2[v];"]
-        if temp_audio:
-            inputs.extend(["-i", temp_audio])
-            complex_filter.append("[0:a][1:a][2:a]amix=inputs=3[a]")
-        else:
-            complex_filter.append("[0:a][1:a]amix=inputs=2[a]")
-        stack_cmd = ["ffmpeg", "-y"] + inputs + [
-            "-filter_complex", "".join(complex_filter),
-            "-map", "[v]", "-map", "[a]",
-            "-c:v", "libx264", "-crf", "23", "-preset", "fast",
-            "-c:a", "aac", "-b:a", "192k",
-            "-t", str(max_dur),
-            output_path
-        ]
-        print(f"Stacking: {stack_cmd}")
-        subprocess.run(stack_cmd, check=True)
-
-        if os.path.exists(temp_top):
-            os.remove(temp_top)
-        if os.path.exists(temp_bottom):
-            os.remove(temp_bottom)
-        if temp_audio and os.path.exists(temp_audio):
-            os.remove(temp_audio)
-
-        output_path = _ensure_path_under_files_dir(output_path)
-        return FileResponse(
-            path=output_path,
-            media_type="video/mp4",
-            filename=download_basename,
-            headers={"Content-Disposition": f'attachment; filename="{download_basename}"'}
-        )
+        job = _submit_split_timeline_render(request)
+        return await _await_render(job)
     except Exception as e:
         print(f"Split timeline render failed: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+# --- RENDER JOBS (submit, poll / stream progress, cancel, download) ---
+
+def _get_render_job(job_id: str) -> RenderJob:
+    # Ingest jobs (normalize, transcription, thumbnail) share the job endpoints
+    job = render_jobs.get(job_id) or ingest_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Render job not found")
+    return job
+
+
+@app.post("/render_jobs/timeline")
+async def submit_timeline_job(request: TimelineRequest):
+    """Queue a timeline export and return its job id immediately."""
+    try:
+        job = _submit_timeline_render(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
+
+
+@app.post("/render_jobs/split_timeline")
+async def submit_split_timeline_job(request: SplitTimelineRequest):
+    """Queue a split-screen export and return its job id immediately."""
+    try:
+        job = _submit_split_timeline_render(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
+
+
+@app.get("/render_jobs/{job_id}")
+async def get_render_job(job_id: str):
+    return _get_render_job(job_id).to_dict()
+
+
+@app.get("/render_jobs/{job_id}/events")
+async def render_job_events(job_id: str):
+    """Server-sent events: one `data:` message with the job state on every change, until it finishes."""
+    job = _get_render_job(job_id)
+
+    async def event_stream():
+        last_version = -1
+        last_sent = 0.0
+        while True:
+            version = job.version
+            if version != last_version:
+                last_version = version
+                last_sent = time.monotonic()
+                yield f"data: {json.dumps(job.to_dict())}\n\n"
+                if job.finished:
+                    return
+            elif time.monotonic() - last_sent > 15:
+                # Comment line keeps proxies from closing an idle stream
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.delete("/render_jobs/{job_id}")
+async def cancel_render_job(job_id: str):
+    """Cancel a queued or running render (kills its ffmpeg process)."""
+    job = _get_render_job(job_id)
+    job.cancel()
+    return job.to_dict()
+
+
+@app.get("/render_jobs/{job_id}/download")
+async def download_render_job(job_id: str):
+    job = _get_render_job(job_id)
+    if job.status != DONE:
+        raise HTTPException(status_code=409, detail=f"Render job is {job.status}")
+    return _export_response(job.output_filename, job.download_name)
+
+
+@app.on_event("startup")
+async def _preload_whisper_models():
+    if WHISPER_PRELOAD:
+        # Load in the background so startup is not held up by model download/IO
+        asyncio.get_running_loop().run_in_executor(None, transcription_service.preload, WHISPER_PRELOAD.split(","))
+
+
+@app.on_event("shutdown")
+def _shutdown_workers():
+    render_jobs.shutdown()
+    ingest_jobs.shutdown()
+    proxies.shutdown()
+    thumbnails.shutdown()
+    transcription_service.shutdown()
+
 @app.delete("/delete/{filename}")
 async def delete_file(filename: str):
     """Delete a file from the filesystem."""
@@ -918,13 +1139,21 @@ async def delete_file(filename: str):
             filename += ".mp4"
             
         file_path = os.path.join(FILES_DIR, filename)
+        if ingest_jobs.cancel(filename) and not os.path.exists(file_path):
+            return {"message": f"Cancelled processing of {filename}"}
         if os.path.exists(file_path):
             os.remove(file_path)
+            media_probe.forget(file_path)
+            proxies.delete_proxy(file_path)
+            thumbnails.delete_thumbnail(file_path)
+            filmstrips.delete_filmstrip(file_path)
+            waveforms.delete_waveform(file_path)
             
-            # Also clean up any associated json transcript
-            json_path = os.path.splitext(file_path)[0] + ".json"
-            if os.path.exists(json_path):
-                os.remove(json_path)
+            # Also clean up the associated transcript (json, srt, txt)
+            transcript_store.delete(file_path)
+            # Stored uploads no other name links to any more
+            _media_store().collect_garbage()
+            _media_catalog().invalidate()
                 
             return {"message": f"Deleted {filename}"}
         else:
@@ -942,6 +1171,10 @@ class AutoGenRequest(BaseModel):
 @app.post("/auto_generate")
 async def auto_generate_endpoint(request: AutoGenRequest, background_tasks: BackgroundTasks):
     print(f"Received auto-generate request for {request.filename}")
+    # A fresh upload may still be normalizing
+    item = await ingest_jobs.wait_normalized(request.filename)
+    if item is not None and item.status == INGEST_FAILED:
+        return JSONResponse(status_code=422, content={"detail": f"Processing of {request.filename} failed: {item.normalize.error}"})
     try:
         result = await auto_generator.generate_viral_clips(request.filename)
         return result
@@ -0,0 +1,181 @@
+"""
+In-memory catalog of the media listed by /media. Entries are rebuilt only for files whose size or
+mtime changed, the directories are rescanned only when their mtime changes (or every
+MEDIA_CATALOG_RESCAN_SECONDS, for files rewritten in place), and every change gets a version
+number so clients can revalidate with an ETag or follow a feed of deltas.
+"""
+import base64
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import media_probe
+import proxies
+
+# Full rescan interval, for files rewritten in place (which leaves the directory's mtime alone)
+MEDIA_CATALOG_RESCAN_SECONDS = float(os.getenv("MEDIA_CATALOG_RESCAN_SECONDS", "30"))
+# Changes kept for the feed; a client further behind than this has to list again
+MEDIA_CATALOG_HISTORY = int(os.getenv("MEDIA_CATALOG_HISTORY", "1000"))
+
+_VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov")
+_AUDIO_EXTENSIONS = (".mp3", ".wav")
+_BASE_URL = "http://127.0.0.1:8001"
+
+
+def _media_entry(name: str, stat: os.stat_result, duration: Optional[float], has_thumb: bool, has_proxy: bool) -> dict:
+    media_type = "video" if name.lower().endswith(_VIDEO_EXTENSIONS) else "audio"
+    return {
+        "id": name,
+        "filename": name,
+        "url": f"{_BASE_URL}/files/{name}",
+        "type": media_type,
+        "uploadDate": stat.st_mtime,
+        "thumbnailUrl": f"{_BASE_URL}/files/{name}.jpg" if has_thumb else None,
+        "size": stat.st_size,
+        "durationSeconds": duration,
+        "isViralClip": name.startswith("version") and name.endswith(".mp4"),
+        "proxyUrl": f"{_BASE_URL}/proxies/{name}" if has_proxy else None,
+        "status": "ready",
+    }
+
+
+def _dir_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def encode_cursor(entry: dict) -> str:
+    return base64.urlsafe_b64encode(f"{entry['uploadDate']!r}/{entry['id']}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """(uploadDate, id) of the last entry of the previous page; raises ValueError if malformed."""
+    try:
+        date, _, media_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("/")
+        return float(date), media_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _sort_key(entry: dict) -> Tuple[float, str]:
+    return -entry["uploadDate"], entry["id"]
+
+
+class MediaCatalog:
+    """Media entries of one directory plus pending uploads, newest first, with a versioned change log."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # Distinguishes this process's versions from a previous one's (in ETags and the feed)
+        self.instance = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        # file name -> (size, mtime_ns, duration): probes are reused while the file is unchanged
+        self._probed: Dict[str, Tuple[int, int, Optional[float]]] = {}
+        self._files: Dict[str, dict] = {}
+        self._scanned: Tuple[Optional[int], Optional[int], float] = (None, None, 0.0)
+        self._changes: Deque[Tuple[int, str, Optional[dict]]] = deque(maxlen=MEDIA_CATALOG_HISTORY)
+
+    def invalidate(self) -> None:
+        """Rescan the files at the next sync (for writers that know they changed something)."""
+        with self._lock:
+            self._scanned = (None, None, 0.0)
+
+    def _scan(self) -> Dict[str, dict]:
+        """Entries of the media files in the directory; only new or modified files are probed."""
+        try:
+            listing = {entry.name: entry for entry in os.scandir(self.directory)}
+        except OSError:
+            return {}
+        try:
+            proxy_mtimes = {entry.name: entry.stat().st_mtime for entry in os.scandir(proxies.PROXY_DIR)}
+        except OSError:
+            proxy_mtimes = {}
+        files, probed = {}, {}
+        for name, entry in listing.items():
+            if name.startswith(".") or not name.lower().endswith(_VIDEO_EXTENSIONS + _AUDIO_EXTENSIONS):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            known = self._probed.get(name)
+            if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+                duration = known[2]
+            else:
+                duration = media_probe.get_duration_seconds(entry.path)
+            probed[name] = (stat.st_size, stat.st_mtime_ns, duration)
+            is_video = name.lower().endswith(_VIDEO_EXTENSIONS)
+            has_proxy = is_video and proxy_mtimes.get(name, -1) >= stat.st_mtime
+            files[name] = _media_entry(name, stat, duration, f"{name}.jpg" in listing, has_proxy)
+        self._probed = probed
+        return files
+
+    def sync(self, pending: List[dict] = ()) -> List[dict]:
+        """
+        Bring the catalog up to date with the directory and the given pending uploads (entries
+        shown instead of a file of the same id). Returns the entries added or changed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            stamp = (_dir_mtime(self.directory), _dir_mtime(proxies.PROXY_DIR))
+            if stamp != self._scanned[:2] or now - self._scanned[2] > MEDIA_CATALOG_RESCAN_SECONDS:
+                self._files = self._scan()
+                self._scanned = stamp + (now,)
+            entries = dict(self._files)
+            entries.update((item["id"], item) for item in pending)
+
+            changed = [entry for media_id, entry in entries.items() if self._entries.get(media_id) != entry]
+            removed = [media_id for media_id in self._entries if media_id not in entries]
+            if changed or removed:
+                self.version += 1
+                self._changes.extend((self.version, entry["id"], entry) for entry in changed)
+                self._changes.extend((self.version, media_id, None) for media_id in removed)
+                self._entries = entries
+            return changed
+
+    def items(self, types: Optional[List[str]] = None, cursor: Optional[str] = None,
+              limit: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Entries newest first, optionally of the given types, starting after `cursor`, at most
+        `limit` of them. Returns (entries, cursor of the next page or None).
+        """
+        with self._lock:
+            entries = sorted(self._entries.values(), key=_sort_key)
+        if types:
+            entries = [e for e in entries if e["type"] in types]
+        if cursor:
+            date, media_id = decode_cursor(cursor)
+            after = (-date, media_id)
+            entries = [e for e in entries if _sort_key(e) > after]
+        if limit is None or len(entries) <= limit:
+            return entries, None
+        return entries[:limit], encode_cursor(entries[limit - 1])
+
+    def changes_since(self, version: int) -> Optional[List[Tuple[int, str, Optional[dict]]]]:
+        """(version, id, entry or None if removed) after `version`; None if they are no longer all kept."""
+        with self._lock:
+            if version > self.version:
+                return None
+            if version < self.version and (not self._changes or self._changes[0][0] > version + 1):
+                return None
+            return [change for change in self._changes if change[0] > version]
+
+
+_catalogs: Dict[str, MediaCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(directory: str) -> MediaCatalog:
+    """The catalog of a directory (one instance per directory)."""
+    directory = os.path.abspath(directory)
+    with _catalogs_lock:
+        return _catalogs.setdefault(directory, MediaCatalog(directory))
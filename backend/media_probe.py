@@ -0,0 +1,248 @@
+"""Media metadata (duration, streams, codecs, resolution, fps) from one ffprobe per file, cached on disk."""
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+# SQLite index of probe results, keyed by absolute path and validated by size + mtime
+INDEX_PATH = os.getenv("MEDIA_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media_index.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS digests (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+)
+"""
+
+_local = threading.local()
+
+
+class StreamInfo(BaseModel):
+    index: int
+    codec_type: str
+    codec_name: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    cfr: Optional[bool] = None  # average and nominal frame rates agree
+    pix_fmt: Optional[str] = None
+    sample_aspect_ratio: Optional[str] = None
+    rotation: int = 0  # display rotation in degrees (phone footage)
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+
+
+class MediaInfo(BaseModel):
+    """Probe result for one media file."""
+    duration: Optional[float] = None
+    format_name: Optional[str] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    has_audio: bool = False
+    has_video: bool = False
+    streams: List[StreamInfo] = []
+
+    @property
+    def display_size(self) -> Optional[Tuple[int, int]]:
+        """Frame size as shown (width and height swapped for 90/270 rotation metadata), if known."""
+        if not self.width or not self.height:
+            return None
+        video = next((st for st in self.streams if st.codec_type == "video"), None)
+        if video is not None and video.rotation in (90, 270, -90, -270):
+            return self.height, self.width
+        return self.width, self.height
+
+
+def _connection() -> sqlite3.Connection:
+    """One connection per thread (and per index path, so tests can point INDEX_PATH elsewhere)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != INDEX_PATH:
+        conn = sqlite3.connect(INDEX_PATH, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+        _local.path = INDEX_PATH
+    return conn
+
+
+def _parse_rate(rate: Optional[str]) -> Optional[float]:
+    """Parse an ffprobe rational like '30000/1001' into frames per second."""
+    if not rate:
+        return None
+    num, _, den = rate.partition("/")
+    try:
+        num_f, den_f = float(num), float(den or 1)
+    except ValueError:
+        return None
+    if num_f <= 0 or den_f <= 0:
+        return None
+    return round(num_f / den_f, 3)
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rotation(stream: dict) -> int:
+    """Display rotation from the display matrix side data or the legacy `rotate` tag."""
+    for side_data in stream.get("side_data_list") or []:
+        if "rotation" in side_data:
+            try:
+                return int(float(side_data["rotation"])) % 360
+            except (TypeError, ValueError):
+                pass
+    try:
+        return int((stream.get("tags") or {}).get("rotate", 0)) % 360
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_ffprobe_output(data: dict) -> MediaInfo:
+    """Build MediaInfo from `ffprobe -show_format -show_streams -of json` output."""
+    fmt = data.get("format") or {}
+    info = MediaInfo(duration=_to_float(fmt.get("duration")), format_name=fmt.get("format_name"))
+    streams = []
+    for s in data.get("streams") or []:
+        codec_type = s.get("codec_type") or ""
+        stream = StreamInfo(index=s.get("index", len(streams)), codec_type=codec_type, codec_name=s.get("codec_name"))
+        if codec_type == "video":
+            stream.width = s.get("width")
+            stream.height = s.get("height")
+            avg_rate, nominal_rate = _parse_rate(s.get("avg_frame_rate")), _parse_rate(s.get("r_frame_rate"))
+            stream.fps = avg_rate or nominal_rate
+            if avg_rate and nominal_rate:
+                stream.cfr = abs(avg_rate - nominal_rate) < 0.01
+            stream.pix_fmt = s.get("pix_fmt")
+            stream.sample_aspect_ratio = s.get("sample_aspect_ratio")
+            stream.rotation = _rotation(s)
+            # Cover art in MP3/M4A shows up as a one-frame video stream
+            if not (s.get("disposition") or {}).get("attached_pic") and not info.has_video:
+                info.has_video = True
+                info.video_codec = stream.codec_name
+                info.width, info.height, info.fps = stream.width, stream.height, stream.fps
+        elif codec_type == "audio":
+            stream.sample_rate = int(s["sample_rate"]) if str(s.get("sample_rate", "")).isdigit() else None
+            stream.channels = s.get("channels")
+            if not info.has_audio:
+                info.has_audio = True
+                info.audio_codec = stream.codec_name
+        streams.append(stream)
+    info.streams = streams
+    if info.duration is None:
+        durations = [_to_float(s.get("duration")) for s in data.get("streams") or []]
+        durations = [d for d in durations if d is not None]
+        info.duration = max(durations) if durations else None
+    return info
+
+
+def _run_ffprobe(filepath: str) -> Optional[MediaInfo]:
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", filepath],
+            capture_output=True, text=True, timeout=15
+        )
+        if out.returncode != 0 or not out.stdout:
+            return None
+        return parse_ffprobe_output(json.loads(out.stdout))
+    except (subprocess.TimeoutExpired, ValueError, OSError):
+        return None
+
+
+def probe_media(filepath: str) -> Optional[MediaInfo]:
+    """
+    Return metadata for a media file, or None if it cannot be probed.
+    Served from the on-disk index when the file's size and mtime match; otherwise ffprobe runs once
+    and the result is stored.
+    """
+    path = os.path.abspath(filepath)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    conn = _connection()
+    row = conn.execute("SELECT size, mtime_ns, info FROM media WHERE path = ?", (path,)).fetchone()
+    if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+        try:
+            return MediaInfo.model_validate_json(row[2])
+        except ValueError:
+            pass
+    info = _run_ffprobe(path)
+    if info is None:
+        return None
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO media (path, size, mtime_ns, info) VALUES (?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, info.model_dump_json()),
+        )
+    return info
+
+
+def probe_partial(filepath: str) -> Optional[MediaInfo]:
+    """Probe a file that may still be growing (e.g. an upload in progress). Never cached."""
+    return _run_ffprobe(os.path.abspath(filepath))
+
+
+def get_duration_seconds(filepath: str) -> Optional[float]:
+    """Return duration in seconds, or None on failure."""
+    info = probe_media(filepath)
+    return info.duration if info is not None else None
+
+
+def has_audio_stream(filepath: str) -> bool:
+    """Return True if the file has at least one audio stream."""
+    info = probe_media(filepath)
+    return info is not None and info.has_audio
+
+
+def content_digest(filepath: str) -> Optional[str]:
+    """SHA-256 of a file's content, computed once per size + mtime and stored in the index."""
+    path = os.path.abspath(filepath)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    conn = _connection()
+    row = conn.execute("SELECT size, mtime_ns, sha256 FROM digests WHERE path = ?", (path,)).fetchone()
+    if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+        return row[2]
+    hasher = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(4 * 1024 * 1024), b""):
+                hasher.update(block)
+    except OSError:
+        return None
+    digest = hasher.hexdigest()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO digests (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, digest),
+        )
+    return digest
+
+
+def forget(filepath: str) -> None:
+    """Drop a file's entries from the index (e.g. after it was deleted)."""
+    conn = _connection()
+    with conn:
+        conn.execute("DELETE FROM media WHERE path = ?", (os.path.abspath(filepath),))
+        conn.execute("DELETE FROM digests WHERE path = ?", (os.path.abspath(filepath),))
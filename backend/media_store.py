@@ -0,0 +1,167 @@
+"""
+Content-addressed store of ingested media. Each upload is keyed by the sha256 of its bytes; the
+store keeps the normalized file and the files derived from it (transcript, thumbnail, proxy)
+under that key, and the names users see in FILES_DIR are hard links to them. A re-upload of the
+same bytes is linked to the stored files instead of being normalized, transcribed and thumbnailed
+again. Stored files are read-only: a name is never written in place, but replaced (a rename, or
+unlinked and written anew), which leaves the store and the other names as they were.
+"""
+import logging
+import os
+import shutil
+import stat
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import proxies
+from transcripts import transcript_paths
+
+
+def derived_files(media_path: str) -> List[Tuple[str, str]]:
+    """(role, path) of each file made from a media file during ingest."""
+    json_path, srt_path, txt_path = transcript_paths(media_path)
+    return [
+        ("transcript.json", json_path), ("transcript.srt", srt_path), ("transcript.txt", txt_path),
+        ("thumbnail.jpg", media_path + ".jpg"),
+        ("proxy" + os.path.splitext(media_path)[1], proxies.proxy_path(media_path)),
+    ]
+
+
+# ioctl request cloning a whole file (Linux: Btrfs, XFS and others)
+_FICLONE = 0x40049409
+
+
+def _link(source: str, target: str) -> None:
+    """
+    Hard link source at target, replacing it. Where links are not supported, target gets a copy
+    (a copy-on-write clone where the filesystem supports that).
+    """
+    tmp = f"{target}.{threading.get_ident()}.link"
+    try:
+        try:
+            os.link(source, tmp)
+        except OSError:
+            with open(source, "rb") as src, open(tmp, "wb") as dst:
+                try:
+                    import fcntl
+                    fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+                except (ImportError, OSError):
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            shutil.copystat(source, tmp)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _freeze(path: str) -> None:
+    """Make a stored file (and so every name linked to it) read-only."""
+    os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) & ~0o222)
+
+
+class MediaStore:
+    """Objects live in one directory as <digest><ext> (the media) and <digest>.<role> (derived files)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # digest + ext -> media id of the ingest producing it, until it is added
+        self._pending: Dict[str, str] = {}
+
+    def holds(self, media_path: str, digest: str) -> bool:
+        """True if media_path is linked to the stored media for digest."""
+        try:
+            return os.path.samefile(media_path, self.path(digest, os.path.splitext(media_path)[1]))
+        except OSError:
+            return False
+
+    def path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.directory, digest + ext)
+
+    def lookup(self, digest: str, ext: str) -> Optional[str]:
+        """Path of the stored media for this upload digest, or None."""
+        path = self.path(digest, ext)
+        return path if os.path.isfile(path) else None
+
+    def claim(self, digest: str, ext: str, media_id: str) -> Optional[str]:
+        """
+        Record that media_id is being ingested from this digest. Returns None, or the id of the
+        ingest that claimed it first (the caller should resolve to that one).
+        """
+        with self._lock:
+            first = self._pending.setdefault(digest + ext, media_id)
+        return None if first == media_id else first
+
+    def release(self, digest: str, ext: str) -> None:
+        with self._lock:
+            self._pending.pop(digest + ext, None)
+
+    def add(self, digest: str, media_path: str) -> None:
+        """Store an ingested media file and whichever of its derived files exist, then release its claim."""
+        ext = os.path.splitext(media_path)[1]
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stored = [(media_path, self.path(digest, ext))]
+            stored += [(path, os.path.join(self.directory, f"{digest}.{role}"))
+                       for role, path in derived_files(media_path) if os.path.isfile(path)]
+            for path, object_path in stored:
+                _link(path, object_path)
+                _freeze(object_path)
+        except OSError as e:
+            logging.warning(f"Could not store {media_path}: {e}")
+        finally:
+            self.release(digest, ext)
+
+    def link(self, digest: str, media_path: str) -> List[str]:
+        """Make media_path (and its derived files) the stored media for digest. Returns the paths linked."""
+        stored = self.path(digest, os.path.splitext(media_path)[1])
+        linked = []
+        for role, path in [("", media_path)] + derived_files(media_path):
+            source = os.path.join(self.directory, f"{digest}.{role}") if role else stored
+            if os.path.isfile(source):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                _link(source, path)
+                linked.append(path)
+        return linked
+
+    def collect_garbage(self) -> int:
+        """
+        Delete objects no name links to any more (with their derived files), except those an
+        ingest is about to add. Returns the objects removed.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        with self._lock:
+            pending = set(self._pending)
+        removed = 0
+        names = os.listdir(self.directory)
+        for name in names:
+            digest, _, rest = name.partition(".")
+            if "." in rest or name in pending:
+                continue  # a derived file (<digest>.<role>.<ext>) or a temp file, or being added
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_nlink > 1:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            for other in names:
+                if other.startswith(digest + ".") and other != name:
+                    try:
+                        os.remove(os.path.join(self.directory, other))
+                    except OSError:
+                        pass
+        return removed
+
+
+_stores: Dict[str, MediaStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(directory: str) -> MediaStore:
+    """The store for a directory (one instance per directory, so claims are shared)."""
+    directory = os.path.abspath(directory)
+    with _stores_lock:
+        return _stores.setdefault(directory, MediaStore(directory))
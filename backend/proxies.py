@@ -0,0 +1,123 @@
+"""Low-resolution, short-GOP proxies of media files for playback and scrubbing in the editor. Exports read the masters."""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
+
+from render_jobs import RenderJob, run_ffmpeg
+from video_processor import FILES_DIR
+
+# Proxies live next to the masters in a hidden directory (not listed by /media), served at /proxies
+PROXY_DIR = os.getenv("PROXY_DIR", os.path.join(FILES_DIR, ".proxies"))
+# Proxy frame height (never upscaled)
+PROXY_HEIGHT = int(os.getenv("PROXY_HEIGHT", "360"))
+# Frames between keyframes; 1 makes an all-intra proxy (fastest seeking, larger files)
+PROXY_GOP = int(os.getenv("PROXY_GOP", "10"))
+# Concurrent proxy encodes for media that was not ingested with one (e.g. rendered versions)
+PROXY_WORKERS = int(os.getenv("PROXY_WORKERS", "1"))
+
+_in_flight: Dict[str, threading.Event] = {}
+# master path -> mtime of the version whose proxy failed, so it is not retried on every listing
+_failed: Dict[str, float] = {}
+_queued: Set[str] = set()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=PROXY_WORKERS, thread_name_prefix="proxy")
+
+
+def proxy_path(master_path: str) -> str:
+    return os.path.join(PROXY_DIR, os.path.basename(master_path))
+
+
+def has_proxy(master_path: str) -> bool:
+    """True if a proxy exists and is not older than its master."""
+    try:
+        return os.path.getmtime(proxy_path(master_path)) >= os.path.getmtime(master_path)
+    except OSError:
+        return False
+
+
+def proxy_command(master_path: str, output_path: str) -> list:
+    return [
+        "ffmpeg", "-y",
+        "-i", master_path,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", f"scale=-2:min(ih\\,{PROXY_HEIGHT})",
+        # Short closed GOPs without B-frames: every seek decodes at most PROXY_GOP frames
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-tune", "fastdecode",
+        "-g", str(PROXY_GOP), "-keyint_min", str(PROXY_GOP), "-sc_threshold", "0", "-bf", "0",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "96k",
+        "-movflags", "+faststart",
+        output_path,
+    ]
+
+
+def generate_proxy(master_path: str, job: Optional[RenderJob] = None) -> str:
+    """
+    Create the proxy of master_path unless a current one exists, and return its path. Concurrent
+    calls for the same file share one encode.
+    """
+    output_path = proxy_path(master_path)
+    with _lock:
+        event = _in_flight.get(output_path)
+        owner = event is None
+        if owner:
+            event = _in_flight[output_path] = threading.Event()
+    if not owner:
+        event.wait()
+        return output_path
+    try:
+        if not has_proxy(master_path):
+            os.makedirs(PROXY_DIR, exist_ok=True)
+            base, ext = os.path.splitext(output_path)
+            tmp_path = f"{base}.partial{ext}"
+            print(f"Generating proxy for {os.path.basename(master_path)}")
+            try:
+                run_ffmpeg(proxy_command(master_path, tmp_path), job=job)
+                os.replace(tmp_path, output_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return output_path
+    finally:
+        with _lock:
+            del _in_flight[output_path]
+        event.set()
+
+
+def request_proxy(master_path: str) -> None:
+    """Queue proxy generation in the background unless one is current, already being made or failed."""
+    try:
+        mtime = os.path.getmtime(master_path)
+    except OSError:
+        return
+    if has_proxy(master_path):
+        return
+    with _lock:
+        if master_path in _queued or proxy_path(master_path) in _in_flight or _failed.get(master_path) == mtime:
+            return
+        _queued.add(master_path)
+    _executor.submit(_generate_quietly, master_path, mtime)
+
+
+def _generate_quietly(master_path: str, mtime: float) -> None:
+    try:
+        generate_proxy(master_path)
+    except Exception as e:
+        print(f"Proxy generation failed for {master_path}: {e}")
+        with _lock:
+            _failed[master_path] = mtime
+    finally:
+        with _lock:
+            _queued.discard(master_path)
+
+
+def delete_proxy(master_path: str) -> None:
+    try:
+        os.remove(proxy_path(master_path))
+    except OSError:
+        pass
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
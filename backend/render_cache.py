@@ -0,0 +1,134 @@
+"""On-disk cache of rendered clip intermediates, keyed by everything that affects their pixels and samples."""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+# Set to 1 to cache per-clip intermediates, so re-exports render only new or edited clips (the
+# first export of a timeline is slower than one pass). Off, cached intermediates are still used
+# for a timeline whose clips are all cached
+RENDER_CACHE = os.getenv("RENDER_CACHE", "0") == "1"
+# Cache directory; empty means a hidden .render_cache directory in FILES_DIR
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "")
+# Least recently used intermediates are evicted once the cache grows past this size
+RENDER_CACHE_MAX_BYTES = int(float(os.getenv("RENDER_CACHE_MAX_GB", "5")) * 1024 ** 3)
+
+_EXT = ".mkv"
+# Leftovers of renders that died mid-write are removed after this long
+_PARTIAL_TTL_SECONDS = 24 * 3600
+
+
+def cache_key(**parts) -> str:
+    """Stable hash of the given JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    Directory of intermediates named by cache key. Hits refresh the file's mtime, which is the LRU
+    order for eviction; keys pinned by a running export are never evicted under it.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = RENDER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._pinned: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _EXT)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Path of the cached intermediate for key (marking it recently used), or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def store(self, key: str, produce: Callable[[str], None]) -> str:
+        """Call produce(tmp_path) to write the intermediate, then move it into place atomically."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f"{key}.{uuid.uuid4().hex[:8]}.partial{_EXT}")
+        try:
+            produce(tmp_path)
+            os.replace(tmp_path, self.path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self.path(key)
+
+    @contextmanager
+    def pin(self, keys: Iterable[str]):
+        """Keep keys out of eviction for the duration of the block."""
+        keys = list(keys)
+        with self._lock:
+            self._pinned.update(keys)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pinned.subtract(keys)
+                self._pinned += Counter()
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits max_bytes. Returns bytes freed."""
+        entries, total, now = [], 0, time.time()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if ".partial" in name:
+                if now - st.st_mtime > _PARTIAL_TTL_SECONDS:
+                    _remove(path)
+                continue
+            if name.endswith(_EXT):
+                entries.append((st.st_mtime, st.st_size, name[:-len(_EXT)], path))
+                total += st.st_size
+        freed = 0
+        with self._lock:
+            pinned = set(self._pinned)
+        for _, size, key, path in sorted(entries):
+            if total - freed <= self.max_bytes:
+                break
+            if key in pinned:
+                continue
+            if _remove(path):
+                freed += size
+        if freed:
+            print(f"Render cache: evicted {freed / 1024 ** 2:.1f} MiB")
+        return freed
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(directory: str) -> RenderCache:
+    """The shared RenderCache for a directory (one per directory, so pins are seen by every export)."""
+    directory = os.path.abspath(directory)
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = RenderCache(directory)
+        return _caches[directory]
@@ -0,0 +1,444 @@
+"""
+Render graph compiler: a render is described as tracks of clips with transform steps and audio
+mixes, then lowered to one ffmpeg filter graph. Every export builds its graph here, so input
+sharing and the removal of steps that do nothing happen in one place.
+"""
+import math
+import os
+import re
+from typing import List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+# Consecutive clips of a track reading one source at most this far apart share one seeked input
+SHARED_INPUT_GAP_SECONDS = float(os.getenv("SHARED_INPUT_GAP_SECONDS", "5"))
+# Most memory the decoded frames and samples of one pass of a looped track may take; longer passes
+# are repeated with one input per repeat instead (which holds nothing)
+LOOP_MAX_BYTES = int(os.getenv("LOOP_MAX_BYTES", str(512 * 1024 * 1024)))
+# Frame rate assumed for clips without an fps step when bounding the frames a looped track holds
+_LOOP_MAX_FPS = 120
+# Frame size assumed for clips whose output size is unknown (ingest conforms masters to 1920x1080)
+_LOOP_FRAME_SIZE = (1920, 1080)
+# Most frames the loop filter can repeat
+_LOOP_MAX_FRAMES = 32767
+# Most audio samples per second assumed when bounding the samples aloop holds
+_LOOP_MAX_SAMPLE_RATE = 192000
+# Bytes per held audio sample: stereo, 32-bit float
+_LOOP_SAMPLE_BYTES = 8
+
+Size = Tuple[int, int]
+
+
+# --- Video steps. size() gives the output size from the input size (None when unknown). ---
+
+class Scale(BaseModel):
+    """scale=w:h; w/h are pixels or an expression of iw/ih (iw*k, ih*k, -1). fit: increase/decrease."""
+    w: Union[int, str]
+    h: Union[int, str]
+    fit: Optional[str] = None
+
+    def size(self, size: Optional[Size]) -> Optional[Size]:
+        if size is None:
+            return (self.w, self.h) if isinstance(self.w, int) and isinstance(self.h, int) and not self.fit else None
+        return _scaled_size(self, size)
+
+    def text(self) -> str:
+        return f"scale={self.w}:{self.h}" + (f":force_original_aspect_ratio={self.fit}" if self.fit else "")
+
+
+class Crop(BaseModel):
+    w: int
+    h: int
+    x: Optional[str] = None  # default: centered
+    y: Optional[str] = None
+
+    def size(self, size: Optional[Size]) -> Optional[Size]:
+        return (self.w, self.h)
+
+    def text(self) -> str:
+        if self.x is None and self.y is None:
+            return f"crop={self.w}:{self.h}"
+        return f"crop={self.w}:{self.h}:{self.x if self.x is not None else '(iw-ow)/2'}:{self.y if self.y is not None else '(ih-oh)/2'}"
+
+
+class Pad(BaseModel):
+    w: int
+    h: int
+    x: str = "(ow-iw)/2"
+    y: str = "(oh-ih)/2"
+    color: str = "black"
+
+    def size(self, size: Optional[Size]) -> Optional[Size]:
+        return (self.w, self.h)
+
+    def text(self) -> str:
+        return f"pad={self.w}:{self.h}:{self.x}:{self.y}:{self.color}"
+
+
+class Rotate(BaseModel):
+    """Rotate by radians inside the same frame size."""
+    angle: float
+    fill: str = "black"
+
+    def size(self, size: Optional[Size]) -> Optional[Size]:
+        return size
+
+    def text(self) -> str:
+        return f"rotate={self.angle}:c={self.fill}"
+
+
+class SetSar(BaseModel):
+    def size(self, size: Optional[Size]) -> Optional[Size]:
+        return size
+
+    def text(self) -> str:
+        return "setsar=1"
+
+
+class Fps(BaseModel):
+    rate: float
+
+    def size(self, size: Optional[Size]) -> Optional[Size]:
+        return size
+
+    def text(self) -> str:
+        return f"fps={self.rate:g}"
+
+
+class Filter(BaseModel):
+    """Any other filter, kept as written. It must not change the frame size."""
+    expr: str
+
+    def size(self, size: Optional[Size]) -> Optional[Size]:
+        return size
+
+    def text(self) -> str:
+        return self.expr
+
+
+Step = Union[Scale, Crop, Pad, Rotate, SetSar, Fps, Filter]
+
+
+def _rescale(a: int, b: int, c: int) -> int:
+    """a * b / c rounded to nearest (ffmpeg's av_rescale for positive values)."""
+    return (a * b + c // 2) // c
+
+
+def _eval_dim(expr: Union[int, str], size: Size) -> Optional[float]:
+    if isinstance(expr, int):
+        return float(expr)
+    expr = expr.replace(" ", "")
+    if expr in ("-1", "iw", "ih"):
+        return {"-1": -1.0, "iw": float(size[0]), "ih": float(size[1])}[expr]
+    match = re.fullmatch(r"(iw|ih)\*([0-9.]+)", expr)
+    if match is None:
+        return None
+    return (size[0] if match.group(1) == "iw" else size[1]) * float(match.group(2))
+
+
+def _scaled_size(scale: Scale, size: Size) -> Optional[Size]:
+    """Output size of scale for an input of size, computed the way ffmpeg's scale filter does."""
+    w, h = _eval_dim(scale.w, size), _eval_dim(scale.h, size)
+    if w is None or h is None:
+        return None
+    w, h = int(w), int(h)
+    if w == -1 and h == -1 or w == 0 or h == 0 or w < -1 or h < -1:
+        return None
+    if w == -1:
+        w = _rescale(h, size[0], size[1])
+    elif h == -1:
+        h = _rescale(w, size[1], size[0])
+    if scale.fit in ("increase", "decrease"):
+        fit_w, fit_h = _rescale(h, size[0], size[1]), _rescale(w, size[1], size[0])
+        pick = max if scale.fit == "increase" else min
+        w, h = pick(fit_w, w), pick(fit_h, h)
+    return w, h
+
+
+def optimize_steps(steps: List[Step], size: Optional[Size] = None) -> Tuple[List[Step], Optional[Size]]:
+    """
+    Drop steps that leave the frame as it is (scale/crop/pad to the current size, rotation by 0,
+    repeated setsar/fps) and merge consecutive scalers into one. Returns (steps, output size).
+    """
+    out: List[Tuple[Step, Optional[Size]]] = []  # (step, its input size)
+    for step in steps:
+        if isinstance(step, Scale) and out and isinstance(out[-1][0], Scale):
+            previous, before = out[-1]
+            final = step.size(previous.size(before))
+            if final is not None:
+                # Scaling the whole frame twice is scaling it once to the final size (and resampling once)
+                out.pop()
+                size, step = before, Scale(w=final[0], h=final[1])
+        if isinstance(step, Scale) and size is not None and step.size(size) == size:
+            continue
+        if isinstance(step, (Crop, Pad)) and size == (step.w, step.h):
+            continue
+        if isinstance(step, Rotate) and step.angle == 0:
+            continue
+        if isinstance(step, (SetSar, Fps)) and out and out[-1][0] == step:
+            continue
+        out.append((step, size))
+        size = step.size(size)
+    return [step for step, _ in out], size
+
+
+# --- Render description ---
+
+class Clip(BaseModel):
+    path: str
+    start: float = 0.0
+    end: float
+    video: List[Step] = []
+    # Audio filters applied after the clip is cut (e.g. aresample, apad)
+    audio: List[str] = []
+    has_audio: bool = True
+    # Source frame size, if known: lets the compiler drop scaling and cropping that do nothing
+    size: Optional[Size] = None
+    # Options before -i (e.g. -f lavfi)
+    input_options: List[str] = []
+    # Complete input arguments (ending in -i path); the input is then used as is, without seeking or trimming
+    input_args: Optional[List[str]] = None
+
+    @property
+    def duration(self) -> float:
+        return max(0.001, self.end - self.start)
+
+
+class Track(BaseModel):
+    clips: List[Clip]
+    # Steps applied to the joined track
+    video: List[Step] = []
+    # Repeat the clips from the first until the track is this long. A pass that fits in
+    # LOOP_MAX_BYTES is built once and held in memory (as decoded frames) by the loop filter, so each
+    # clip is read once whatever the repeats; a longer one gets one input per clip and repeat
+    loop_to: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return self.loop_to if self.loop_to is not None else sum(c.duration for c in self.clips)
+
+
+class Render(BaseModel):
+    # Video tracks with their audio; several tracks are stacked vertically, top first
+    tracks: List[Track]
+    # Audio-only tracks mixed with the tracks' audio
+    music: List[Track] = []
+    audio: bool = True
+
+
+class Graph(BaseModel):
+    inputs: List[str]
+    filters: List[str]
+    duration: float
+
+    @property
+    def filter_complex(self) -> str:
+        return ";".join(self.filters)
+
+    def command(self, output_path: str, output_args: List[str], options: List[str] = ()) -> List[str]:
+        """ffmpeg command rendering the graph: global options, inputs, graph, maps, then output_args."""
+        maps = ["-map", "[outv]"] + (["-map", "[outa]"] if any("[outa]" in f for f in self.filters) else [])
+        return (["ffmpeg", "-y"] + list(options) + self.inputs + ["-filter_complex", self.filter_complex]
+                + maps + output_args + [output_path])
+
+
+def seek_args(start: float, end: float) -> List[str]:
+    """Input options that start decoding at the keyframe before start and drop frames up to it (accurate seek)."""
+    args = ["-ss", f"{start:.6f}"] if start > 0 else []
+    return args + ["-t", f"{max(0.001, end - start):.6f}"]
+
+
+def looped_clips(clips: List[Clip], duration: float) -> List[Clip]:
+    """The clips in order, repeated from the first and cut so they last exactly duration."""
+    if sum(c.end - c.start for c in clips) <= 0:
+        raise ValueError("Track clips have no duration")
+    result, filled = [], 0.0
+    while duration - filled > 1e-6:
+        for clip in clips:
+            length = min(clip.end - clip.start, duration - filled)
+            if length <= 1e-6:
+                continue
+            result.append(clip.model_copy(update={"end": clip.start + length}))
+            filled += length
+    return result
+
+
+def _pass_frames(clips: List[Clip]) -> int:
+    """Upper bound on the frames in one pass of the clips (at each clip's last fps step, if any)."""
+    frames = 0
+    for clip in clips:
+        rate = next((step.rate for step in reversed(clip.video) if isinstance(step, Fps)), _LOOP_MAX_FPS)
+        frames += math.ceil(clip.duration * rate) + 1
+    return frames
+
+
+def _pass_bytes(clips: List[Clip]) -> int:
+    """Upper bound on the memory loop and aloop take to hold one pass of the clips (as yuv420p frames)."""
+    total = 0
+    for clip in clips:
+        width, height = optimize_steps(clip.video, clip.size)[1] or _LOOP_FRAME_SIZE
+        total += _pass_frames([clip]) * width * height * 3 // 2
+        total += math.ceil(clip.duration * _LOOP_MAX_SAMPLE_RATE) * _LOOP_SAMPLE_BYTES
+    return total
+
+
+def shared_inputs(clips: List[Clip]) -> List[Tuple[float, float, List[int]]]:
+    """
+    Group clips into (start, end, clip indices) inputs. Consecutive clips reading increasing,
+    nearby ranges of one source share an input that is decoded once and split; others get their
+    own, since splitting them would decode the gap or hold decoded frames in memory until the
+    timeline reaches them.
+    """
+    groups: List[Tuple[float, float, List[int]]] = []
+    for i, clip in enumerate(clips):
+        if groups and clip.input_args is None:
+            start, end, members = groups[-1]
+            previous = clips[members[-1]]
+            if (previous.input_args is None and previous.path == clip.path and previous.input_options == clip.input_options
+                    and end <= clip.start <= end + SHARED_INPUT_GAP_SECONDS):
+                groups[-1] = (start, clip.end, members + [i])
+                continue
+        groups.append((clip.start, clip.end, [i]))
+    return groups
+
+
+class _Compiler:
+    def __init__(self, audio: bool):
+        self.inputs: List[str] = []
+        self.filters: List[str] = []
+        self.audio = audio
+        self._labels = 0
+
+    def label(self, prefix: str) -> str:
+        self._labels += 1
+        return f"{prefix}{self._labels}"
+
+    def add_input(self, args: List[str]) -> int:
+        index = self.inputs.count("-i")
+        self.inputs.extend(args)
+        return index
+
+    def silence(self, duration: float) -> str:
+        return f"{self.add_input(['-f', 'lavfi', '-t', f'{duration:.6f}', '-i', 'anullsrc=r=44100:cl=stereo'])}:a"
+
+    def chain(self, source: str, filters: List[str], output: str, passthrough: str = "null") -> None:
+        self.filters.append(f"[{source}]{','.join(filters) or passthrough}[{output}]")
+
+    def looped(self, track: Track, video_out: Optional[str], audio_out: Optional[str]) -> bool:
+        """
+        Emit a looped track as one pass of its clips repeated by loop/aloop and cut to loop_to.
+        Returns False (nothing emitted) if it needs no repeat, or if one pass has more frames than
+        the loop filter can repeat or would take more than LOOP_MAX_BYTES to hold.
+        """
+        length = sum(c.duration for c in track.clips)
+        repeats = math.ceil(track.loop_to / length - 1e-6) - 1
+        frames = _pass_frames(track.clips)
+        if repeats < 1 or frames > _LOOP_MAX_FRAMES or _pass_bytes(track.clips) > LOOP_MAX_BYTES:
+            return False
+        video = self.label("p") if video_out is not None else None
+        audio = self.label("p") if audio_out is not None else None
+        size = self.track(Track(clips=track.clips), video, audio)
+        duration = f"{track.loop_to:.6f}"
+        if video is not None:
+            steps, _ = optimize_steps(track.video, size)
+            self.chain(video, [f"loop=loop={repeats}:size={frames}:start=0", f"trim=duration={duration}"]
+                       + [s.text() for s in steps], video_out)
+        if audio is not None:
+            samples = math.ceil(length * _LOOP_MAX_SAMPLE_RATE)
+            self.chain(audio, [f"aloop=loop={repeats}:size={samples}", f"atrim=duration={duration}"], audio_out)
+        return True
+
+    def track(self, track: Track, video_out: Optional[str], audio_out: Optional[str]) -> Optional[Size]:
+        """
+        Emit the filters of one track, ending in [video_out] / [audio_out] (None: skip that media).
+        Returns the size of [video_out], if known.
+        """
+        if track.loop_to is not None and self.looped(track, video_out, audio_out):
+            return None
+        clips = looped_clips(track.clips, track.loop_to) if track.loop_to is not None else track.clips
+        # Per clip: (video source label, trim filters, audio source label or None, audio trim filters)
+        cut = [None] * len(clips)
+        for start, end, members in shared_inputs(clips):
+            first = clips[members[0]]
+            if first.input_args is not None:
+                index = self.add_input(first.input_args)
+            else:
+                index = self.add_input(first.input_options + seek_args(start, end) + ["-i", first.path])
+            video_sources, audio_sources = [f"{index}:v"], [f"{index}:a"]
+            if len(members) > 1:
+                # One decode, split per clip; trims are relative to the input's seek point
+                video_sources = [self.label("s") for _ in members]
+                if video_out is not None:
+                    self.filters.append(f"[{index}:v]split={len(members)}" + "".join(f"[{s}]" for s in video_sources))
+                if audio_out is not None and first.has_audio:
+                    audio_sources = [self.label("s") for _ in members]
+                    self.filters.append(f"[{index}:a]asplit={len(members)}" + "".join(f"[{s}]" for s in audio_sources))
+            for n, i in enumerate(members):
+                clip = clips[i]
+                if first.input_args is not None:
+                    trim, atrim = [], []
+                elif len(members) > 1:
+                    ts, te = clip.start - start, clip.end - start
+                    trim = [f"trim=start={ts}:end={te}", "setpts=PTS-STARTPTS"]
+                    atrim = [f"atrim=start={ts}:end={te}", "asetpts=PTS-STARTPTS"]
+                else:
+                    trim, atrim = ["setpts=PTS-STARTPTS"], ["asetpts=PTS-STARTPTS"]
+                audio_source = audio_sources[n if len(audio_sources) > 1 else 0] if clip.has_audio else None
+                cut[i] = (video_sources[n if len(video_sources) > 1 else 0], trim, audio_source, atrim)
+
+        single = len(clips) == 1
+        sizes = []
+        segments = []
+        for clip, (video_source, trim, audio_source, atrim) in zip(clips, cut):
+            v = a = None
+            if video_out is not None:
+                # A lone clip takes the track's steps too, so they are optimized together
+                steps, size = optimize_steps(clip.video + (track.video if single else []), clip.size)
+                sizes.append(size)
+                v = video_out if single else self.label("v")
+                self.chain(video_source, trim + [s.text() for s in steps], v)
+            if audio_out is not None:
+                a = audio_out if single else self.label("a")
+                if audio_source is None:
+                    self.chain(self.silence(clip.duration), clip.audio, a, "anull")
+                else:
+                    self.chain(audio_source, atrim + clip.audio, a, "anull")
+            segments.append((v, a))
+        if single:
+            return sizes[0] if sizes else None
+        joined_video = self.label("j") if video_out is not None and track.video else video_out
+        outputs = "".join(f"[{label}]" for label in (joined_video, audio_out) if label is not None)
+        self.filters.append(
+            "".join(f"[{label}]" for v, a in segments for label in (v, a) if label is not None)
+            + f"concat=n={len(segments)}:v={int(video_out is not None)}:a={int(audio_out is not None)}{outputs}"
+        )
+        size = sizes[0] if len(set(sizes)) == 1 else None
+        if joined_video != video_out:
+            steps, size = optimize_steps(track.video, size)
+            self.chain(joined_video, [s.text() for s in steps], video_out)
+        return size
+
+
+def compile_render(render: Render) -> Graph:
+    """Lower a render to ffmpeg inputs and one filter graph with outputs [outv] and (with audio) [outa]."""
+    if not render.tracks or any(not t.clips for t in render.tracks + render.music):
+        raise ValueError("Every track needs at least one clip")
+    compiler = _Compiler(render.audio)
+    sources = len(render.tracks) + len(render.music) if render.audio else 0
+    mix = []
+    video = ["outv"] if len(render.tracks) == 1 else [compiler.label("t") for _ in render.tracks]
+    for track, video_out in zip(render.tracks, video):
+        audio_out = ("outa" if sources == 1 else compiler.label("m")) if render.audio else None
+        compiler.track(track, video_out, audio_out)
+        mix.append(audio_out)
+    if len(render.tracks) > 1:
+        compiler.filters.append("".join(f"[{v}]" for v in video) + f"vstack=inputs={len(video)}[outv]")
+    if render.audio:
+        for track in render.music:
+            audio_out = compiler.label("m")
+            compiler.track(track, None, audio_out)
+            mix.append(audio_out)
+        if sources > 1:
+            compiler.filters.append("".join(f"[{a}]" for a in mix) + f"amix=inputs={len(mix)}[outa]")
+    duration = max(t.duration for t in render.tracks)
+    return Graph(inputs=compiler.inputs, filters=compiler.filters, duration=duration)
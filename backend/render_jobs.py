@@ -0,0 +1,286 @@
+"""Background render jobs: a worker pool for ffmpeg exports with progress and cancellation."""
+import os
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# Number of concurrent ffmpeg renders. Each libx264 encode already uses several threads.
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(max(1, (os.cpu_count() or 2) // 4))))
+# Finished jobs are forgotten after this many seconds.
+_JOB_TTL_SECONDS = 3600
+
+
+class RenderCancelled(Exception):
+    """Raised inside a render when its job has been cancelled."""
+
+
+class RenderJob:
+    """State of one render. Updated by the worker thread, read by the API."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = 0.0  # 0.0 - 1.0
+        self.output_filename: Optional[str] = None
+        self.download_name: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+        self.depends_on: Optional[str] = None
+        self._process: Optional[subprocess.Popen] = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._version = 0
+        self._callbacks: List[Callable[["RenderJob"], None]] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED_STATES
+
+    @property
+    def version(self) -> int:
+        """Incremented on every state or progress change."""
+        return self._version
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "output_filename": self.output_filename,
+            "error": self.error,
+            "depends_on": self.depends_on,
+        }
+
+    def _update(self, **fields) -> None:
+        callbacks = []
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            if self.finished and self.finished_at is None:
+                self.finished_at = time.time()
+                callbacks, self._callbacks = self._callbacks, []
+            self._version += 1
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback: Callable[["RenderJob"], None]) -> None:
+        """Call `callback(job)` once the job has finished (immediately if it already has)."""
+        with self._lock:
+            if not self.finished:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_progress(self, progress: float) -> None:
+        progress = min(1.0, max(0.0, progress))
+        if progress > self.progress:
+            self._update(progress=progress)
+
+    def cancel(self) -> bool:
+        """Request cancellation. Kills the running ffmpeg child, if any. Returns False if already finished."""
+        if self.finished:
+            return False
+        self._cancelled.set()
+        # Also the ffmpeg of a job without a future (a sub-job of run_parallel)
+        process = self._process
+        if process is not None and process.poll() is None:
+            try:
+                process.kill()
+            except OSError:
+                pass
+        # No future: a dependent job still waiting for the job it runs after, or a sub-job
+        if self.future is None or self.future.cancel():
+            self._update(status=CANCELLED)
+        return True
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise RenderCancelled()
+
+
+def _parse_progress_line(line: str) -> Optional[float]:
+    """Return output time in seconds from one ffmpeg `-progress` line, or None."""
+    key, _, value = line.strip().partition("=")
+    # out_time_ms is (despite its name) in microseconds, same as out_time_us
+    if key in ("out_time_us", "out_time_ms"):
+        try:
+            return int(value) / 1_000_000
+        except ValueError:
+            return None
+    return None
+
+
+def run_ffmpeg(command: List[str], job: Optional[RenderJob] = None, duration: Optional[float] = None, weight: float = 1.0, offset: float = 0.0) -> None:
+    """
+    Run an ffmpeg command. Without a job this is a plain subprocess.run(check=True).
+    With a job, progress is read from `-progress pipe:1` and mapped into [offset, offset + weight]
+    of the job's progress (so a render made of several ffmpeg passes can report one bar), and
+    cancelling the job kills the process.
+    """
+    if job is None:
+        subprocess.run(command, check=True)
+        return
+    job.check_cancelled()
+    command = [command[0], "-progress", "pipe:1", "-nostats"] + command[1:]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    job._process = process
+    # A cancel between the check above and the assignment found no process to kill
+    if job.cancelled:
+        process.kill()
+    stderr_tail: deque = deque(maxlen=40)
+
+    def drain_stderr():
+        for line in process.stderr:
+            stderr_tail.append(line)
+
+    drain = threading.Thread(target=drain_stderr, daemon=True)
+    drain.start()
+    try:
+        for line in process.stdout:
+            seconds = _parse_progress_line(line)
+            if seconds is not None and duration:
+                job.set_progress(offset + weight * min(1.0, seconds / duration))
+        process.wait()
+    finally:
+        drain.join(timeout=5)
+        job._process = None
+    if job.cancelled:
+        raise RenderCancelled()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr="".join(stderr_tail))
+    job.set_progress(offset + weight)
+
+
+def run_parallel(tasks: List[Tuple[Callable[[RenderJob], None], float]], workers: int, job: Optional[RenderJob] = None,
+                 weight: float = 1.0, offset: float = 0.0, name: str = "parallel") -> None:
+    """
+    Run (fn, cost) tasks on up to `workers` threads; each fn gets its own sub-job to pass to
+    run_ffmpeg. The job's progress is the cost-weighted progress of all tasks, mapped into
+    [offset, offset + weight]. The first failure, or cancelling the job, kills the other ffmpeg processes.
+    """
+    subs = [RenderJob(name) for _ in tasks]
+    total = sum(cost for _, cost in tasks) or 1.0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name) as pool:
+        futures = [pool.submit(fn, sub) for (fn, _), sub in zip(tasks, subs)]
+        pending = set(futures)
+        try:
+            while pending:
+                _, pending = wait(pending, timeout=0.5, return_when=FIRST_EXCEPTION)
+                if job is not None:
+                    job.set_progress(offset + weight * sum(sub.progress * cost for sub, (_, cost) in zip(subs, tasks)) / total)
+                    job.check_cancelled()
+                for future in futures:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+        except BaseException:
+            for sub in subs:
+                sub.cancel()
+            raise
+    if job is not None:
+        job.set_progress(offset + weight)
+
+
+class RenderJobManager:
+    """Owns the worker pool and the table of known jobs."""
+
+    def __init__(self, max_workers: int = RENDER_WORKERS, name: str = "render"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._jobs: Dict[str, RenderJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[[RenderJob], str], download_name: Optional[str] = None, after: Optional[RenderJob] = None) -> RenderJob:
+        """
+        Queue `fn(job)` on the pool. `fn` performs the render and returns the output filename;
+        it should route its ffmpeg calls through run_ffmpeg(..., job=job).
+        With `after`, the job stays queued until that job (from any manager) is done, and fails
+        or is cancelled with it.
+        """
+        self._prune()
+        job = RenderJob(kind)
+        job.download_name = download_name
+        with self._lock:
+            self._jobs[job.id] = job
+        if after is None:
+            job.future = self._executor.submit(self._run, job, fn)
+        else:
+            job.depends_on = after.id
+            after.add_done_callback(lambda parent: self._release(job, fn, parent))
+        return job
+
+    def _release(self, job: RenderJob, fn: Callable[[RenderJob], str], parent: RenderJob) -> None:
+        """Start a dependent job once the job it waits for has finished."""
+        if job.finished:
+            return
+        if parent.status != DONE:
+            status = CANCELLED if parent.status == CANCELLED else FAILED
+            job._update(status=status, error=f"{parent.kind} job {parent.status}")
+            return
+        try:
+            job.future = self._executor.submit(self._run, job, fn)
+        except RuntimeError:
+            # Pool already shut down
+            job._update(status=CANCELLED)
+
+    def get(self, job_id: str) -> Optional[RenderJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: RenderJob, fn: Callable[[RenderJob], str]) -> Optional[str]:
+        if job.cancelled:
+            job._update(status=CANCELLED)
+            return None
+        job._update(status=RUNNING)
+        try:
+            output_filename = fn(job)
+        except RenderCancelled:
+            job._update(status=CANCELLED)
+            return None
+        except subprocess.CalledProcessError as e:
+            status = CANCELLED if job.cancelled else FAILED
+            detail = (e.stderr or "").strip().splitlines()
+            job._update(status=status, error=detail[-1] if detail else str(e))
+            return None
+        except Exception as e:
+            print(f"Render job {job.id} failed: {e}")
+            job._update(status=FAILED, error=str(e))
+            return None
+        job._update(status=DONE, progress=1.0, output_filename=output_filename)
+        return output_filename
+
+    def _prune(self) -> None:
+        cutoff = time.time() - _JOB_TTL_SECONDS
+        with self._lock:
+            stale = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in stale:
+                del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+render_jobs = RenderJobManager()
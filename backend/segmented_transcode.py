@@ -0,0 +1,175 @@
+"""Segmented transcoding: encode keyframe-aligned ranges of a long source concurrently, then join them losslessly."""
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import List, Optional, Tuple
+
+from render_jobs import RenderJob, run_ffmpeg, run_parallel
+
+# Sources at least this long (seconds) are transcoded in segments; set to 0 to disable
+SEGMENTED_TRANSCODE_MIN_SECONDS = float(os.getenv("SEGMENTED_TRANSCODE_MIN_SECONDS", "600"))
+# Target segment length; segments start on the first source keyframe after each multiple of this
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", "60"))
+# Concurrent segment encodes, and threads given to each (decoder and encoder)
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", str(max(1, (os.cpu_count() or 2) // 4))))
+SEGMENT_THREADS = int(os.getenv("SEGMENT_THREADS", str(max(1, (os.cpu_count() or 2) // SEGMENT_WORKERS))))
+
+
+class SegmentJoinError(Exception):
+    """The joined output does not line up with the plan (frame count or A/V duration); do not use it."""
+
+
+def keyframe_times(path: str) -> List[float]:
+    """Video keyframe times in seconds from the start of the file (packet headers only, no decoding)."""
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "format=start_time:packet=pts_time,flags", "-of", "csv", path],
+        capture_output=True, text=True, check=True, timeout=600,
+    ).stdout
+    start, times = 0.0, []
+    for line in out.splitlines():
+        fields = line.split(",")
+        if fields[0] == "format" and len(fields) > 1:
+            try:
+                start = float(fields[1])
+            except ValueError:
+                pass
+        elif fields[0] == "packet" and len(fields) > 2 and "K" in fields[2]:
+            try:
+                times.append(float(fields[1]))
+            except ValueError:
+                pass
+    return sorted(t - start for t in times)
+
+
+def plan_segments(keyframes: List[float], duration: float, fps: float, target: float) -> List[Tuple[float, int, Optional[int]]]:
+    """
+    Split the output into (source keyframe, first frame, frame count) segments on the output frame
+    grid; the last count is None (encode to the end). Each segment starts at the first output frame
+    at or after a source keyframe, so its decode begins on that keyframe and nothing is decoded twice.
+    """
+    starts = [(0.0, 0)]
+    for keyframe in keyframes:
+        frame = math.ceil(keyframe * fps - 1e-6)
+        if keyframe >= len(starts) * target and frame > starts[-1][1] and keyframe < duration - target / 4:
+            starts.append((keyframe, frame))
+    ends = [frame for _, frame in starts[1:]] + [None]
+    return [(keyframe, start, (end - start) if end is not None else None) for (keyframe, start), end in zip(starts, ends)]
+
+
+def _segment_command(source: str, output: str, keyframe: float, start: int, count: Optional[int], fps: float,
+                     video_args: List[str]) -> List[str]:
+    command = ["ffmpeg", "-y", "-threads", str(SEGMENT_THREADS)]
+    if start:
+        # Decode from the keyframe without dropping anything, then shift so the segment's first grid
+        # time is 0: the frame-rate conversion then sees the same frames around the join as a
+        # single pass would, instead of starting from the first frame after it
+        command += ["-noaccurate_seek", "-ss", f"{keyframe:.6f}"]
+        video_args = _prefix_filter(video_args, f"setpts=PTS-{start / fps - keyframe:.6f}/TB")
+    command += ["-i", source, "-map", "0:v:0", "-an", "-sn", "-dn"] + video_args
+    command += ["-r", f"{fps:g}", "-threads", str(SEGMENT_THREADS)]
+    if count is not None:
+        command += ["-frames:v", str(count)]
+    return command + [output]
+
+
+def _prefix_filter(args: List[str], filter_: str) -> List[str]:
+    """Put filter_ in front of the -vf chain in args (adding -vf if there is none)."""
+    args = list(args)
+    if "-vf" in args:
+        i = args.index("-vf") + 1
+        args[i] = f"{filter_},{args[i]}"
+        return args
+    return ["-vf", filter_] + args
+
+
+def _frame_count(path: str) -> Tuple[int, float]:
+    """(video packets, video duration) of a file."""
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+         "-show_entries", "stream=nb_read_packets,duration", "-of", "default=nw=1", path],
+        capture_output=True, text=True, check=True, timeout=600,
+    ).stdout
+    fields = dict(line.partition("=")[::2] for line in out.splitlines())
+    try:
+        duration = float(fields.get("duration", ""))
+    except ValueError:
+        duration = 0.0
+    return int(fields.get("nb_read_packets") or 0), duration
+
+
+def _stream_duration(path: str, stream: str) -> Optional[float]:
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", stream, "-show_entries", "stream=duration", "-of", "csv=p=0", path],
+        capture_output=True, text=True, timeout=60,
+    ).stdout.strip()
+    try:
+        return float(out)
+    except ValueError:
+        return None
+
+
+def transcode_segmented(source: str, output: str, duration: float, fps: float, has_audio: bool,
+                        video_args: List[str], audio_args: List[str], job: Optional[RenderJob] = None) -> int:
+    """
+    Transcode source into output (MP4) with video encoded in segments on SEGMENT_WORKERS concurrent
+    ffmpeg processes and audio encoded in one pass alongside them, so the joins cannot shift it.
+    Segments are joined with the concat demuxer (stream copy) and the result is checked: every
+    segment has exactly its planned frames and the joined video is continuous and as long as the
+    source, so audio stays in sync across joins. Returns the number of segments.
+    Raises SegmentJoinError if that check fails, RenderCancelled if the job is cancelled.
+    """
+    segments = plan_segments(keyframe_times(source), duration, fps, SEGMENT_SECONDS)
+    workdir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        tasks = []
+        for i, (keyframe, start, count) in enumerate(segments):
+            seconds = (count if count is not None else max(1, duration * fps - start)) / fps
+            path = os.path.join(workdir, f"segment{i:05d}.mp4")
+            command = _segment_command(source, path, keyframe, start, count, fps, video_args)
+            tasks.append((command, seconds, path))
+        audio_path = os.path.join(workdir, "audio.m4a")
+        if has_audio:
+            command = ["ffmpeg", "-y", "-i", source, "-map", "0:a:0", "-vn", "-sn", "-dn"] + audio_args + [audio_path]
+            # Audio encodes far faster than video; it only needs a small share of the progress bar
+            tasks.append((command, duration / 20, audio_path))
+        run_parallel([(lambda sub, command=command, seconds=seconds: run_ffmpeg(command, sub, seconds), seconds)
+                      for command, seconds, _ in tasks],
+                     SEGMENT_WORKERS, job=job, weight=0.95, name="segment")
+
+        # Every segment but the last must hold exactly its planned frames, or the joins drift
+        frames = 0
+        for (_, start, count), (_, _, path) in zip(segments, tasks):
+            actual, _ = _frame_count(path)
+            if count is not None and actual != count:
+                raise SegmentJoinError(f"Segment at frame {start} has {actual} frames, expected {count}")
+            frames += actual
+
+        list_path = os.path.join(workdir, "segments.ffconcat")
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.write("ffconcat version 1.0\n")
+            for (_, start, count), (_, _, path) in zip(segments, tasks):
+                f.write(f"file '{os.path.basename(path)}'\n")
+                if count is not None:
+                    f.write(f"duration {count / fps:.6f}\n")
+        command = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+        if has_audio:
+            command += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+        command += ["-c", "copy", "-movflags", "+faststart", output]
+        run_ffmpeg(command, job=job, duration=duration, weight=0.05, offset=0.95)
+
+        joined, joined_duration = _frame_count(output)
+        if joined != frames or abs(joined_duration - frames / fps) > 0.5 / fps:
+            raise SegmentJoinError(f"Joined video has {joined} frames ({joined_duration:.3f}s), expected {frames} ({frames / fps:.3f}s)")
+        if abs(joined_duration - duration) > 2 / fps + 0.05:
+            raise SegmentJoinError(f"Joined video lasts {joined_duration:.3f}s, source {duration:.3f}s")
+        if has_audio:
+            audio_duration = _stream_duration(output, "a:0")
+            source_audio = _stream_duration(source, "a:0")
+            if audio_duration is not None and source_audio is not None and abs(audio_duration - source_audio) > 0.05:
+                raise SegmentJoinError(f"Joined audio lasts {audio_duration:.3f}s, source {source_audio:.3f}s")
+        return len(segments)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,312 @@
+"""Smart render: stream-copy whole GOPs of H.264 sources and re-encode only the partial GOPs at cut points."""
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from interval_cut import audio_select_filter, bounded_input, source_rates
+from render_jobs import RenderJob, run_ffmpeg
+
+# Set SMART_RENDER=0 to always re-encode cuts
+SMART_RENDER = os.getenv("SMART_RENDER", "1") == "1"
+# Only worth it when at least this share of output frames can be stream-copied...
+SMART_RENDER_MIN_COPY = float(os.getenv("SMART_RENDER_MIN_COPY", "0.5"))
+# ...and no more than this many boundary pieces need re-encoding (each is an ffmpeg run)
+SMART_RENDER_MAX_PIECES = int(os.getenv("SMART_RENDER_MAX_PIECES", "40"))
+
+# Boundary pieces use the same settings as upload normalization and renders
+_ENCODE_ARGS = ["-c:v", "libx264", "-crf", "23", "-preset", "fast", "-pix_fmt", "yuv420p"]
+_INDEX_CACHE_SIZE = 64
+
+
+class SourceIndex(BaseModel):
+    """Stream-copy facts about one H.264 file: format and keyframe positions."""
+    path: str
+    width: int
+    height: int
+    fps: float
+    timescale: int  # video time base is 1/timescale
+    sar_square: bool
+    frames: int
+    keyframes: List[int]  # frame indices
+    keyframe_pts: List[float]  # seconds
+    keyframe_dts: List[float]
+
+
+class Piece(BaseModel):
+    """Frames [start, end) of a source, either stream-copied or re-encoded."""
+    source: str
+    start: int
+    end: int
+    copy_gops: bool
+
+
+_index_cache: "OrderedDict[tuple, Optional[SourceIndex]]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _parse_ratio(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    num, _, den = (value or "").partition("/")
+    try:
+        num_i, den_i = int(num), int(den or 1)
+    except ValueError:
+        return None
+    return (num_i, den_i) if num_i > 0 and den_i > 0 else None
+
+
+def parse_source_index(path: str, probe: dict) -> Optional[SourceIndex]:
+    """
+    Build a SourceIndex from ffprobe JSON (stream + packet entries of the first video stream).
+    Returns None when the stream cannot be spliced safely: not H.264 yuv420p, variable frame rate,
+    odd time base, or not starting at a keyframe at t=0.
+    """
+    streams = probe.get("streams") or []
+    if not streams:
+        return None
+    stream = streams[0]
+    if stream.get("codec_name") != "h264" or stream.get("pix_fmt") != "yuv420p":
+        return None
+    rate, avg = _parse_ratio(stream.get("r_frame_rate")), _parse_ratio(stream.get("avg_frame_rate"))
+    time_base = _parse_ratio(stream.get("time_base"))
+    if rate is None or rate != avg or time_base is None or time_base[0] != 1:
+        return None
+    fps = rate[0] / rate[1]
+    tb = 1.0 / time_base[1]
+    packets = probe.get("packets") or []
+    keyframes, keyframe_pts, keyframe_dts = [], [], []
+    for packet in packets:
+        if "K" not in packet.get("flags", "") or packet.get("pts") is None or packet.get("dts") is None:
+            continue
+        pts = int(packet["pts"]) * tb
+        keyframes.append(round(pts * fps))
+        keyframe_pts.append(pts)
+        keyframe_dts.append(int(packet["dts"]) * tb)
+    if not keyframes or keyframes[0] != 0:
+        return None
+    order = sorted(range(len(keyframes)), key=keyframes.__getitem__)
+    sar = stream.get("sample_aspect_ratio")
+    return SourceIndex(
+        path=path,
+        width=int(stream.get("width") or 0),
+        height=int(stream.get("height") or 0),
+        fps=fps,
+        timescale=time_base[1],
+        sar_square=sar in (None, "1:1", "0:1", "N/A"),
+        frames=len(packets),
+        keyframes=[keyframes[i] for i in order],
+        keyframe_pts=[keyframe_pts[i] for i in order],
+        keyframe_dts=[keyframe_dts[i] for i in order],
+    )
+
+
+def index_source(path: str) -> Optional[SourceIndex]:
+    """Keyframe index for path (cached per size + mtime), or None if it cannot be stream-copied."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _index_lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            return _index_cache[key]
+    try:
+        # Packet headers only: no decoding, so this is fast even for long files
+        out = subprocess.run([
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=codec_name,pix_fmt,width,height,r_frame_rate,avg_frame_rate,time_base,sample_aspect_ratio:packet=pts,dts,flags",
+            "-of", "json", path,
+        ], capture_output=True, text=True, check=True, timeout=120).stdout
+        index = parse_source_index(path, json.loads(out))
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError, ValueError):
+        index = None
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def plan_pieces(source: str, start: int, end: int, keyframes: List[int]) -> List[Piece]:
+    """
+    Split frames [start, end) into a re-encoded head up to the first keyframe, stream-copied whole
+    GOPs up to the last keyframe, and a re-encoded tail. Spans without a whole GOP are re-encoded.
+    """
+    inside = [k for k in keyframes if start <= k <= end]
+    if len(inside) < 2:
+        return [Piece(source=source, start=start, end=end, copy_gops=False)]
+    first, last = inside[0], inside[-1]
+    pieces = []
+    if start < first:
+        pieces.append(Piece(source=source, start=start, end=first, copy_gops=False))
+    pieces.append(Piece(source=source, start=first, end=last, copy_gops=True))
+    if last < end:
+        pieces.append(Piece(source=source, start=last, end=end, copy_gops=False))
+    return pieces
+
+
+def _concat_path(path: str) -> str:
+    return "'" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+
+def _copy_entry(piece: Piece, index: SourceIndex) -> List[str]:
+    """Concat-demuxer entry copying a piece's packets straight from its source."""
+    first = index.keyframes.index(piece.start)
+    # Round inpoint up and outpoint down to the microsecond so neither keyframe is missed
+    inpoint = math.ceil(index.keyframe_pts[first] * 1e6) / 1e6
+    lines = [f"file {_concat_path(piece.source)}", f"inpoint {inpoint:.6f}"]
+    if piece.end in index.keyframes:
+        # outpoint is compared with decode timestamps: stop before the next keyframe is decoded
+        dts = index.keyframe_dts[index.keyframes.index(piece.end)]
+        lines.append(f"outpoint {math.floor(dts * 1e6) / 1e6:.6f}")
+    lines.append(f"duration {(piece.end - piece.start) / index.fps:.6f}")
+    return lines
+
+
+def _encode_piece(piece: Piece, index: SourceIndex, output_path: str, job: Optional[RenderJob], weight: float, offset: float) -> None:
+    command = ["ffmpeg", "-y"]
+    if piece.start > 0:
+        # Accurate input seek to half a frame early, so the first frame kept is exactly piece.start
+        command += ["-ss", f"{(piece.start - 0.5) / index.fps:.6f}"]
+    command += [
+        "-i", piece.source, "-frames:v", str(piece.end - piece.start), "-an",
+        "-vf", "setpts=N/FRAME_RATE/TB",
+    ] + _ENCODE_ARGS + ["-video_track_timescale", str(index.timescale), output_path]
+    run_ffmpeg(command, job=job, duration=(piece.end - piece.start) / index.fps, weight=weight, offset=offset)
+
+
+def plan_render(ranges: List[Tuple[str, float, float]], width: Optional[int] = None, height: Optional[int] = None) -> Optional[Tuple[List[Piece], dict]]:
+    """
+    Plan a smart render of (source path, start s, end s) ranges, in output order.
+    Returns (pieces, indexes by path), or None when the ranges should be fully re-encoded instead:
+    smart render is off, a source cannot be stream-copied, sources differ in format, the output
+    must have another size (width/height), or too little of the output could be copied.
+    """
+    if not SMART_RENDER or not ranges:
+        return None
+    indexes = {}
+    for path, _, _ in ranges:
+        if path not in indexes:
+            index = index_source(path)
+            if index is None:
+                return None
+            indexes[path] = index
+    reference = next(iter(indexes.values()))
+    for index in indexes.values():
+        if (index.width, index.height, index.fps, index.timescale) != (reference.width, reference.height, reference.fps, reference.timescale):
+            return None
+        if not index.sar_square or (width is not None and (index.width, index.height) != (width, height)):
+            return None
+    pieces: List[Piece] = []
+    for path, start, end in ranges:
+        index = indexes[path]
+        a, b = max(0, round(start * index.fps)), min(index.frames, round(end * index.fps))
+        if b > a:
+            # End of file counts as a GOP boundary: the last GOP can be copied to the end
+            pieces.extend(plan_pieces(path, a, b, index.keyframes + [index.frames]))
+    total = sum(p.end - p.start for p in pieces)
+    copied = sum(p.end - p.start for p in pieces if p.copy_gops)
+    encoded = sum(1 for p in pieces if not p.copy_gops)
+    if total == 0 or copied / total < SMART_RENDER_MIN_COPY or encoded > SMART_RENDER_MAX_PIECES:
+        return None
+    return pieces, indexes
+
+
+def _audio_runs(pieces: List[Piece]) -> List[Tuple[str, List[Tuple[int, int]]]]:
+    """Group consecutive pieces from the same source into (source, merged frame ranges) runs."""
+    runs: List[Tuple[str, List[Tuple[int, int]]]] = []
+    for piece in pieces:
+        if runs and runs[-1][0] == piece.source:
+            grid = runs[-1][1]
+            if grid[-1][1] == piece.start:
+                grid[-1] = (grid[-1][0], piece.end)
+            else:
+                grid.append((piece.start, piece.end))
+        else:
+            runs.append((piece.source, [(piece.start, piece.end)]))
+    return runs
+
+
+def _input_count(args: List[str]) -> int:
+    return sum(1 for a in args if a == "-i")
+
+
+def render(pieces: List[Piece], indexes: dict, output_path: str, job: Optional[RenderJob] = None) -> None:
+    """
+    Write pieces to output_path: boundary pieces are re-encoded to temp files, whole GOPs are copied
+    from the sources, and the video is joined with the concat demuxer. Audio is cut sample-exactly
+    from the same frame ranges and encoded in the same (final) pass.
+    """
+    fps = next(iter(indexes.values())).fps
+    total_frames = sum(p.end - p.start for p in pieces)
+    encode_frames = sum(p.end - p.start for p in pieces if not p.copy_gops)
+    # Progress: boundary encodes by frame share, the cheap join + audio pass takes the rest
+    encode_weight = 0.8 * encode_frames / total_frames
+    workdir = tempfile.mkdtemp(prefix=".smart_render_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        lines = ["ffconcat version 1.0"]
+        done_frames = 0
+        for i, piece in enumerate(pieces):
+            index = indexes[piece.source]
+            if piece.copy_gops:
+                lines += _copy_entry(piece, index)
+                continue
+            piece_path = os.path.join(workdir, f"piece_{i}.mp4")
+            frames = piece.end - piece.start
+            _encode_piece(piece, index, piece_path, job,
+                          weight=encode_weight * frames / encode_frames,
+                          offset=encode_weight * done_frames / encode_frames)
+            done_frames += frames
+            lines += [f"file {_concat_path(piece_path)}", f"duration {frames / fps:.6f}"]
+        list_path = os.path.join(workdir, "pieces.ffconcat")
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        inputs = ["-f", "concat", "-safe", "0", "-i", list_path]
+        filters, labels = [], []
+        for source, grid in _audio_runs(pieces):
+            n = len(labels)
+            _, sample_rate, _ = source_rates(source)
+            if sample_rate:
+                inputs += bounded_input(source, grid, fps)
+                filters.append(f"[{_input_count(inputs) - 1}:a]{audio_select_filter(grid, fps, sample_rate)}[a{n}]")
+            else:
+                seconds = sum(b - a for a, b in grid) / fps
+                inputs += ["-f", "lavfi", "-t", f"{seconds:.6f}", "-i", "anullsrc=r=44100:cl=stereo"]
+                filters.append(f"[{_input_count(inputs) - 1}:a]asetpts=PTS-STARTPTS[a{n}]")
+            labels.append(f"[a{n}]")
+        filters.append(f"{''.join(labels)}concat=n={len(labels)}:v=0:a=1[outa]")
+        command = ["ffmpeg", "-y"] + inputs + [
+            "-filter_complex", ";".join(filters),
+            "-map", "0:v", "-map", "[outa]",
+            "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+            "-movflags", "+faststart",
+            output_path,
+        ]
+        run_ffmpeg(command, job=job, duration=total_frames / fps, weight=1.0 - encode_weight, offset=encode_weight)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    copied = total_frames - encode_frames
+    logging.info(f"Smart render {os.path.basename(output_path)}: copied {copied}/{total_frames} frames, re-encoded {len([p for p in pieces if not p.copy_gops])} boundary pieces")
+
+
+def smart_render(ranges: List[Tuple[str, float, float]], output_path: str, job: Optional[RenderJob] = None,
+                 width: Optional[int] = None, height: Optional[int] = None) -> bool:
+    """
+    Cut (source, start s, end s) ranges into output_path without re-encoding whole GOPs.
+    Returns False (writing nothing) when the ranges are not suitable; the caller then re-encodes.
+    """
+    planned = plan_render(ranges, width=width, height=height)
+    if planned is None:
+        return False
+    pieces, indexes = planned
+    render(pieces, indexes, output_path, job=job)
+    return True
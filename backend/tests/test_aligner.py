@@ -0,0 +1,76 @@
+"""Tests for the local extract-to-timestamp aligner."""
+import os
+import random
+import sys
+import time
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from aligner import WordAligner, tokenize, words_from_whisper_result
+
+
+def _words(text, start=0.0, step=0.5):
+    return [{"word": " " + w, "start": round(start + i * step, 3), "end": round(start + (i + 1) * step - 0.05, 3)} for i, w in enumerate(text.split())]
+
+
+_TRANSCRIPT = (
+    "Welcome back to the channel. Today we are talking about habits. "
+    "The biggest mistake people make is trying to change everything at once. "
+    "Start with one small habit, and stack the next one on top of it. "
+    "That's how you build momentum without burning out."
+)
+
+
+def test_tokenize_drops_punctuation_and_case():
+    assert tokenize("That's how, you BUILD momentum!") == ["that's", "how", "you", "build", "momentum"]
+    assert tokenize("Don’t stop") == ["don't", "stop"]
+
+
+def test_exact_extract_maps_to_word_times():
+    words = _words(_TRANSCRIPT)
+    alignment = WordAligner(words).align("The biggest mistake people make is trying to change everything at once.")
+    assert words[alignment.first_word]["word"] == " The"
+    assert words[alignment.last_word]["word"] == " once."
+    assert alignment.start == words[alignment.first_word]["start"]
+    assert alignment.end == words[alignment.last_word]["end"]
+    assert alignment.score == 1.0
+
+
+def test_fuzzy_extract_with_edits_still_aligns():
+    words = _words(_TRANSCRIPT)
+    # Gemini dropped a word, changed one and normalised punctuation
+    alignment = WordAligner(words).align("start with one tiny habit and stack the next one on it")
+    assert words[alignment.first_word]["word"] == " Start"
+    assert words[alignment.last_word]["word"] == " it."
+    assert 0.6 <= alignment.score < 1.0
+
+
+def test_unrelated_text_is_not_aligned():
+    assert WordAligner(_words(_TRANSCRIPT)).align("quantum chromodynamics lecture notes") is None
+    assert WordAligner([]).align("anything") is None
+
+
+def test_repeated_phrase_resolves_deterministically():
+    words = _words("say it again " * 2 + "and then stop")
+    first = WordAligner(words).align("say it again")
+    assert (first.first_word, first.last_word) == (0, 2)
+
+
+def test_segments_without_words_are_spread_evenly():
+    words = words_from_whisper_result({"segments": [{"start": 10.0, "end": 12.0, "text": " one two three four"}]})
+    assert [w["start"] for w in words] == [10.0, 10.5, 11.0, 11.5]
+
+
+def test_long_transcript_aligns_quickly():
+    rng = random.Random(0)
+    vocab = [f"w{i}" for i in range(2000)] + ["the", "a", "and", "to"] * 200
+    text = " ".join(rng.choice(vocab) for _ in range(40000))
+    words = _words(text, step=0.3)
+    aligner = WordAligner(words)
+    target = " ".join(w["word"].strip() for w in words[31000:31040])
+    started = time.perf_counter()
+    alignment = aligner.align(target)
+    assert (alignment.first_word, alignment.last_word) == (31000, 31039)
+    assert time.perf_counter() - started < 2.0
@@ -0,0 +1,107 @@
+"""Tests for the auto-generate pipeline with Gemini, Crew and ffmpeg replaced."""
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import Future
+
+import pytest
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import auto_generator
+import transcripts
+from transcripts import Transcript, TranscriptStore, write_transcript
+
+_PHRASES = {
+    "a.mp4": (5.0, "the secret to growing on tiktok is posting every single day"),
+    "b.mp4": (42.0, "nobody tells you how hard the first year of a startup really is"),
+}
+
+
+def _write_transcript(tmp_path, name, start, phrase):
+    filler = "and so we talked about a lot of other things".split()
+    words, t = [], 0.0
+    for w in filler * 3:
+        words.append({"word": " " + w, "start": t, "end": t + 0.3})
+        t += 0.3
+    t = start
+    for w in phrase.split():
+        words.append({"word": " " + w.capitalize(), "start": t, "end": t + 0.4})
+        t += 0.4
+    path = tmp_path / name
+    path.write_bytes(b"")
+    (tmp_path / f"{name}.json").write_text(json.dumps({"segments": [{"start": 0, "end": t, "text": "", "words": words}]}))
+    (tmp_path / f"{name}.srt").write_text(f"subs for {name}")
+    (tmp_path / f"{name}.txt").write_text(phrase)
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(auto_generator, "FILES_DIR", str(tmp_path))
+    for name, (start, phrase) in _PHRASES.items():
+        _write_transcript(tmp_path, name, start, phrase)
+
+    def fake_ensure(path, model_name, min_model=None):
+        f = Future()
+        f.set_result(Transcript(media_path=path, model="base", json_path=path + ".json", srt_path=path + ".srt", txt_path=path + ".txt"))
+        return f
+
+    rendered = []
+    monkeypatch.setattr(auto_generator.transcript_store, "ensure", fake_ensure)
+    monkeypatch.setattr(auto_generator, "get_duration_seconds", lambda path: 60.0)
+    monkeypatch.setattr(auto_generator.extracts, "call_gemini_api", lambda transcript, **kw: {"clips": [{"text": transcript + "."}]})
+    monkeypatch.setattr(auto_generator, "render_timeline_clips", lambda clips: rendered.append((clips[0].filename, clips[0].start, clips[0].end)) or f"out_{clips[0].filename}")
+    monkeypatch.setattr(auto_generator.thumbnails, "request_thumbnail", lambda path: None)
+    return rendered
+
+
+def test_concurrent_runs_align_locally(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(auto_generator.crew, "main", lambda *a, **k: pytest.fail("Crew should not be needed"))
+
+    async def run_both():
+        return await asyncio.gather(
+            auto_generator.generate_viral_clips("a.mp4"),
+            auto_generator.generate_viral_clips("b.mp4"),
+        )
+
+    results = asyncio.run(run_both())
+    assert [r["outputs"] for r in results] == [["out_a.mp4"], ["out_b.mp4"]]
+    assert sorted(pipeline) == [("a.mp4", 5.0, 9.4), ("b.mp4", 42.0, 47.2)]
+    # Workspaces are removed once each run finishes
+    assert os.listdir(tmp_path / auto_generator.WORKSPACES_DIR) == []
+
+
+def test_unaligned_extract_falls_back_to_crew(pipeline, monkeypatch):
+    monkeypatch.setattr(auto_generator.extracts, "call_gemini_api", lambda transcript, **kw: {"clips": [{"text": "completely unrelated words here"}]})
+    calls = []
+
+    def fake_crew(extracts, subtitles=None, output_dir="crew_output"):
+        calls.append((extracts, subtitles))
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, "new_file_return_subtitles_1_x.srt"), "w") as f:
+            f.write("1\n00:00:20,000 --> 00:00:32,500\nwords\n")
+
+    monkeypatch.setattr(auto_generator.crew, "main", fake_crew)
+    result = asyncio.run(auto_generator.generate_viral_clips("a.mp4"))
+    assert result["outputs"] == ["out_a.mp4"]
+    assert calls == [(["completely unrelated words here"], "subs for a.mp4")]
+    assert pipeline == [("a.mp4", 20.0, 32.5)]
+
+
+def test_only_transcripts_as_good_as_the_model_are_reused(tmp_path, monkeypatch):
+    # By default (AUTO_GENERATE_MIN_MODEL unset) the upload's base transcript is not good enough
+    submitted = []
+    monkeypatch.setattr(transcripts.transcription_service, "submit", lambda *a, **k: submitted.append(a[0]) or Future())
+    result = {"text": " hi", "language": "en", "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " hi"}]}
+    for upload_model, reused in [("base", False), ("small.en", False), ("medium", True), ("large-v3", True)]:
+        media = str(tmp_path / f"{upload_model}.mp4")
+        write_transcript(media, result, upload_model)
+        submitted.clear()
+        future = TranscriptStore().ensure(media, auto_generator.AUTO_GENERATE_MODEL, auto_generator.AUTO_GENERATE_MIN_MODEL)
+        assert (future.done() and future.result().model == upload_model) == reused
+        assert submitted == ([] if reused else ["medium.en"])
@@ -0,0 +1,83 @@
+"""Tests for concurrent chunk analysis helpers (rate limiting, retries, interval merging)."""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from chunk_analysis import TokenBucket, call_with_retry, map_concurrently, merge_intervals
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == 0.0
+    bucket.acquire()
+    assert clock.now == pytest.approx(0.5)
+    bucket.acquire()
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_call_with_retry_backs_off_then_succeeds():
+    delays = []
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("429")
+        return ["ok"]
+
+    assert call_with_retry(flaky, attempts=4, base_delay=1.0, sleep=delays.append) == ["ok"]
+    assert len(delays) == 2
+    assert 1.0 <= delays[0] <= 1.5 and 2.0 <= delays[1] <= 3.0
+
+
+def test_call_with_retry_gives_up():
+    with pytest.raises(ValueError):
+        call_with_retry(lambda: (_ for _ in ()).throw(ValueError("bad json")), attempts=2, sleep=lambda s: None)
+
+
+def test_map_concurrently_runs_in_parallel_and_keeps_order():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def work(index, item):
+        with lock:
+            active.append(index)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(index)
+        return [item * 10]
+
+    assert map_concurrently(work, [3, 1, 2, 5], max_workers=4) == [[30], [10], [20], [50]]
+    assert max(peak) > 1
+
+
+def test_merge_intervals_sorts_and_merges():
+    intervals = [
+        {"start": 12, "end": 15}, {"start": 0, "end": 5.2}, {"start": 4.0, "end": 6.0},
+        {"start": 6.0, "end": 7.5}, {"start": 9, "end": 8}, {"start": "x", "end": 3}, {"end": 4}, "junk",
+    ]
+    assert merge_intervals(intervals) == [{"start": 0.0, "end": 7.5}, {"start": 12.0, "end": 15.0}]
+    assert merge_intervals([{"start": 0, "end": 1}, {"start": 1.2, "end": 2}], gap=0.3) == [{"start": 0.0, "end": 2.0}]
@@ -0,0 +1,86 @@
+"""Tests for timeline filmstrips (sprite sheets and their time map)."""
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import filmstrips
+import media_probe
+import proxies
+from filmstrips import generate_filmstrip, sheet_path
+
+
+@pytest.fixture
+def strip_env(tmp_path, monkeypatch):
+    files_dir = str(tmp_path / "files")
+    os.makedirs(files_dir)
+    video = os.path.join(files_dir, "talk.mp4")
+    subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=640x360:rate=30", "-t", "10",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-g", "15", video],
+                   check=True, capture_output=True, timeout=60)
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(proxies, "PROXY_DIR", os.path.join(files_dir, ".proxies"))
+    monkeypatch.setattr(filmstrips, "FILMSTRIP_DIR", os.path.join(files_dir, ".filmstrips"))
+    monkeypatch.setattr(filmstrips, "FILMSTRIP_COLUMNS", 4)
+    monkeypatch.setattr(filmstrips, "FILMSTRIP_ROWS", 2)
+    commands = []
+    real_run = filmstrips.run_ffmpeg
+    monkeypatch.setattr(filmstrips, "run_ffmpeg", lambda command, **kw: commands.append(command) or real_run(command, **kw))
+    return files_dir, video, commands
+
+
+def _size(path):
+    out = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "stream=width,height", "-of", "csv=p=0", path],
+                         capture_output=True, text=True, check=True).stdout
+    return tuple(int(v) for v in out.strip().split(","))
+
+
+def test_filmstrip_tiles_keyframes_into_cached_sheets(strip_env):
+    _, video, commands = strip_env
+    strip = generate_filmstrip(video)
+    assert (strip.count, strip.sheets, strip.tile_width, strip.tile_height) == (10, 2, 128, 72)
+    assert len(commands) == 1 and "-skip_frame" in commands[0] and "tile=4x2" in " ".join(commands[0])
+    assert _size(sheet_path(video, strip.key, 0)) == (512, 144)
+    assert strip.region(9) == (1, 128, 0)
+
+    # Cached until the media changes; a new version replaces the old sheets
+    assert generate_filmstrip(video) == strip and len(commands) == 1
+    os.utime(video, (1, 1))
+    newer = generate_filmstrip(video)
+    assert newer.key != strip.key and len(commands) == 2
+    assert os.listdir(os.path.dirname(os.path.dirname(sheet_path(video, newer.key, 0)))) == [newer.key]
+
+
+def test_proxy_is_decoded_when_there_is_one(strip_env):
+    _, video, commands = strip_env
+    proxies.generate_proxy(video)
+    generate_filmstrip(video)
+    assert commands[-1][commands[-1].index("-i") + 1] == proxies.proxy_path(video)
+
+
+def test_filmstrip_endpoints(strip_env, monkeypatch):
+    import main
+    files_dir, video, _ = strip_env
+    monkeypatch.setattr(main, "FILES_DIR", files_dir)
+    client = TestClient(main.app)
+
+    strip = client.get("/media/talk.mp4/filmstrip").json()
+    assert strip["count"] == 10 and strip["tileWidth"] == 128 and len(strip["sheets"]) == 2
+    sheet = client.get(strip["sheets"][1].replace("http://127.0.0.1:8001", ""))
+    assert sheet.status_code == 200 and sheet.headers["content-type"] == "image/jpeg"
+    assert "immutable" in sheet.headers["cache-control"]
+
+    vtt = client.get("/media/talk.mp4/filmstrip.vtt")
+    assert vtt.headers["content-type"].startswith("text/vtt")
+    lines = vtt.text.splitlines()
+    assert lines[0] == "WEBVTT"
+    assert lines[-2:] == ["00:00:09.000 --> 00:00:10.000", strip["sheets"][1] + "#xywh=128,0,128,72"]
+
+    assert client.get("/media/missing.mp4/filmstrip").status_code == 404
+    with open(os.path.join(files_dir, "notes.mp3"), "wb") as f:
+        f.write(b"not media")
+    assert client.get("/media/notes.mp3/filmstrip").status_code == 422
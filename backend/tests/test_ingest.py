@@ -0,0 +1,216 @@
+"""Tests for the background ingest queue (normalize, then transcription and thumbnail)."""
+import filecmp
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ingest
+import media_probe
+import proxies
+import thumbnails
+from ingest import AUDIO_ONLY, DEDUPLICATED, FAILED, LOUDNORM, PROCESSING, READY, REMUX, TRANSCODE, IngestManager, plan_normalization
+from media_probe import MediaInfo, StreamInfo
+from transcripts import write_transcript
+
+
+@pytest.fixture
+def app_client(tmp_path, monkeypatch):
+    import main
+    files_dir = str(tmp_path / "files")
+    os.makedirs(files_dir)
+    monkeypatch.setattr(main, "FILES_DIR", files_dir)
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(proxies, "PROXY_DIR", os.path.join(files_dir, ".proxies"))
+    monkeypatch.setattr(main, "ingest_jobs", IngestManager(workers=1, followup_workers=2))
+    followups = []
+    monkeypatch.setattr(main, "_transcribe_upload", lambda path: followups.append(("transcription", path)))
+    monkeypatch.setattr(thumbnails, "generate_thumbnail", lambda path: followups.append(("thumbnail", path)))
+    yield main, files_dir, followups
+    main.ingest_jobs.shutdown()
+
+
+def test_upload_returns_before_normalization(app_client, fixture_video):
+    main, files_dir, followups = app_client
+    client = TestClient(main.app)
+    with open(fixture_video, "rb") as f:
+        response = client.post("/upload", files={"file": ("clip.mov", f, "video/quicktime")})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["id"] == "clip.mp4" and body["status"] == PROCESSING
+    assert [m["status"] for m in client.get("/media").json() if m["id"] == "clip.mp4"] in ([PROCESSING], [READY])
+
+    item = main.ingest_jobs.get("clip.mp4")
+    item.normalize.future.result(timeout=60)
+    for job in item.followups.values():
+        done = threading.Event()
+        job.add_done_callback(lambda j: done.set())
+        assert done.wait(10)
+
+    status = client.get("/media/clip.mp4/status").json()
+    assert status["status"] == READY and status["progress"] == 1.0
+    assert {name: job["status"] for name, job in status["jobs"].items()} == {"normalize": "done", "transcription": "done", "thumbnail": "done", "proxy": "done"}
+    assert sorted(followups) == [("thumbnail", os.path.join(files_dir, "clip.mp4")), ("transcription", os.path.join(files_dir, "clip.mp4"))]
+    info = media_probe.probe_media(os.path.join(files_dir, "clip.mp4"))
+    assert (info.width, info.height) == (1920, 1080)
+    assert os.listdir(os.path.join(files_dir, ".ingest")) == []
+    media = client.get("/media").json()
+    assert [(m["status"], m["proxyUrl"]) for m in media if m["id"] == "clip.mp4"] == [(READY, "http://127.0.0.1:8001/proxies/clip.mp4")]
+
+
+def test_failed_normalization_skips_followups(app_client, tmp_path):
+    main, files_dir, followups = app_client
+    client = TestClient(main.app)
+    response = client.post("/upload", files={"file": ("broken.mp4", b"not a video", "video/mp4")})
+    assert response.status_code == 200
+    item = main.ingest_jobs.get("broken.mp4")
+    item.normalize.future.result(timeout=30)
+    assert item.status == FAILED
+    assert all(job.status == FAILED for job in item.followups.values())
+    assert followups == []
+    assert [m["status"] for m in client.get("/media").json()] == [FAILED]
+    assert not os.path.exists(os.path.join(files_dir, "broken.mp4"))
+
+
+def test_unsupported_upload_is_refused(app_client):
+    main, files_dir, _ = app_client
+    client = TestClient(main.app)
+    response = client.post("/upload", files={"file": ("notes.txt", b"text", "text/plain")})
+    assert response.status_code == 400 and "Format not supported" in response.json()["detail"]
+    assert not os.path.exists(os.path.join(files_dir, ".ingest"))
+
+
+def test_duplicate_upload_reuses_stored_media(app_client, fixture_video, monkeypatch):
+    main, files_dir, followups = app_client
+
+    def transcribe(path):
+        with open(os.path.splitext(path)[0] + ".json", "w") as f:
+            f.write('{"model": "base"}')
+        followups.append(("transcription", path))
+
+    monkeypatch.setattr(main, "_transcribe_upload", transcribe)
+    client = TestClient(main.app)
+    data = open(fixture_video, "rb").read()
+    first = client.post("/upload", files={"file": ("take.mp4", data, "video/mp4")}).json()
+    digest = first["sha256"]
+    stored = os.path.join(files_dir, ".store", digest + ".mp4")
+    deadline = time.time() + 60
+    while not os.path.exists(os.path.join(files_dir, ".store", digest + ".transcript.json")) and time.time() < deadline:
+        time.sleep(0.05)
+
+    # Linking and probing happen outside the lock other uploads take their names under
+    locked = []
+    store, real_link, real_probe = main._media_store(), main._media_store().link, media_probe.probe_partial
+    monkeypatch.setattr(store, "link", lambda *args: locked.append(main._ingest_lock.locked()) or real_link(*args))
+    monkeypatch.setattr(media_probe, "probe_partial", lambda path: locked.append(main._ingest_lock.locked()) or real_probe(path))
+
+    # Same bytes under a new name: linked to the stored media and transcript, nothing is run again
+    followups.clear()
+    second = client.post("/upload", files={"file": ("again.mov", data, "video/quicktime")}).json()
+    assert (second["id"], second["status"], second["method"]) == ("again.mp4", READY, DEDUPLICATED)
+    assert os.path.samefile(os.path.join(files_dir, "again.mp4"), stored)
+    assert os.path.samefile(os.path.join(files_dir, "again.json"), os.path.join(files_dir, "take.json"))
+    # Stored files are read-only, so they are replaced rather than written in place
+    assert not os.stat(stored).st_mode & 0o222
+    # Same bytes under the same name resolve to the existing media
+    assert client.post("/upload", files={"file": ("take.mp4", data, "video/mp4")}).json()["id"] == "take.mp4"
+    assert followups == [] and main.ingest_jobs.get("again.mp4") is None
+    assert os.listdir(os.path.join(files_dir, ".ingest")) == []
+
+    # Different bytes under a taken name get a name of their own instead of replacing it
+    other = client.post("/upload", files={"file": ("take.mp4", data + b"\0", "video/mp4")}).json()
+    assert other["id"] == "take_2.mp4" and other["method"] != DEDUPLICATED
+    main.ingest_jobs.get("take_2.mp4").normalize.future.result(timeout=60)
+
+    # A new transcript of one name gets files of its own; the other name and the store keep theirs
+    original = open(os.path.join(files_dir, "take.json"), "rb").read()
+    write_transcript(os.path.join(files_dir, "again.mp4"), {"text": "again", "segments": []}, "medium.en")
+    assert not os.path.samefile(os.path.join(files_dir, "again.json"), os.path.join(files_dir, "take.json"))
+    assert open(os.path.join(files_dir, "take.json"), "rb").read() == original
+    assert open(os.path.join(files_dir, ".store", digest + ".transcript.json"), "rb").read() == original
+
+    # A name replaced by other media no longer holds the stored upload, which is linked anew
+    os.replace(os.path.join(files_dir, "take_2.mp4"), os.path.join(files_dir, "again.mp4"))
+    assert client.post("/upload", files={"file": ("again.mp4", data, "video/mp4")}).json()["id"] == "again_2.mp4"
+    assert filecmp.cmp(os.path.join(files_dir, "again_2.mp4"), stored, shallow=False)
+    assert len(locked) == 3 and not any(locked)
+    client.delete("/delete/take.mp4")
+    assert os.path.exists(stored)
+    client.delete("/delete/again_2.mp4")
+    assert not os.path.exists(stored)
+
+
+def test_same_media_cannot_be_queued_twice(tmp_path):
+    manager = IngestManager(workers=1)
+    release = threading.Event()
+    blocker = manager._normalize_jobs.submit("normalize", lambda j: release.wait(5))
+    source = tmp_path / "a.mp4"
+    source.write_bytes(b"")
+    manager.submit(str(source), str(tmp_path / "clip.mp4"), video=True)
+    with pytest.raises(ValueError, match="already being processed"):
+        manager.submit(str(source), str(tmp_path / "clip.mp4"), video=True)
+    assert manager.cancel("clip.mp4")
+    assert manager.get("clip.mp4").status == FAILED
+    release.set()
+    blocker.future.result(timeout=5)
+    manager.shutdown()
+
+
+def _info(video=None, audio=None):
+    streams = [StreamInfo(**dict({"index": 0, "codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080,
+                                  "fps": 30.0, "cfr": True, "pix_fmt": "yuv420p", "sample_aspect_ratio": "1:1"}, **(video or {})))]
+    if audio is not False:
+        streams.append(StreamInfo(**dict({"index": 1, "codec_type": "audio", "codec_name": "aac", "sample_rate": 44100}, **(audio or {}))))
+    return MediaInfo(duration=10.0, has_video=True, has_audio=audio is not False, streams=streams)
+
+
+@pytest.mark.parametrize("info, method", [
+    (_info(), REMUX),
+    (_info(audio=False), REMUX),
+    (_info(audio={"sample_rate": 48000}), AUDIO_ONLY),
+    (_info(audio={"codec_name": "opus"}), AUDIO_ONLY),
+    (_info(video={"width": 1280, "height": 720}), TRANSCODE),
+    (_info(video={"codec_name": "hevc"}), TRANSCODE),
+    (_info(video={"fps": 29.97}), TRANSCODE),
+    (_info(video={"cfr": False}), TRANSCODE),
+    (_info(video={"rotation": 90}), TRANSCODE),
+    (_info(video={"pix_fmt": "yuv420p10le"}), TRANSCODE),
+    (None, TRANSCODE),
+])
+def test_plan_normalization_picks_cheapest_method(info, method):
+    assert plan_normalization(info, video=True)[0] == method
+
+
+def test_audio_uploads_are_always_loudness_normalized():
+    assert plan_normalization(None, video=False)[0] == LOUDNORM
+
+
+@pytest.mark.parametrize("sample_rate, method", [(44100, REMUX), (48000, AUDIO_ONLY)])
+def test_conforming_upload_is_not_reencoded(tmp_path, sample_rate, method):
+    source = str(tmp_path / "upload.mov")
+    subprocess.run(
+        ["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=1920x1080:rate=30", "-f", "lavfi", "-i", f"sine=sample_rate={sample_rate}",
+         "-t", "1", "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-c:a", "aac", source],
+        check=True, capture_output=True, timeout=60,
+    )
+    source_video = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=size",
+                                   "-of", "csv=p=0", source], capture_output=True, text=True, check=True).stdout
+    manager = IngestManager(workers=1)
+    final = str(tmp_path / "upload.mp4")
+    item = manager.submit(source, final, video=True)
+    item.normalize.future.result(timeout=60)
+    assert item.status == READY and item.method == method
+    assert not os.path.exists(source)
+    info = media_probe.probe_partial(final)
+    assert info.streams[1].sample_rate == 44100 and info.audio_codec == "aac"
+    # Video packets were copied, not re-encoded
+    assert subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=size",
+                           "-of", "csv=p=0", final], capture_output=True, text=True, check=True).stdout == source_video
+    assert ingest.method_counts[method] >= 1
+    manager.shutdown()
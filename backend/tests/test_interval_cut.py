@@ -0,0 +1,78 @@
+"""Tests for the select-expression interval cutter."""
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import media_probe
+from interval_cut import build_cut_command, cut_intervals, normalize_intervals, select_expression, snap_to_grid
+
+
+def _eval(expr: str, t: float) -> float:
+    """Evaluate the subset of ffmpeg expression syntax select_expression emits."""
+    env = {
+        "t": t,
+        "gte": lambda a, b: float(a >= b),
+        "lt": lambda a, b: float(a < b),
+        "_if": lambda c, a, b: a if c else b,
+    }
+    return eval(expr.replace("if(", "_if("), env)
+
+
+def test_normalize_merges_clamps_and_sorts():
+    intervals = [{"start": 5, "end": 8}, {"start": -1, "end": 2}, {"start": 7, "end": 9}, {"start": 20, "end": 30}]
+    assert normalize_intervals(intervals, duration=25) == [(0.0, 2.0), (5.0, 9.0), (20.0, 25.0)]
+
+
+def test_snap_to_grid_rounds_to_frames_and_merges_touching():
+    assert snap_to_grid([(0.01, 0.49), (0.5, 1.0), (2.0, 2.01)], 0.1) == [(0, 10)]
+    assert snap_to_grid([(0.0, 0.2), (0.51, 0.7)], 0.1) == [(0, 2), (5, 7)]
+
+
+def test_select_expression_matches_intervals():
+    intervals = [(float(i), i + 0.5) for i in range(0, 200, 2)]
+    expr = select_expression(intervals)
+    # Balanced tree: nesting depth grows with log(n), not n
+    assert expr.count("if(") == len(intervals) - 1
+    for t in (0.0, 0.25, 0.5, 1.0, 2.0, 97.9, 98.4, 198.49, 198.5, 250.0):
+        inside = any(a <= t < b for a, b in intervals)
+        assert _eval(expr, t) == float(inside), t
+
+
+def test_build_cut_command_without_audio():
+    command, kept = build_cut_command("in.mp4", "out.mp4", [{"start": 0, "end": 1}], sample_rate=None)
+    graph = command[command.index("-filter_complex") + 1]
+    assert "[0:a]" not in graph
+    assert "[outa]" not in command
+    assert kept == pytest.approx(1.0)
+
+
+def test_build_cut_command_rejects_empty():
+    with pytest.raises(ValueError):
+        build_cut_command("in.mp4", "out.mp4", [{"start": 3, "end": 2}])
+
+
+def test_cut_intervals_keeps_audio_and_video_in_sync(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    source = str(tmp_path / "source.mp4")
+    subprocess.run(
+        ["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=30",
+         "-f", "lavfi", "-i", "sine=sample_rate=44100", "-t", "4",
+         "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", source],
+        check=True, capture_output=True, timeout=30,
+    )
+    intervals = [{"start": i * 0.2, "end": i * 0.2 + 0.1} for i in range(0, 18, 2)]
+    output = str(tmp_path / "out.mp4")
+    kept = cut_intervals(source, output, intervals)
+    assert kept == pytest.approx(0.9)
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "stream=codec_type,duration", "-of", "json", output],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    durations = {s["codec_type"]: float(s["duration"]) for s in json.loads(probe)["streams"]}
+    assert durations["video"] == pytest.approx(0.9, abs=0.04)
+    assert durations["audio"] == pytest.approx(durations["video"], abs=0.03)
@@ -0,0 +1,154 @@
+"""Tests for the in-memory media catalog behind /media."""
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import media_catalog
+import media_probe
+import proxies
+from ingest import IngestManager
+from media_catalog import MediaCatalog
+
+
+@pytest.fixture
+def library(tmp_path, fixture_video, monkeypatch):
+    files_dir = str(tmp_path / "files")
+    os.makedirs(files_dir)
+    for i, name in enumerate(["a.mp4", "b.mp4", "c.mp3", "notes.txt"]):
+        path = os.path.join(files_dir, name)
+        shutil.copy(fixture_video, path)
+        os.utime(path, (1000 + i, 1000 + i))
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(proxies, "PROXY_DIR", os.path.join(files_dir, ".proxies"))
+    probes = []
+    real_duration = media_probe.get_duration_seconds
+    monkeypatch.setattr(media_probe, "get_duration_seconds", lambda path: probes.append(os.path.basename(path)) or real_duration(path))
+    return files_dir, probes
+
+
+def test_only_changed_files_are_probed(library):
+    files_dir, probes = library
+    catalog = MediaCatalog(files_dir)
+    assert sorted(e["id"] for e in catalog.sync()) == ["a.mp4", "b.mp4", "c.mp3"]
+    assert sorted(probes) == ["a.mp4", "b.mp4", "c.mp3"] and catalog.version == 1
+    assert catalog.sync() == [] and catalog.version == 1
+
+    probes.clear()
+    open(os.path.join(files_dir, "b.mp4.jpg"), "wb").close()
+    os.remove(os.path.join(files_dir, "a.mp4"))
+    with open(os.path.join(files_dir, "c.mp3"), "ab") as f:
+        f.write(b"\0")
+    changed = {e["id"]: e for e in catalog.sync()}
+    assert sorted(changed) == ["b.mp4", "c.mp3"] and probes == ["c.mp3"]
+    assert changed["b.mp4"]["thumbnailUrl"].endswith("/files/b.mp4.jpg")
+    assert sorted((v, media_id, e is None) for v, media_id, e in catalog.changes_since(1)) == [
+        (2, "a.mp4", True), (2, "b.mp4", False), (2, "c.mp3", False)]
+    assert catalog.changes_since(2) == [] and catalog.changes_since(3) is None
+
+
+def test_pages_filters_and_pending_entries(library, monkeypatch):
+    files_dir, _ = library
+    catalog = MediaCatalog(files_dir)
+    catalog.sync([{"id": "b.mp4", "type": "video", "uploadDate": 5000.0, "status": "processing"}])
+    page, cursor = catalog.items(limit=2)
+    # Newest first; the pending upload replaces the file of the same name
+    assert [(e["id"], e["status"]) for e in page] == [("b.mp4", "processing"), ("c.mp3", "ready")]
+    rest, end = catalog.items(cursor=cursor, limit=2)
+    assert [e["id"] for e in rest] == ["a.mp4"] and end is None
+    assert [e["id"] for e in catalog.items(types=["audio"])[0]] == ["c.mp3"]
+    with pytest.raises(ValueError):
+        catalog.items(cursor="not a cursor")
+
+    monkeypatch.setattr(media_catalog, "MEDIA_CATALOG_HISTORY", 1)
+    short = MediaCatalog(files_dir)
+    short.sync()
+    short.sync([{"id": "new.mp4", "type": "video", "uploadDate": 1.0, "status": "processing"}])
+    assert short.changes_since(1) == [(2, "new.mp4", short._entries["new.mp4"])]
+    short.sync()
+    # Only the last change is kept: a client at version 1 has to list again
+    assert short.changes_since(1) is None and short.changes_since(2) == [(3, "new.mp4", None)]
+
+
+def test_media_endpoint_pages_and_revalidates(library, monkeypatch):
+    import main
+    files_dir, probes = library
+    monkeypatch.setattr(main, "FILES_DIR", files_dir)
+    monkeypatch.setattr(main, "ingest_jobs", IngestManager(workers=1, followup_workers=1))
+    monkeypatch.setattr(proxies, "request_proxy", lambda path: None)
+    client = TestClient(main.app)
+
+    first = client.get("/media?limit=2")
+    assert [m["id"] for m in first.json()] == ["c.mp3", "b.mp4"]
+    second = client.get(f"/media?limit=2&cursor={first.headers['X-Next-Cursor']}")
+    assert [m["id"] for m in second.json()] == ["a.mp4"] and "X-Next-Cursor" not in second.headers
+    assert [m["id"] for m in client.get("/media?type=audio").json()] == ["c.mp3"]
+    assert client.get("/media?cursor=%25").status_code == 400
+
+    listing = client.get("/media")
+    etag = listing.headers["ETag"]
+    probes.clear()
+    assert client.get("/media", headers={"If-None-Match": etag}).status_code == 304
+    assert probes == []
+    os.remove(os.path.join(files_dir, "a.mp4"))
+    changed = client.get("/media", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert changed.headers["X-Media-Version"] != listing.headers["X-Media-Version"]
+    main.ingest_jobs.shutdown()
+
+
+def test_ingest_progress_is_not_a_catalog_change(library, monkeypatch):
+    import asyncio
+    import main
+    files_dir, _ = library
+    monkeypatch.setattr(main, "FILES_DIR", files_dir)
+    monkeypatch.setattr(proxies, "request_proxy", lambda path: None)
+    monkeypatch.setattr(main, "get_catalog", lambda directory: catalog)
+    catalog = MediaCatalog(files_dir)
+
+    class Upload:
+        created_at = 5000.0
+        progress = 0.25
+
+        def to_dict(self):
+            return {"id": "new.mp4", "filename": "new.mp4", "type": "video", "status": "processing",
+                    "progress": self.progress, "error": None}
+
+    upload = Upload()
+    monkeypatch.setattr(main.ingest_jobs, "pending", lambda: [upload])
+    asyncio.run(main._sync_media())
+    version = catalog.version
+    upload.progress = 0.5
+    asyncio.run(main._sync_media())
+    assert catalog.version == version and main._media_progress == {"new.mp4": 0.5}
+    assert "progress" not in catalog.items()[0][0]
+
+
+def test_one_sync_wakes_every_subscriber(monkeypatch):
+    import asyncio
+    import main
+    syncs = []
+
+    async def sync():
+        syncs.append(1)
+
+    monkeypatch.setattr(main, "_sync_media", sync)
+    monkeypatch.setattr(main, "MEDIA_WATCH_SECONDS", 0.01)
+
+    async def follow():
+        wakes = [main._subscribe_media() for _ in range(5)]
+        for _ in range(3):
+            await asyncio.gather(*(wake.wait() for wake in wakes))
+            for wake in wakes:
+                wake.clear()
+        watch = main._media_watch
+        main._media_subscribers.clear()
+        await asyncio.wait_for(watch, 1)
+
+    asyncio.run(follow())
+    # One sync per tick for all five subscribers, and the task stops once they are gone
+    assert 3 <= len(syncs) <= 4
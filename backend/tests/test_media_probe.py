@@ -0,0 +1,70 @@
+"""Tests for the cached ffprobe metadata index."""
+import os
+import sys
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import media_probe
+
+
+def test_parse_ffprobe_output_picks_primary_streams():
+    data = {
+        "format": {"duration": "12.5", "format_name": "mov,mp4,m4a,3gp,3g2,mj2"},
+        "streams": [
+            {"index": 0, "codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080, "avg_frame_rate": "30000/1001"},
+            {"index": 1, "codec_type": "audio", "codec_name": "aac", "sample_rate": "44100", "channels": 2},
+        ],
+    }
+    info = media_probe.parse_ffprobe_output(data)
+    assert info.duration == 12.5
+    assert info.video_codec == "h264"
+    assert (info.width, info.height) == (1920, 1080)
+    assert info.fps == 29.97
+    assert info.has_audio and info.audio_codec == "aac"
+    assert info.streams[1].sample_rate == 44100
+
+
+def test_parse_ffprobe_output_ignores_cover_art():
+    data = {
+        "format": {"duration": "3.0"},
+        "streams": [
+            {"index": 0, "codec_type": "audio", "codec_name": "mp3"},
+            {"index": 1, "codec_type": "video", "codec_name": "mjpeg", "disposition": {"attached_pic": 1}},
+        ],
+    }
+    info = media_probe.parse_ffprobe_output(data)
+    assert info.has_audio
+    assert not info.has_video
+
+
+def test_probe_is_cached_until_file_changes(tmp_path, monkeypatch, fixture_video):
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    calls = []
+    real_run = media_probe._run_ffprobe
+
+    def counting_run(path):
+        calls.append(path)
+        return real_run(path)
+
+    monkeypatch.setattr(media_probe, "_run_ffprobe", counting_run)
+
+    info = media_probe.probe_media(fixture_video)
+    assert info is not None and info.has_video and info.has_audio
+    assert abs(media_probe.get_duration_seconds(fixture_video) - 1.0) < 0.2
+    assert media_probe.has_audio_stream(fixture_video)
+    assert len(calls) == 1
+
+    # Touching the file invalidates its entry
+    st = os.stat(fixture_video)
+    os.utime(fixture_video, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    media_probe.probe_media(fixture_video)
+    assert len(calls) == 2
+
+
+def test_probe_missing_file_returns_none(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    assert media_probe.probe_media(str(tmp_path / "missing.mp4")) is None
+    assert media_probe.get_duration_seconds(str(tmp_path / "missing.mp4")) is None
+    assert not media_probe.has_audio_stream(str(tmp_path / "missing.mp4"))
@@ -0,0 +1,79 @@
+"""Tests for low-resolution editor proxies."""
+import os
+import subprocess
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import media_probe
+import proxies
+from proxies import generate_proxy, has_proxy, proxy_path
+
+
+@pytest.fixture
+def proxy_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / ".proxies")
+    monkeypatch.setattr(proxies, "PROXY_DIR", path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def hd_video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("proxy") / "master.mp4")
+    subprocess.run(
+        ["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=1920x1080:rate=30", "-f", "lavfi", "-i", "sine",
+         "-t", "2", "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", path],
+        check=True, capture_output=True, timeout=60,
+    )
+    return path
+
+
+def test_proxy_is_small_and_seekable(hd_video, proxy_dir):
+    assert not has_proxy(hd_video)
+    path = generate_proxy(hd_video)
+    assert path == os.path.join(proxy_dir, "master.mp4") and has_proxy(hd_video)
+    info = media_probe.probe_partial(path)
+    assert (info.width, info.height) == (640, 360) and info.has_audio
+    flags = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=flags", "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    keyframes = [i for i, flag in enumerate(flags) if "K" in flag]
+    assert keyframes == list(range(0, len(flags), proxies.PROXY_GOP))
+
+
+def test_small_media_is_not_upscaled(fixture_video, proxy_dir):
+    info = media_probe.probe_partial(generate_proxy(fixture_video))
+    assert (info.width, info.height) == (320, 240)
+
+
+def test_stale_proxy_is_replaced_and_concurrent_requests_share_one_encode(fixture_video, proxy_dir, monkeypatch):
+    os.makedirs(proxy_dir)
+    with open(proxy_path(fixture_video), "wb"):
+        pass
+    os.utime(proxy_path(fixture_video), (0, 0))
+    assert not has_proxy(fixture_video)
+
+    started, release, calls = threading.Event(), threading.Event(), []
+    real_run = proxies.run_ffmpeg
+
+    def slow_run(command, job=None):
+        calls.append(command)
+        started.set()
+        release.wait(10)
+        real_run(command, job=job)
+
+    monkeypatch.setattr(proxies, "run_ffmpeg", slow_run)
+    first = threading.Thread(target=generate_proxy, args=(fixture_video,))
+    first.start()
+    assert started.wait(10)
+    second = threading.Thread(target=generate_proxy, args=(fixture_video,))
+    second.start()
+    release.set()
+    first.join(30)
+    second.join(30)
+    assert len(calls) == 1
+    assert has_proxy(fixture_video) and os.path.getsize(proxy_path(fixture_video)) > 0
@@ -0,0 +1,145 @@
+"""Tests for the per-clip render cache used by timeline exports."""
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import media_probe
+import render_jobs
+import video_processor
+from render_cache import RenderCache, get_cache
+from video_processor import ClipData, render_timeline_clips
+
+
+def _probe(path, stream, entry):
+    return float(subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", stream, "-count_packets", "-show_entries", f"stream={entry}",
+         "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip())
+
+
+@pytest.fixture
+def render_dir(tmp_path, monkeypatch, fixture_video):
+    files_dir = str(tmp_path / "files")
+    os.makedirs(files_dir)
+    os.symlink(fixture_video, os.path.join(files_dir, "fixture.mp4"))
+    subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-t", "2",
+                    "-c:v", "libx264", "-preset", "ultrafast", os.path.join(files_dir, "silent.mp4")],
+                   check=True, capture_output=True, timeout=60)
+    monkeypatch.setattr(video_processor, "FILES_DIR", files_dir)
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(video_processor, "RENDER_CACHE", True)
+    monkeypatch.setattr(video_processor, "RENDER_CACHE_DIR", "")
+    renders = []
+    real_run = video_processor.run_ffmpeg
+
+    def counting_run(command, job=None, **kwargs):
+        if command[-1].endswith(".partial.mkv"):
+            renders.append(command)
+        real_run(command, job=job, **kwargs)
+
+    monkeypatch.setattr(video_processor, "run_ffmpeg", counting_run)
+    return files_dir, renders
+
+
+def test_reexport_renders_only_changed_clips(render_dir):
+    files_dir, renders = render_dir
+    clips = [
+        ClipData(filename="fixture.mp4", start=0.0, end=1.0, scale=1.2),
+        ClipData(filename="silent.mp4", start=0.5, end=1.7),
+    ]
+    job = render_jobs.RenderJob("export")
+    first = render_timeline_clips(clips, "first.mp4", job=job)
+    assert len(renders) == 2 and job.progress == pytest.approx(1.0)
+    output = os.path.join(files_dir, first)
+    assert _probe(output, "v:0", "nb_read_packets") == 66
+    assert _probe(output, "v:0", "duration") == pytest.approx(2.2, abs=0.01)
+    # The clip without audio is filled with silence, so audio spans the whole export
+    assert _probe(output, "a:0", "duration") == pytest.approx(2.2, abs=0.03)
+
+    renders.clear()
+    clips[1] = ClipData(filename="silent.mp4", start=0.5, end=1.5)
+    render_timeline_clips(clips + [clips[0]], "second.mp4")
+    assert len(renders) == 1 and "-ss 0.500000 -t 1.000000 -i" in " ".join(renders[0])
+    assert _probe(os.path.join(files_dir, "second.mp4"), "v:0", "nb_read_packets") == 90
+
+    # The cache lives out of the media listing and leaves no temp files behind
+    cache_dir = os.path.join(files_dir, ".render_cache")
+    assert len(os.listdir(cache_dir)) == 3
+    assert not [name for name in os.listdir(files_dir) if name.endswith(".ffconcat")]
+
+
+def test_per_clip_mode_matches_single_pass(render_dir, monkeypatch):
+    files_dir, _ = render_dir
+    clips = [
+        ClipData(filename="silent.mp4", start=0.2, end=1.4, rotation=15),
+        ClipData(filename="fixture.mp4", start=0.0, end=0.8, scale=1.2),
+    ]
+    render_timeline_clips(clips, "clips.mp4")
+    monkeypatch.setattr(video_processor, "RENDER_CACHE", False)
+    render_timeline_clips(clips, "single.mp4")
+    per_clip, single = os.path.join(files_dir, "clips.mp4"), os.path.join(files_dir, "single.mp4")
+    for stream, entry in [("v:0", "nb_read_packets"), ("v:0", "duration"), ("a:0", "duration")]:
+        assert _probe(per_clip, stream, entry) == pytest.approx(_probe(single, stream, entry), abs=0.03)
+    # Compared frame by frame: the intermediates keep millisecond timestamps, so frame times differ slightly
+    psnr = subprocess.run(["ffmpeg", "-i", per_clip, "-i", single, "-lavfi",
+                           "[0:v]settb=1/30,setpts=N[a];[1:v]settb=1/30,setpts=N[b];[a][b]psnr", "-f", "null", "-"],
+                          capture_output=True, text=True, check=True).stderr
+    assert float(psnr.split("average:")[1].split()[0]) > 45
+
+
+def test_cache_disabled_renders_in_one_pass(render_dir, monkeypatch):
+    files_dir, renders = render_dir
+    monkeypatch.setattr(video_processor, "RENDER_CACHE", False)
+    render_timeline_clips([ClipData(filename="fixture.mp4", start=0.0, end=1.0, scale=1.2)], "plain.mp4")
+    assert renders == [] and not os.path.exists(os.path.join(files_dir, ".render_cache"))
+
+
+def test_cache_off_hashes_nothing_even_with_cached_clips(render_dir, monkeypatch):
+    files_dir, renders = render_dir
+    clips = [ClipData(filename="fixture.mp4", start=0.0, end=1.0, scale=1.2)]
+    render_timeline_clips(clips, "cached.mp4")
+    monkeypatch.setattr(video_processor, "RENDER_CACHE", False)
+    digests = []
+    monkeypatch.setattr(media_probe, "content_digest", lambda path: digests.append(path))
+    commands = []
+    counting_run = video_processor.run_ffmpeg
+    monkeypatch.setattr(video_processor, "run_ffmpeg", lambda command, **kw: commands.append(command) or counting_run(command, **kw))
+
+    # The clip's intermediate is cached, but with the cache off the export is one pass over the source
+    render_timeline_clips(clips, "plain.mp4")
+    assert digests == [] and len(commands) == 1 and "concat" not in commands[0] and len(renders) == 1
+
+
+def test_parallel_mode_without_cache_leaves_no_intermediates(render_dir, monkeypatch):
+    files_dir, _ = render_dir
+    monkeypatch.setattr(video_processor, "RENDER_CACHE", False)
+    monkeypatch.setattr(video_processor, "CLIP_RENDER_PARALLEL", True)
+    monkeypatch.setattr(video_processor, "CLIP_RENDER_WORKERS", 2)
+    commands = []
+    counting_run = video_processor.run_ffmpeg
+    monkeypatch.setattr(video_processor, "run_ffmpeg", lambda command, **kw: commands.append(command) or counting_run(command, **kw))
+    clips = [ClipData(filename="fixture.mp4", start=0.0, end=1.0, scale=1.2), ClipData(filename="silent.mp4", start=0.5, end=1.7)]
+    render_timeline_clips(clips, "parallel.mp4")
+    # Two clip renders, then the join
+    assert len(commands) == 3 and "concat" in commands[-1]
+    assert _probe(os.path.join(files_dir, "parallel.mp4"), "v:0", "nb_read_packets") == 66
+    assert sorted(os.listdir(files_dir)) == ["fixture.mp4", "parallel.mp4", "silent.mp4"]
+
+
+def test_eviction_drops_least_recently_used_unpinned_entries(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=250)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.store(key, lambda tmp: open(tmp, "wb").write(b"x" * 100))
+        os.utime(cache.path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    assert cache.lookup("a") is not None
+    with cache.pin(["b"]):
+        assert cache.evict() == 100
+    assert cache.lookup("a") and cache.lookup("b") and cache.lookup("c") is None
+    assert cache.lookup("missing") is None
+    assert get_cache(str(tmp_path)) is get_cache(str(tmp_path) + "/")
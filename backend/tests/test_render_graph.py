@@ -0,0 +1,100 @@
+"""Tests for the render description and its filter graph compiler (no ffmpeg needed)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import render_graph
+from render_graph import (
+    Clip, Crop, Filter, Fps, Pad, Render, Rotate, Scale, SetSar, Track, compile_render, looped_clips, optimize_steps,
+    shared_inputs,
+)
+
+
+def test_optimize_drops_identity_steps():
+    steps = [Scale(w=640, h=360), Crop(w=640, h=360), Rotate(angle=0), Pad(w=640, h=360), SetSar(), SetSar(), Fps(rate=30)]
+    optimized, size = optimize_steps(steps, (640, 360))
+    assert optimized == [SetSar(), Fps(rate=30)] and size == (640, 360)
+    # Without a known input size the scale stays, but it makes the crop and pad after it identities
+    assert optimize_steps(steps)[0] == [Scale(w=640, h=360), SetSar(), Fps(rate=30)]
+
+
+def test_optimize_merges_consecutive_scalers():
+    steps = [Scale(w=1080, h=1920, fit="increase"), Scale(w="iw*1.5", h="-1"), Crop(w=1080, h=1920)]
+    optimized, size = optimize_steps(steps, (1280, 720))
+    # 1280x720 fills 1080x1920 at 3413x1920 (truncated, as ffmpeg does), then 1.5x
+    assert optimized == [Scale(w=5119, h=2880), Crop(w=1080, h=1920)] and size == (1080, 1920)
+    # A scale back to the source size disappears entirely
+    assert optimize_steps([Scale(w=320, h=180), Scale(w=640, h=-1)], (640, 360)) == ([], (640, 360))
+
+
+def test_shared_inputs_group_nearby_sequential_ranges():
+    clips = [Clip(path=p, start=s, end=e) for p, (s, e) in zip(
+        ["a", "a", "a", "b", "a", "a"], [(1, 2), (3, 4), (20, 21), (0, 1), (5, 6), (4, 5)])]
+    assert shared_inputs(clips) == [(1, 4, [0, 1]), (20, 21, [2]), (0, 1, [3]), (5, 6, [4]), (4, 5, [5])]
+
+
+def test_looped_clips_repeat_clips_to_fill_the_track():
+    a, b = Clip(path="a", start=1.0, end=2.0), Clip(path="b", start=0.0, end=0.5)
+    assert [(c.path, c.start, c.end) for c in looped_clips([a, b], 3.2)] == [
+        ("a", 1.0, 2.0), ("b", 0.0, 0.5), ("a", 1.0, 2.0), ("b", 0.0, 0.5), ("a", 1.0, pytest.approx(1.2))]
+    with pytest.raises(ValueError):
+        looped_clips([Clip(path="a", start=1.0, end=1.0)], 3.0)
+
+
+def test_shared_source_is_decoded_once_and_split():
+    clips = [Clip(path="a.mp4", start=1.0, end=2.0), Clip(path="a.mp4", start=2.5, end=3.0, has_audio=False)]
+    graph = compile_render(Render(tracks=[Track(clips=clips)]))
+    assert graph.inputs[:7] == ["-ss", "1.000000", "-t", "2.000000", "-i", "a.mp4", "-f"]
+    assert graph.filters[0].startswith("[0:v]split=2")
+    assert "trim=start=1.5:end=2.0" in graph.filter_complex
+    # The clip without audio is filled with generated silence
+    assert "[1:a]anull" in graph.filter_complex and graph.duration == pytest.approx(1.5)
+
+
+def test_single_clip_skips_concat_and_takes_track_steps():
+    clip = Clip(path="a.mp4", end=2.0, video=[Scale(w=1080, h=1920)], size=(640, 360))
+    graph = compile_render(Render(tracks=[Track(clips=[clip], video=[Scale(w=540, h=960), Filter(expr="hflip")])]))
+    assert graph.filters == ["[0:v]setpts=PTS-STARTPTS,scale=540:960,hflip[outv]", "[0:a]asetpts=PTS-STARTPTS[outa]"]
+    command = graph.command("out.mp4", ["-c:v", "libx264"], options=["-threads", "2"])
+    assert command[:4] == ["ffmpeg", "-y", "-threads", "2"] and command[-3:] == ["-c:v", "libx264", "out.mp4"]
+    assert "-map" in command and "[outa]" in command
+
+
+def test_tracks_are_stacked_and_mixed_with_music():
+    top = Track(clips=[Clip(path="a.mp4", end=1.0), Clip(path="b.mp4", end=1.0)])
+    bottom = Track(clips=[Clip(path="c.mp4", end=0.5)], loop_to=2.0)
+    graph = compile_render(Render(tracks=[top, bottom], music=[Track(clips=[Clip(path="m.mp3", end=2.0)])]))
+    assert any(f.endswith("vstack=inputs=2[outv]") for f in graph.filters)
+    assert graph.filters[-1].endswith("amix=inputs=3[outa]")
+    # The looped bottom track reads its source once and repeats it three more times
+    assert graph.inputs.count("c.mp4") == 1 and graph.duration == pytest.approx(2.0)
+    assert "loop=loop=3:" in graph.filter_complex and "aloop=loop=3:" in graph.filter_complex
+    silent = compile_render(Render(tracks=[top], audio=False))
+    assert "[outa]" not in silent.filter_complex and silent.filters[-1].endswith("concat=n=2:v=1:a=0[outv]")
+
+
+def test_long_loop_keeps_one_input_per_clip():
+    top = Track(clips=[Clip(path="a.mp4", end=2.0, video=[Fps(rate=30)])], video=[Scale(w="iw*2", h="-1")], loop_to=600.0)
+    bottom = Track(clips=[Clip(path="b.mp4", end=300.0), Clip(path="c.mp4", start=5.0, end=305.0)])
+    graph = compile_render(Render(tracks=[top, bottom]))
+    assert graph.inputs.count("-i") == 3 and graph.duration == pytest.approx(600.0)
+    # One 2 s pass (at most 61 frames at 30 fps) repeated 299 times, then the track's own steps
+    assert "loop=loop=299:size=61:start=0,trim=duration=600.000000,scale=iw*2:-1[t" in graph.filter_complex
+    # A pass too long for the loop filter to hold falls back to one input per repeat
+    long_pass = Track(clips=[Clip(path="a.mp4", end=300.0)], loop_to=700.0)
+    assert compile_render(Render(tracks=[long_pass])).inputs.count("-i") == 3
+
+
+def test_loop_too_large_to_hold_gets_one_input_per_repeat(monkeypatch):
+    # 20 s of 1080x960 frames at 30 fps is about 940 MB of decoded frames
+    clip = Clip(path="a.mp4", end=20.0, video=[Scale(w=1080, h=960), Fps(rate=30)])
+    track = Track(clips=[clip], loop_to=100.0)
+    graph = compile_render(Render(tracks=[track]))
+    assert graph.inputs.count("-i") == 5 and "loop=" not in graph.filter_complex
+    assert graph.duration == pytest.approx(100.0)
+    monkeypatch.setattr(render_graph, "LOOP_MAX_BYTES", 2 * 1024 ** 3)
+    held = compile_render(Render(tracks=[track]))
+    assert held.inputs.count("-i") == 1 and "loop=loop=4:size=601:" in held.filter_complex
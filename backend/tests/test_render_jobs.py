@@ -0,0 +1,196 @@
+"""Tests for the background render job manager (no ffmpeg needed)."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import render_jobs
+from render_jobs import CANCELLED, DONE, FAILED, RenderCancelled, RenderJob, RenderJobManager, _parse_progress_line, run_ffmpeg, run_parallel
+
+
+def test_parse_progress_line():
+    assert _parse_progress_line("out_time_us=2500000\n") == 2.5
+    assert _parse_progress_line("out_time_ms=1000000") == 1.0
+    assert _parse_progress_line("out_time_us=N/A") is None
+    assert _parse_progress_line("progress=continue") is None
+
+
+def test_job_runs_and_reports_output():
+    manager = RenderJobManager(max_workers=1)
+    job = manager.submit("timeline", lambda j: "out.mp4", download_name="out.mp4")
+    job.future.result(timeout=5)
+    assert job.status == DONE
+    assert job.progress == 1.0
+    assert job.to_dict()["output_filename"] == "out.mp4"
+    assert manager.get(job.id) is job
+    manager.shutdown()
+
+
+def test_job_failure_is_recorded():
+    def boom(job):
+        raise ValueError("bad clip")
+
+    manager = RenderJobManager(max_workers=1)
+    job = manager.submit("timeline", boom)
+    job.future.result(timeout=5)
+    assert job.status == FAILED
+    assert job.error == "bad clip"
+    manager.shutdown()
+
+
+def test_cancel_queued_and_running_jobs():
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking(job):
+        started.set()
+        release.wait(5)
+        job.check_cancelled()
+        return "never.mp4"
+
+    manager = RenderJobManager(max_workers=1)
+    running = manager.submit("timeline", blocking)
+    queued = manager.submit("timeline", lambda j: "queued.mp4")
+    assert started.wait(5)
+
+    assert queued.cancel()
+    assert queued.status == CANCELLED
+
+    assert running.cancel()
+    release.set()
+    running.future.result(timeout=5)
+    assert running.status == CANCELLED
+    assert not running.cancel()
+    manager.shutdown()
+
+
+def test_check_cancelled_raises():
+    manager = RenderJobManager(max_workers=1)
+    job = manager.submit("timeline", lambda j: "x.mp4")
+    job.future.result(timeout=5)
+    job._cancelled.set()
+    with pytest.raises(RenderCancelled):
+        job.check_cancelled()
+    manager.shutdown()
+
+
+def test_dependent_job_waits_and_fails_with_its_parent():
+    release = threading.Event()
+    manager = RenderJobManager(max_workers=2)
+    parent = manager.submit("normalize", lambda j: release.wait(5) and "clip.mp4")
+    child = manager.submit("thumbnail", lambda j: "clip.mp4.jpg", after=parent)
+    assert child.future is None and child.status == "queued"
+    assert child.to_dict()["depends_on"] == parent.id
+    release.set()
+    parent.future.result(timeout=5)
+    child_done = threading.Event()
+    child.add_done_callback(lambda j: child_done.set())
+    assert child_done.wait(5) and child.status == DONE
+
+    def boom(job):
+        raise ValueError("bad input")
+
+    failed = manager.submit("normalize", boom)
+    orphan = manager.submit("thumbnail", lambda j: "never.jpg", after=failed)
+    failed.future.result(timeout=5)
+    assert orphan.status == FAILED and orphan.error == "normalize job failed"
+
+    waiting = manager.submit("thumbnail", lambda j: "never.jpg", after=manager.submit("normalize", lambda j: release.wait(5)))
+    assert waiting.cancel() and waiting.status == CANCELLED
+    manager.shutdown()
+
+
+def test_run_parallel_reports_weighted_progress_and_cancels_on_failure():
+    job = RenderJob("export")
+    run_parallel([(lambda sub: sub.set_progress(1.0), 1.0), (lambda sub: sub.set_progress(1.0), 3.0)], 2, job=job, weight=0.5, offset=0.25)
+    assert job.progress == pytest.approx(0.75)
+
+    seen = []
+
+    def fail(sub):
+        raise ValueError("boom")
+
+    def wait_for_cancel(sub):
+        for _ in range(100):
+            if sub.cancelled:
+                seen.append("cancelled")
+                return
+            threading.Event().wait(0.05)
+
+    with pytest.raises(ValueError, match="boom"):
+        run_parallel([(wait_for_cancel, 1.0), (fail, 1.0)], 2)
+    assert seen == ["cancelled"]
+
+
+def test_client_disconnect_cancels_queued_render():
+    import asyncio
+    import main
+
+    release = threading.Event()
+    manager = RenderJobManager(max_workers=1)
+    running = manager.submit("timeline", lambda j: release.wait(5) and "first.mp4")
+    queued = manager.submit("timeline", lambda j: "second.mp4")
+
+    async def disconnect():
+        waiting = asyncio.ensure_future(main._await_render(queued))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(disconnect())
+    # The job that never started is reported as cancelled instead of staying queued
+    assert queued.status == CANCELLED
+    release.set()
+    running.future.result(timeout=5)
+    manager.shutdown()
+
+
+@pytest.fixture
+def slow_ffmpeg(tmp_path):
+    """Stands in for an ffmpeg that runs for 5 seconds, whatever its arguments."""
+    path = tmp_path / "ffmpeg"
+    path.write_text("#!/bin/sh\nexec sleep 5\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_cancel_while_ffmpeg_starts_kills_it(slow_ffmpeg, monkeypatch):
+    job = RenderJob("export")
+    real_popen = subprocess.Popen
+
+    def popen_then_cancel(*args, **kwargs):
+        process = real_popen(*args, **kwargs)
+        job.cancel()
+        return process
+
+    monkeypatch.setattr(render_jobs.subprocess, "Popen", popen_then_cancel)
+    start = time.monotonic()
+    with pytest.raises(RenderCancelled):
+        run_ffmpeg([slow_ffmpeg], job=job)
+    assert time.monotonic() - start < 2
+
+
+def test_failure_or_cancel_kills_the_other_parallel_ffmpegs(slow_ffmpeg):
+    def fail(sub):
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    start = time.monotonic()
+    with pytest.raises(ValueError, match="boom"):
+        run_parallel([(lambda sub: run_ffmpeg([slow_ffmpeg], job=sub), 1.0)] * 2 + [(fail, 1.0)], 3)
+    assert time.monotonic() - start < 2
+
+    job = RenderJob("export")
+    threading.Timer(0.2, job.cancel).start()
+    start = time.monotonic()
+    with pytest.raises(RenderCancelled):
+        run_parallel([(lambda sub: run_ffmpeg([slow_ffmpeg], job=sub), 1.0)] * 2, 2, job=job)
+    assert time.monotonic() - start < 2
@@ -0,0 +1,69 @@
+"""Tests for the single-pass timeline render (input seeking, shared inputs)."""
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import media_probe
+import video_processor
+from video_processor import ClipData, render_timeline_clips
+
+
+def _frame_hashes(path):
+    out = subprocess.run(["ffmpeg", "-v", "error", "-i", path, "-map", "0:v:0", "-f", "framemd5", "-"],
+                         capture_output=True, text=True, check=True).stdout
+    return [line.split(",")[-1].strip() for line in out.splitlines() if not line.startswith("#")]
+
+
+@pytest.fixture
+def render_dir(tmp_path, monkeypatch):
+    files_dir = str(tmp_path / "files")
+    os.makedirs(files_dir)
+    subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=30", "-f", "lavfi", "-i", "sine",
+                    "-t", "12", "-c:v", "libx264", "-preset", "ultrafast", "-g", "90", "-c:a", "aac",
+                    os.path.join(files_dir, "long.mp4")],
+                   check=True, capture_output=True, timeout=60)
+    monkeypatch.setattr(video_processor, "FILES_DIR", files_dir)
+    monkeypatch.setattr(video_processor, "RENDER_CACHE", False)
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    commands = []
+    real_run = video_processor.run_ffmpeg
+
+    def recording_run(command, job=None, **kwargs):
+        commands.append(command)
+        real_run(command, job=job, **kwargs)
+
+    monkeypatch.setattr(video_processor, "run_ffmpeg", recording_run)
+    return files_dir, commands
+
+
+def test_seeked_render_matches_full_decode(render_dir):
+    files_dir, commands = render_dir
+    clips = [
+        ClipData(filename="long.mp4", start=7.0, end=8.0, scale=1.5),
+        ClipData(filename="long.mp4", start=9.0, end=10.0, position_x=10),
+        ClipData(filename="long.mp4", start=2.0, end=3.0, scale=1.5),
+    ]
+    render_timeline_clips(clips, "seeked.mp4")
+    command = commands[-1]
+    # Two inputs: the first two clips share one seeked to 7 s, the third seeks on its own
+    assert [command[i + 1] for i, arg in enumerate(command) if arg == "-ss"] == ["7.000000", "2.000000"]
+    assert command.count("-i") == 2
+
+    # Reference: every clip decoded from the start of the source and trimmed in the filter graph
+    source = os.path.join(files_dir, "long.mp4")
+    graph = "".join(f"[{i}:v]trim=start={c.start}:end={c.end},setpts=PTS-STARTPTS,"
+                    + ",".join(step.text() for step in video_processor._clip_steps(c))
+                    + f"[v{i}];[{i}:a]atrim=start={c.start}:end={c.end},asetpts=PTS-STARTPTS[a{i}];"
+                    for i, c in enumerate(clips))
+    reference = os.path.join(files_dir, "reference.mp4")
+    subprocess.run(["ffmpeg", "-y", "-i", source, "-i", source, "-i", source, "-filter_complex",
+                    graph + "[v0][a0][v1][a1][v2][a2]concat=n=3:v=1:a=1[outv][outa]", "-map", "[outv]", "-map", "[outa]",
+                    "-c:v", "libx264", "-crf", "23", "-preset", "fast", "-c:a", "aac", "-b:a", "192k", reference],
+                   check=True, capture_output=True, timeout=120)
+    seeked = _frame_hashes(os.path.join(files_dir, "seeked.mp4"))
+    assert len(seeked) == 90
+    assert seeked == _frame_hashes(reference)
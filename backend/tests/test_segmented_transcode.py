@@ -0,0 +1,99 @@
+"""Tests for segmented (parallel) transcoding."""
+import os
+import signal
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import render_jobs
+import segmented_transcode
+from segmented_transcode import keyframe_times, plan_segments, transcode_segmented
+
+# Lossless, so segmented and single-pass output can be compared frame by frame
+_VIDEO_ARGS = ["-vf", "scale=320:180", "-c:v", "libx264", "-preset", "ultrafast", "-qp", "0"]
+_AUDIO_ARGS = ["-c:a", "aac", "-b:a", "64k", "-ar", "44100"]
+
+
+def _frame_hashes(path):
+    out = subprocess.run(["ffmpeg", "-v", "error", "-i", path, "-map", "0:v:0", "-f", "framemd5", "-"],
+                         capture_output=True, text=True, check=True).stdout
+    return [line.split(",")[-1].strip() for line in out.splitlines() if not line.startswith("#")]
+
+
+def _probe(path, stream, entry):
+    return float(subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", stream, "-count_packets", "-show_entries", f"stream={entry}",
+         "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip())
+
+
+@pytest.fixture(scope="module")
+def long_source(tmp_path_factory):
+    """6 s at 25 fps (not the output rate), keyframe every second, with audio."""
+    path = str(tmp_path_factory.mktemp("segmented") / "source.mkv")
+    subprocess.run(
+        ["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-f", "lavfi", "-i", "sine=sample_rate=48000",
+         "-t", "6", "-c:v", "libx264", "-preset", "ultrafast", "-g", "25", "-keyint_min", "25", "-sc_threshold", "0",
+         "-c:a", "aac", path],
+        check=True, capture_output=True, timeout=60,
+    )
+    return path
+
+
+def test_plan_segments_starts_on_keyframes():
+    keyframes = [0.0, 2.0, 4.1, 6.0, 8.0, 9.9]
+    assert plan_segments(keyframes, 10.0, 30.0, 4.0) == [(0.0, 0, 123), (4.1, 123, 117), (8.0, 240, None)]
+    # Short sources stay in one piece
+    assert plan_segments([0.0, 1.0], 3.0, 30.0, 60.0) == [(0.0, 0, None)]
+
+
+def test_segments_join_in_sync(long_source, tmp_path, monkeypatch):
+    monkeypatch.setattr(segmented_transcode, "SEGMENT_SECONDS", 1.5)
+    monkeypatch.setattr(segmented_transcode, "SEGMENT_WORKERS", 2)
+    # Relative to the file start, which the AAC priming puts slightly before the first video frame
+    keyframes = keyframe_times(long_source)
+    assert len(keyframes) == 6 and keyframes[1] - keyframes[0] == pytest.approx(1.0)
+    output = str(tmp_path / "segmented.mp4")
+    assert transcode_segmented(long_source, output, 6.0, 30.0, True, _VIDEO_ARGS, _AUDIO_ARGS) == 4
+
+    single = str(tmp_path / "single.mp4")
+    subprocess.run(["ffmpeg", "-y", "-i", long_source, "-r", "30"] + _VIDEO_ARGS + _AUDIO_ARGS + [single],
+                   check=True, capture_output=True, timeout=60)
+    assert _probe(output, "v:0", "nb_read_packets") == _probe(single, "v:0", "nb_read_packets") == 180
+    assert _probe(output, "v:0", "duration") == pytest.approx(6.0, abs=0.01)
+    # The same source frame lands on every output frame, including the first one after each join
+    assert _frame_hashes(output) == _frame_hashes(single)
+    assert _probe(output, "a:0", "duration") == pytest.approx(_probe(single, "a:0", "duration"), abs=0.01)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".segments_")]
+
+
+def test_failed_segment_kills_the_running_segments(long_source, tmp_path, monkeypatch):
+    monkeypatch.setattr(segmented_transcode, "SEGMENT_SECONDS", 1.5)
+    monkeypatch.setattr(segmented_transcode, "SEGMENT_WORKERS", 4)
+    processes = []
+    real_popen = subprocess.Popen
+    monkeypatch.setattr(render_jobs.subprocess, "Popen", lambda *a, **kw: processes.append(real_popen(*a, **kw)) or processes[-1])
+    real_run = segmented_transcode.run_ffmpeg
+
+    def run(command, job=None, duration=None, **kwargs):
+        if command[-1].endswith("segment00000.mp4"):
+            time.sleep(0.5)
+            command = ["ffmpeg", "-v", "error", "-i", str(tmp_path / "missing.mkv"), "-f", "null", "-"]
+        else:
+            # Segments that would still be encoding 30 s later
+            command = ["ffmpeg", "-re", "-f", "lavfi", "-i", "anullsrc", "-t", "30", "-f", "null", "-"]
+        real_run(command, job, duration, **kwargs)
+
+    monkeypatch.setattr(segmented_transcode, "run_ffmpeg", run)
+    start = time.monotonic()
+    with pytest.raises(subprocess.CalledProcessError):
+        transcode_segmented(long_source, str(tmp_path / "out.mp4"), 6.0, 30.0, True, _VIDEO_ARGS, _AUDIO_ARGS)
+    assert time.monotonic() - start < 5
+    running = [p for p in processes if "anullsrc" in p.args]
+    # The other three workers' encodes, plus any that started as the failed one freed its worker
+    assert len(running) >= 3 and all(p.wait(timeout=5) == -signal.SIGKILL for p in running)
@@ -0,0 +1,98 @@
+"""Tests for smart render (GOP stream copy with re-encoded boundaries)."""
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import media_probe
+import smart_render
+from smart_render import Piece, index_source, parse_source_index, plan_pieces, plan_render
+
+
+def _probe(stream: dict, packets: list) -> dict:
+    base = {"codec_name": "h264", "pix_fmt": "yuv420p", "width": 1080, "height": 1920,
+            "r_frame_rate": "30/1", "avg_frame_rate": "30/1", "time_base": "1/15360", "sample_aspect_ratio": "1:1"}
+    return {"streams": [dict(base, **stream)], "packets": packets}
+
+
+def _packets(keyframes, frames):
+    return [{"pts": str(i * 512), "dts": str((i - 2) * 512), "flags": "K__" if i in keyframes else "___"} for i in range(frames)]
+
+
+@pytest.fixture(scope="module")
+def gop_video(tmp_path_factory):
+    """6 s, 30 fps, keyframe every 30 frames, with audio."""
+    path = str(tmp_path_factory.mktemp("smart") / "gop.mp4")
+    subprocess.run(
+        ["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=30",
+         "-f", "lavfi", "-i", "sine=sample_rate=44100", "-t", "6",
+         "-c:v", "libx264", "-preset", "fast", "-g", "30", "-keyint_min", "30", "-sc_threshold", "0",
+         "-c:a", "aac", "-shortest", path],
+        check=True, capture_output=True, timeout=60,
+    )
+    return path
+
+
+def test_plan_pieces_copies_whole_gops_only():
+    keyframes = [0, 30, 60, 90, 120]
+    assert plan_pieces("a", 10, 100, keyframes) == [
+        Piece(source="a", start=10, end=30, copy_gops=False),
+        Piece(source="a", start=30, end=90, copy_gops=True),
+        Piece(source="a", start=90, end=100, copy_gops=False),
+    ]
+    assert plan_pieces("a", 30, 60, keyframes) == [Piece(source="a", start=30, end=60, copy_gops=True)]
+    # Less than one whole GOP: nothing to copy
+    assert plan_pieces("a", 35, 80, keyframes) == [Piece(source="a", start=35, end=80, copy_gops=False)]
+
+
+def test_parse_source_index_reads_keyframes():
+    index = parse_source_index("x.mp4", _probe({}, _packets({0, 30, 60}, 90)))
+    assert index.keyframes == [0, 30, 60]
+    assert index.frames == 90
+    assert index.keyframe_dts[1] == pytest.approx(28 / 30)
+
+
+@pytest.mark.parametrize("stream", [
+    {"codec_name": "hevc"},
+    {"pix_fmt": "yuv444p"},
+    {"avg_frame_rate": "2997/100"},  # variable frame rate
+])
+def test_parse_source_index_rejects_unsafe_streams(stream):
+    assert parse_source_index("x.mp4", _probe(stream, _packets({0, 30}, 60))) is None
+
+
+def test_parse_source_index_needs_keyframe_at_start():
+    assert parse_source_index("x.mp4", _probe({}, _packets({30}, 60))) is None
+
+
+def test_plan_render_falls_back_when_little_can_be_copied(gop_video, monkeypatch):
+    assert plan_render([(gop_video, 0.1, 0.9), (gop_video, 2.1, 2.8)]) is None
+    assert plan_render([(gop_video, 0.5, 5.5)], width=1080, height=1920) is None
+    monkeypatch.setattr(smart_render, "SMART_RENDER", False)
+    assert plan_render([(gop_video, 0.0, 6.0)]) is None
+
+
+def test_smart_render_is_frame_exact(gop_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    assert index_source(gop_video).keyframes == [0, 30, 60, 90, 120, 150]
+    output = str(tmp_path / "out.mp4")
+    ranges = [(gop_video, 0.5, 3.5), (gop_video, 4.0, 6.0)]
+    pieces, _ = plan_render(ranges)
+    assert [p.copy_gops for p in pieces] == [False, True, False, True]
+    assert smart_render.smart_render(ranges, output)
+
+    probe = json.loads(subprocess.run(
+        ["ffprobe", "-v", "error", "-count_packets", "-show_entries", "stream=codec_type,nb_read_packets,duration",
+         "-of", "json", output],
+        capture_output=True, text=True, check=True,
+    ).stdout)
+    streams = {s["codec_type"]: s for s in probe["streams"]}
+    assert int(streams["video"]["nb_read_packets"]) == 150
+    assert float(streams["video"]["duration"]) == pytest.approx(5.0, abs=0.01)
+    assert float(streams["audio"]["duration"]) == pytest.approx(5.0, abs=0.03)
+    decode = subprocess.run(["ffmpeg", "-v", "error", "-i", output, "-f", "null", "-"], capture_output=True, text=True)
+    assert decode.returncode == 0 and decode.stderr == ""
@@ -0,0 +1,71 @@
+"""Tests for the one-pass split-screen render."""
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import media_probe
+import video_processor
+from video_processor import ClipData, SplitTimelineRequest, render_split_timeline_clips
+
+
+def _probe(path, stream, entry):
+    return subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", stream, "-show_entries", f"stream={entry}", "-of", "csv=p=0", path],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def split_dir(tmp_path, monkeypatch):
+    files_dir = str(tmp_path / "files")
+    os.makedirs(files_dir)
+    for name, extra in [("talk.mp4", ["-f", "lavfi", "-i", "sine", "-c:a", "aac"]), ("gameplay.mp4", [])]:
+        subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc2=size=640x360:rate=30"] + extra
+                       + ["-t", "3", "-c:v", "libx264", "-preset", "ultrafast", os.path.join(files_dir, name)],
+                       check=True, capture_output=True, timeout=60)
+    subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "sine=frequency=220", "-t", "3", os.path.join(files_dir, "bgm.mp3")],
+                   check=True, capture_output=True, timeout=60)
+    monkeypatch.setattr(video_processor, "FILES_DIR", files_dir)
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    commands = []
+    real_run = video_processor.run_ffmpeg
+
+    def recording_run(command, job=None, **kwargs):
+        commands.append(command)
+        real_run(command, job=job, **kwargs)
+
+    monkeypatch.setattr(video_processor, "run_ffmpeg", recording_run)
+    return files_dir, commands
+
+
+def test_split_screen_renders_in_one_pass(split_dir):
+    files_dir, commands = split_dir
+    request = SplitTimelineRequest(
+        top_clips=[ClipData(filename="talk.mp4", start=0.0, end=1.5), ClipData(filename="talk.mp4", start=2.0, end=3.0)],
+        # Shorter and without audio: looped under the top track, with silence
+        bottom_clips=[ClipData(filename="gameplay.mp4", start=1.0, end=2.0)],
+        audio_clips=[ClipData(filename="bgm.mp3", start=0.0, end=2.0)],
+        top_zoom=1.2, top_pan_y=10, bottom_zoom=0.8,
+    )
+    output = render_split_timeline_clips(request, "split.mp4")
+    assert output == "split.mp4" and len(commands) == 1
+    path = os.path.join(files_dir, output)
+    assert _probe(path, "v:0", "width,height") == "1080,1920"
+    assert float(_probe(path, "v:0", "duration")) == pytest.approx(2.5, abs=0.05)
+    assert float(_probe(path, "a:0", "duration")) == pytest.approx(2.5, abs=0.05)
+    assert sorted(os.listdir(files_dir)) == ["bgm.mp3", "gameplay.mp4", "split.mp4", "talk.mp4"]
+
+
+def test_empty_track_is_black(split_dir):
+    files_dir, _ = split_dir
+    request = SplitTimelineRequest(top_clips=[ClipData(filename="talk.mp4", start=0.0, end=1.0)], bottom_clips=[])
+    path = os.path.join(files_dir, render_split_timeline_clips(request, "half.mp4"))
+    # Bottom half of the frame is the black filler
+    out = subprocess.run(["ffmpeg", "-i", path, "-vf", "crop=1080:960:0:960,signalstats,metadata=print:key=lavfi.signalstats.YMAX",
+                          "-frames:v", "1", "-f", "null", "-"], capture_output=True, text=True, check=True).stderr
+    assert int(float(out.split("lavfi.signalstats.YMAX=")[1].split()[0])) <= 16
+    assert float(_probe(path, "v:0", "duration")) == pytest.approx(5.0, abs=0.05)
@@ -0,0 +1,73 @@
+"""Tests for the thumbnail queue (deduplication, batching, negative cache)."""
+import os
+import shutil
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import media_probe
+import thumbnails
+from thumbnails import generate_thumbnail, has_thumbnail, request_thumbnail, thumbnail_path
+
+
+@pytest.fixture
+def videos(tmp_path, fixture_video, monkeypatch):
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(thumbnails, "_failed", {})
+    paths = []
+    for name in ["a.mp4", "b.mp4", "c.mp4"]:
+        paths.append(str(tmp_path / name))
+        shutil.copy(fixture_video, paths[-1])
+    broken = str(tmp_path / "broken.mp4")
+    with open(broken, "wb") as f:
+        f.write(b"not a video")
+    commands = []
+    real_command = thumbnails.snapshot_command
+
+    def recording_command(video_paths):
+        commands.append([os.path.basename(p) for p in video_paths])
+        return real_command(video_paths)
+
+    monkeypatch.setattr(thumbnails, "snapshot_command", recording_command)
+    return paths, broken, commands
+
+
+def test_queued_requests_are_batched_and_deduplicated(videos, monkeypatch):
+    paths, broken, commands = videos
+    started, release = threading.Event(), threading.Event()
+    real_run = thumbnails._run_batch
+
+    def gated_run(video_paths):
+        started.set()
+        release.wait(10)
+        return real_run(video_paths)
+
+    monkeypatch.setattr(thumbnails, "_run_batch", gated_run)
+    first = request_thumbnail(paths[0])
+    assert started.wait(10)
+    # While the first file is being made, the others queue up; repeated requests share one entry
+    events = [request_thumbnail(path) for path in paths[1:] + [broken] + paths[1:]]
+    assert request_thumbnail(paths[0]) is first and events[0] is events[3]
+    release.set()
+    assert generate_thumbnail(paths[2]) == thumbnail_path(paths[2])
+    for event in [first] + events:
+        assert event.wait(30)
+
+    # One run for the first file, one for the queued batch, then the failed batch retried file by file
+    assert commands == [["a.mp4"], ["b.mp4", "c.mp4", "broken.mp4"], ["b.mp4"], ["c.mp4"], ["broken.mp4"]]
+    assert all(has_thumbnail(path) for path in paths) and not os.path.exists(thumbnail_path(broken))
+    assert not [name for name in os.listdir(os.path.dirname(broken)) if ".partial" in name]
+    # Current thumbnails are not made again
+    assert request_thumbnail(paths[0]) is None
+
+
+def test_failed_files_are_not_retried_until_they_change(videos):
+    paths, broken, commands = videos
+    assert generate_thumbnail(broken) is None
+    assert request_thumbnail(broken) is None and commands == [["broken.mp4"]]
+    shutil.copy(paths[0], broken)
+    os.utime(broken, (os.path.getmtime(broken) - 10,) * 2)
+    assert generate_thumbnail(broken) == thumbnail_path(broken)
@@ -0,0 +1,76 @@
+"""Tests for the resident transcription service (uses a fake model, no Whisper weights needed)."""
+import os
+import queue
+import sys
+import threading
+
+import pytest
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from transcription import TranscriptionService
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, path, **kwargs):
+        self.calls += 1
+        assert kwargs["word_timestamps"] is True
+        return {
+            "text": " hello world",
+            "language": "en",
+            "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " hello world",
+                          "words": [{"word": " hello", "start": 0.0, "end": 0.5}, {"word": " world", "start": 0.5, "end": 1.0}]}],
+        }
+
+
+def _service_with_fake(**kwargs):
+    service = TranscriptionService(**kwargs)
+    service.device = "cpu"
+    model = FakeModel()
+    service._models["fake"] = model
+    return service, model
+
+
+def test_jobs_reuse_the_loaded_model():
+    service, model = _service_with_fake(workers=1)
+    results = [service.submit("fake", lambda m: m.transcribe("clip.mp4", word_timestamps=True)).result(timeout=5) for _ in range(3)]
+    assert model.calls == 3
+    assert results[0]["segments"][0]["words"][1]["word"] == " world"
+    assert list(service._models) == ["fake"]
+    service.shutdown()
+
+
+def test_job_errors_propagate():
+    service, _ = _service_with_fake(workers=1)
+
+    def fail(model):
+        raise RuntimeError("decode error")
+
+    with pytest.raises(RuntimeError, match="decode error"):
+        service.submit("fake", fail).result(timeout=5)
+    service.shutdown()
+
+
+def test_queue_is_bounded():
+    service, _ = _service_with_fake(workers=1, queue_size=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block(model):
+        started.set()
+        release.wait(5)
+
+    running = service.submit("fake", block)
+    assert started.wait(5)
+    waiting = service.submit("fake", lambda m: "queued")
+    with pytest.raises(queue.Full):
+        service.submit("fake", lambda m: "overflow", block=False)
+    release.set()
+    running.result(timeout=5)
+    assert waiting.result(timeout=5) == "queued"
+    service.shutdown()
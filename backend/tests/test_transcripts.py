@@ -0,0 +1,103 @@
+"""Tests for the per-media transcript store."""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import transcripts
+from transcription import TranscriptionService
+from transcripts import TranscriptStore, model_rank, write_transcript
+
+_RESULT = {
+    "text": " hello world",
+    "language": "en",
+    "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " hello world",
+                  "words": [{"word": " hello", "start": 0.0, "end": 0.5}, {"word": " world", "start": 0.5, "end": 1.0}]}],
+}
+
+
+def test_model_rank():
+    assert model_rank("tiny") < model_rank("base") < model_rank("small") < model_rank("medium.en") < model_rank("large-v3")
+    assert model_rank("medium") == model_rank("medium.en")
+    assert model_rank(None) == model_rank("base")
+
+
+def test_write_transcript_creates_all_sidecars(tmp_path):
+    media = str(tmp_path / "talk.mp4")
+    stored = write_transcript(media, _RESULT, "base")
+    assert stored.read_text() == " hello world"
+    assert "00:00:00,000 --> 00:00:01,000" in stored.read_subtitles()
+    with open(tmp_path / "talk.json") as f:
+        data = json.load(f)
+    assert data["model"] == "base"
+    assert data["segments"][0]["words"][0]["word"] == " hello"
+
+
+def test_ensure_reuses_good_enough_transcript(tmp_path, monkeypatch):
+    media = str(tmp_path / "talk.mp4")
+    write_transcript(media, _RESULT, "base")
+    submitted = []
+    monkeypatch.setattr(transcripts.transcription_service, "submit", lambda *a, **k: submitted.append(a) or Future())
+
+    store = TranscriptStore()
+    stored = store.ensure(media, "medium.en", min_model="base").result(timeout=1)
+    assert stored.model == "base"
+    assert not submitted
+
+    # Asking for better quality queues a new Whisper run, and a second caller shares it
+    first = store.ensure(media, "medium.en")
+    second = store.ensure(media, "medium.en", min_model="small")
+    assert first is second
+    assert len(submitted) == 1 and submitted[0][0] == "medium.en"
+
+
+def test_ensure_rebuilds_missing_srt_from_json(tmp_path, monkeypatch):
+    media = str(tmp_path / "talk.mp4")
+    # Transcript written by the old whisper CLI: JSON only, no model recorded
+    with open(tmp_path / "talk.json", "w") as f:
+        json.dump(_RESULT, f)
+    monkeypatch.setattr(transcripts.transcription_service, "submit", lambda *a, **k: (_ for _ in ()).throw(AssertionError("no Whisper run expected")))
+    stored = TranscriptStore().ensure(media, "base").result(timeout=1)
+    assert os.path.exists(stored.srt_path) and os.path.exists(stored.txt_path)
+
+
+def test_full_queue_does_not_block_finishing_transcripts(tmp_path, monkeypatch):
+    release = threading.Event()
+
+    class GatedModel:
+        def transcribe(self, media_path, **kwargs):
+            release.wait(10)
+            return _RESULT
+
+    service = TranscriptionService(workers=1, queue_size=1)
+    monkeypatch.setattr(service, "load_model", lambda name: GatedModel())
+    monkeypatch.setattr(transcripts, "transcription_service", service)
+    store = TranscriptStore()
+    # One running, one queued, and a third caller waiting for room in the queue
+    futures = {}
+    callers = [threading.Thread(target=lambda name=name: futures.setdefault(name, store.ensure(str(tmp_path / name), "base")),
+                                daemon=True)
+               for name in ["a.mp4", "b.mp4", "c.mp4"]]
+    for caller in callers:
+        caller.start()
+        time.sleep(0.2)
+    release.set()
+    for caller in callers:
+        caller.join(10)
+        assert not caller.is_alive()
+    assert sorted(f.result(timeout=10).model for f in futures.values()) == ["base"] * 3
+    assert store._in_flight == {}
+    service.shutdown()
+
+
+def test_delete_removes_sidecars(tmp_path):
+    media = str(tmp_path / "talk.mp4")
+    stored = write_transcript(media, _RESULT, "base")
+    TranscriptStore().delete(media)
+    assert not any(os.path.exists(p) for p in (stored.json_path, stored.srt_path, stored.txt_path))
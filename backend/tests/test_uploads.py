@@ -0,0 +1,130 @@
+"""Tests for resumable chunked uploads."""
+import asyncio
+import hashlib
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import proxies
+import thumbnails
+import uploads
+from ingest import IngestManager
+from uploads import COMPLETE, REJECTED, OffsetMismatch, UploadManager, UploadRejected
+
+
+async def _stream(data: bytes, piece: int = 1000):
+    for i in range(0, len(data), piece):
+        yield data[i:i + piece]
+
+
+async def _broken_stream(data: bytes):
+    yield data
+    raise ConnectionError("client went away")
+
+
+@pytest.fixture
+def small_buffers(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_WRITE_BUFFER", 4096)
+    monkeypatch.setattr(uploads, "UPLOAD_PROBE_BYTES", 1 << 40)
+
+
+def test_chunks_resume_and_hash(tmp_path, fixture_video, small_buffers):
+    data = open(fixture_video, "rb").read()
+    manager = UploadManager(str(tmp_path / "uploads"))
+    session = manager.create("clip.mp4", size=len(data))
+    half = len(data) // 2
+
+    session = asyncio.run(manager.write_chunk(session.id, 0, _stream(data[:half])))
+    assert session.received == half
+    with pytest.raises(OffsetMismatch) as exc:
+        asyncio.run(manager.write_chunk(session.id, 0, _stream(data[half:])))
+    assert exc.value.expected == half
+
+    # A fresh manager (server restart) resumes from the saved offset and rebuilds the hash
+    manager = UploadManager(str(tmp_path / "uploads"))
+    asyncio.run(manager.write_chunk(session.id, half, _stream(data[half:])))
+    session, path = asyncio.run(manager.finish(session.id, hashlib.sha256(data).hexdigest()))
+    assert session.status == COMPLETE
+    assert session.sha256 == hashlib.sha256(data).hexdigest()
+    assert session.probed and session.duration == pytest.approx(1.0, abs=0.1)
+    assert open(path, "rb").read() == data
+
+
+def test_dropped_connection_keeps_received_bytes(tmp_path, small_buffers):
+    manager = UploadManager(str(tmp_path / "uploads"))
+    session = manager.create("clip.mp4")
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.write_chunk(session.id, 0, _broken_stream(b"x" * 1500)))
+    assert manager.get(session.id).received == 1500
+
+
+def test_checksum_mismatch_rejects(tmp_path, fixture_video, small_buffers):
+    data = open(fixture_video, "rb").read()
+    manager = UploadManager(str(tmp_path / "uploads"))
+    session = manager.create("clip.mp4")
+    asyncio.run(manager.write_chunk(session.id, 0, _stream(data)))
+    with pytest.raises(UploadRejected):
+        asyncio.run(manager.finish(session.id, "0" * 64))
+    assert manager.get(session.id).status == REJECTED
+    assert not os.path.exists(manager.part_path(session.id))
+
+
+def test_finish_rejects_too_long_media(tmp_path, fixture_video, small_buffers):
+    data = open(fixture_video, "rb").read()
+    manager = UploadManager(str(tmp_path / "uploads"))
+    session = manager.create("clip.mp4", max_duration=0.5)
+    # No early probe ran (threshold not reached), so the check happens on finish
+    asyncio.run(manager.write_chunk(session.id, 0, _stream(data)))
+    with pytest.raises(UploadRejected, match="maximum duration"):
+        asyncio.run(manager.finish(session.id))
+
+
+def test_early_probe_stops_upload_before_the_end(tmp_path, fixture_video, monkeypatch):
+    faststart = str(tmp_path / "faststart.mp4")
+    subprocess.run(["ffmpeg", "-y", "-i", fixture_video, "-c", "copy", "-movflags", "+faststart", faststart],
+                   check=True, capture_output=True, timeout=30)
+    data = open(faststart, "rb").read()
+    monkeypatch.setattr(uploads, "UPLOAD_WRITE_BUFFER", 2048)
+    monkeypatch.setattr(uploads, "UPLOAD_PROBE_BYTES", len(data) // 2)
+    manager = UploadManager(str(tmp_path / "uploads"))
+    session = manager.create("clip.mp4", size=len(data), max_duration=0.5)
+    with pytest.raises(UploadRejected):
+        asyncio.run(manager.write_chunk(session.id, 0, _stream(data)))
+    rejected = manager.get(session.id)
+    assert rejected.status == REJECTED
+    assert rejected.received < len(data)
+
+
+def test_upload_endpoints(tmp_path, fixture_video, small_buffers, monkeypatch):
+    import main
+    files_dir = str(tmp_path / "files")
+    os.makedirs(files_dir)
+    monkeypatch.setattr(main, "FILES_DIR", files_dir)
+    monkeypatch.setattr(proxies, "PROXY_DIR", os.path.join(files_dir, ".proxies"))
+    monkeypatch.setattr(main, "upload_manager", UploadManager(os.path.join(files_dir, ".uploads")))
+    monkeypatch.setattr(main, "ingest_jobs", IngestManager(workers=1, followup_workers=1))
+    monkeypatch.setattr(main, "_transcribe_upload", lambda path: None)
+    monkeypatch.setattr(thumbnails, "generate_thumbnail", lambda path: None)
+    client = TestClient(main.app)
+    data = open(fixture_video, "rb").read()
+
+    started = client.post("/uploads", json={"filename": "../clip.mp4", "size": len(data)}).json()
+    upload_id = started["id"]
+    assert started["filename"] == "clip.mp4" and started["chunk_size"] > 0
+    assert client.put(f"/uploads/{upload_id}?offset=0", content=data[:3000]).json()["received"] == 3000
+    conflict = client.put(f"/uploads/{upload_id}?offset=0", content=data[3000:])
+    assert conflict.status_code == 409 and conflict.json()["detail"]["offset"] == 3000
+    assert client.get(f"/uploads/{upload_id}").json()["received"] == 3000
+    client.put(f"/uploads/{upload_id}?offset=3000", content=data[3000:])
+    done = client.post(f"/uploads/{upload_id}/complete", json={"sha256": hashlib.sha256(data).hexdigest()})
+    assert done.status_code == 200
+    assert done.json()["filename"] == "clip.mp4"
+    main.ingest_jobs.get("clip.mp4").normalize.future.result(timeout=60)
+    assert os.path.isfile(os.path.join(files_dir, "clip.mp4"))
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+    assert client.post("/uploads", json={"filename": "notes.txt"}).status_code == 400
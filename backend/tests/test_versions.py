@@ -0,0 +1,63 @@
+"""Tests for the version number allocator."""
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import versions
+from versions import allocate_version, allocate_version_filename
+
+
+@pytest.fixture
+def counter(tmp_path, monkeypatch):
+    path = str(tmp_path / "versions.sqlite3")
+    monkeypatch.setattr(versions, "COUNTER_PATH", path)
+    return path
+
+
+def _touch(path):
+    with open(path, "wb"):
+        pass
+
+
+def _allocate_many(args):
+    counter_path, directory, count = args
+    versions.COUNTER_PATH = counter_path
+    return [allocate_version(directory) for _ in range(count)]
+
+
+def test_allocates_sequentially(tmp_path, counter):
+    directory = str(tmp_path / "files")
+    os.makedirs(directory)
+    assert [allocate_version(directory) for _ in range(3)] == [1, 2, 3]
+    assert allocate_version_filename(directory) == "version4.mp4"
+
+
+def test_seeds_from_highest_existing_and_never_reuses(tmp_path, counter):
+    directory = str(tmp_path / "files")
+    os.makedirs(directory)
+    for name in ("version1.mp4", "version7.mp4", "version3.mp3", "notes.txt"):
+        _touch(os.path.join(directory, name))
+    assert allocate_version(directory) == 8
+    os.remove(os.path.join(directory, "version7.mp4"))
+    assert allocate_version(directory) == 9
+
+
+def test_skips_numbers_taken_behind_its_back(tmp_path, counter):
+    directory = str(tmp_path / "files")
+    os.makedirs(directory)
+    assert allocate_version(directory) == 1
+    _touch(os.path.join(directory, "version2.mp4"))
+    assert allocate_version(directory) == 3
+
+
+def test_unique_across_processes(tmp_path, counter):
+    directory = str(tmp_path / "files")
+    os.makedirs(directory)
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        results = pool.map(_allocate_many, [(counter, directory, 25)] * 4)
+    allocated = [n for chunk in results for n in chunk]
+    assert sorted(allocated) == list(range(1, 101))
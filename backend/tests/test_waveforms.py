@@ -0,0 +1,84 @@
+"""Tests for waveform peak pyramids and their range-served peak file."""
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import media_probe
+import waveforms
+from waveforms import block_peaks, generate_waveform, peak_levels, peaks_path
+
+
+@pytest.fixture
+def tone_env(tmp_path, monkeypatch):
+    files_dir = str(tmp_path / "files")
+    os.makedirs(files_dir)
+    # One second of a half-scale tone, then one second of silence
+    tone = os.path.join(files_dir, "tone.wav")
+    subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "aevalsrc='if(lt(t,1),0.5*sin(2*PI*440*t),0)':s=8000:d=2",
+                    tone], check=True, capture_output=True, timeout=60)
+    monkeypatch.setattr(media_probe, "INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(waveforms, "WAVEFORM_DIR", os.path.join(files_dir, ".waveforms"))
+    commands = []
+    real_command = waveforms.decode_command
+    monkeypatch.setattr(waveforms, "decode_command", lambda *args: commands.append(args) or real_command(*args))
+    return files_dir, tone, commands
+
+
+def test_peak_pyramid():
+    samples = np.array([3, -1, 4, 1, -5, 9, 2, -6, 5], dtype=np.int8)
+    level0 = block_peaks(samples, 2)
+    assert level0.tolist() == [[-1, 3], [1, 4], [-5, 9], [-6, 2], [5, 5]]
+    pyramid = peak_levels(level0, 5)
+    # An odd level keeps its last peak; the pyramid stops at a single peak
+    assert [level.tolist() for level in pyramid[1:]] == [[[-1, 4], [-6, 9], [5, 5]], [[-6, 9], [5, 5]], [[-6, 9]]]
+
+
+def test_waveform_is_decoded_once_into_one_peak_file(tone_env):
+    _, tone, commands = tone_env
+    waveform = generate_waveform(tone)
+    assert (waveform.samples, waveform.duration, waveform.counts) == (16000, 2.0, [500, 250, 125, 63, 32, 16])
+    assert commands == [(tone, 8000)]
+    with open(peaks_path(tone, waveform.key), "rb") as f:
+        data = f.read()
+    assert len(data) == waveform.offset(6) == waveform.header_size + 2 * sum(waveform.counts)
+    level0 = np.frombuffer(data[waveform.offset(0):waveform.offset(1)], dtype=np.int8).reshape(-1, 2)
+    assert np.all(np.abs(level0[20:240] - [-64, 63]) <= 2) and not level0[260:].any()
+    coarsest = np.frombuffer(data[waveform.offset(5):], dtype=np.int8).reshape(-1, 2)
+    assert np.all(np.abs(coarsest[:7] - [-64, 64]) <= 1) and not coarsest[9:].any()
+
+    # Cached until the media changes; a new version replaces the old file
+    assert generate_waveform(tone) == waveform and len(commands) == 1
+    os.utime(tone, (1, 1))
+    newer = generate_waveform(tone)
+    assert newer.key != waveform.key and len(commands) == 2
+    assert os.listdir(os.path.dirname(peaks_path(tone, newer.key))) == [f"{newer.key}.peaks"]
+
+
+def test_waveform_endpoints_serve_levels_as_ranges(tone_env, monkeypatch):
+    import main
+    files_dir, tone, _ = tone_env
+    monkeypatch.setattr(main, "FILES_DIR", files_dir)
+    client = TestClient(main.app)
+
+    waveform = client.get("/media/tone.wav/waveform").json()
+    assert waveform["duration"] == 2.0 and len(waveform["levels"]) == 6
+    level = waveform["levels"][2]
+    assert (level["samplesPerPeak"], level["peaksPerSecond"], level["count"]) == (128, 62.5, 125)
+
+    # The second half of level 2 is silence
+    url = waveform["url"].replace("http://127.0.0.1:8001", "")
+    first, last = 63, 125
+    peaks = client.get(url, headers={"Range": f"bytes={level['offset'] + 2 * first}-{level['offset'] + 2 * last - 1}"})
+    assert peaks.status_code == 206 and peaks.content == bytes(2 * (last - first))
+    assert "immutable" in peaks.headers["cache-control"]
+
+    assert client.get("/media/missing.wav/waveform").status_code == 404
+    with open(os.path.join(files_dir, "notes.mp3"), "wb") as f:
+        f.write(b"not media")
+    assert client.get("/media/notes.mp3/waveform").status_code == 422
@@ -0,0 +1,152 @@
+"""
+Video thumbnails ({name}.jpg next to the video) made on a small worker pool. Requests for a file
+already queued or being made share that work, queued files are snapshotted in batches (one
+ffmpeg run with one output per file), and files that failed are not retried until they change.
+"""
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import media_probe
+
+# Concurrent snapshot processes
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "1"))
+# Queued files snapshotted by one ffmpeg run
+THUMBNAIL_BATCH_SIZE = int(os.getenv("THUMBNAIL_BATCH_SIZE", "8"))
+# Time of the snapshot (half the duration for shorter videos)
+THUMBNAIL_SECONDS = float(os.getenv("THUMBNAIL_SECONDS", "1.0"))
+
+# video path -> event set once its thumbnail was made or failed (queued and in-flight files)
+_events: Dict[str, threading.Event] = {}
+_queue: List[str] = []
+# video path -> mtime of the version that failed, so it is not retried on every listing
+_failed: Dict[str, float] = {}
+_draining = 0
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+
+
+def thumbnail_path(video_path: str) -> str:
+    return video_path + ".jpg"
+
+
+def has_thumbnail(video_path: str) -> bool:
+    """True if a thumbnail exists and is not older than its video."""
+    try:
+        return os.path.getmtime(thumbnail_path(video_path)) >= os.path.getmtime(video_path)
+    except OSError:
+        return False
+
+
+def _snapshot_time(video_path: str) -> float:
+    duration = media_probe.get_duration_seconds(video_path)
+    return min(THUMBNAIL_SECONDS, duration / 2) if duration else 0.0
+
+
+def _partial_path(video_path: str) -> str:
+    return video_path + ".partial.jpg"
+
+
+def snapshot_command(video_paths: List[str]) -> List[str]:
+    """One ffmpeg run writing the snapshot of each video to its partial thumbnail path."""
+    command = ["ffmpeg", "-y", "-v", "error"]
+    for path in video_paths:
+        command += ["-ss", f"{_snapshot_time(path):.3f}", "-i", path]
+    for i, path in enumerate(video_paths):
+        command += ["-map", f"{i}:v:0", "-frames:v", "1", "-q:v", "2", _partial_path(path)]
+    return command
+
+
+def _run_batch(video_paths: List[str]) -> List[str]:
+    """Snapshot the videos; returns those that failed. A failed batch is retried file by file."""
+    try:
+        subprocess.run(snapshot_command(video_paths), check=True, capture_output=True, timeout=15 * len(video_paths))
+        failed = [path for path in video_paths if not os.path.isfile(_partial_path(path))]
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        if len(video_paths) > 1:
+            return [failed for path in video_paths for failed in _run_batch([path])]
+        print(f"Thumbnail generation failed for {video_paths[0]}: {getattr(e, 'stderr', e)}")
+        failed = list(video_paths)
+    for path in video_paths:
+        if path not in failed:
+            os.replace(_partial_path(path), thumbnail_path(path))
+        elif os.path.exists(_partial_path(path)):
+            os.remove(_partial_path(path))
+    return failed
+
+
+def _drain() -> None:
+    global _draining
+    while True:
+        with _lock:
+            taken = _queue[:THUMBNAIL_BATCH_SIZE]
+            del _queue[:THUMBNAIL_BATCH_SIZE]
+            if not taken:
+                _draining -= 1
+                return
+        # The video may have been deleted, or given a thumbnail, since it was queued
+        batch = [path for path in taken if os.path.isfile(path) and not has_thumbnail(path)]
+        failed = batch
+        try:
+            failed = _run_batch(batch) if batch else []
+        except Exception as e:
+            print(f"Thumbnail batch failed: {e}")
+        with _lock:
+            for path in failed:
+                try:
+                    _failed[path] = os.path.getmtime(path)
+                except OSError:
+                    pass
+            events = [_events.pop(path) for path in taken]
+        for event in events:
+            event.set()
+
+
+def request_thumbnail(video_path: str) -> Optional[threading.Event]:
+    """
+    Queue a thumbnail unless a current one exists, it is already queued or being made, or this
+    version of the video failed before. Returns an event set when it is done (None if there is
+    nothing to do).
+    """
+    global _draining
+    try:
+        mtime = os.path.getmtime(video_path)
+    except OSError:
+        return None
+    if has_thumbnail(video_path):
+        return None
+    with _lock:
+        event = _events.get(video_path)
+        if event is not None:
+            return event
+        if _failed.get(video_path) == mtime:
+            return None
+        event = _events[video_path] = threading.Event()
+        _queue.append(video_path)
+        start = _draining < THUMBNAIL_WORKERS
+        if start:
+            _draining += 1
+    if start:
+        _executor.submit(_drain)
+    return event
+
+
+def generate_thumbnail(video_path: str) -> Optional[str]:
+    """Make the thumbnail of video_path (through the queue) and wait for it. Returns its path, or None if it failed."""
+    event = request_thumbnail(video_path)
+    if event is not None:
+        event.wait()
+    return thumbnail_path(video_path) if has_thumbnail(video_path) else None
+
+
+def delete_thumbnail(video_path: str) -> None:
+    try:
+        os.remove(thumbnail_path(video_path))
+    except OSError:
+        pass
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
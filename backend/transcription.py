@@ -0,0 +1,107 @@
+"""Resident Whisper service: models are loaded once per process and jobs run from a bounded queue."""
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+# Worker threads pulling transcription jobs. Whisper inference is heavy; one is usually right.
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "1"))
+# Max jobs waiting for a worker; submit() blocks (or raises queue.Full) beyond this.
+TRANSCRIBE_QUEUE_SIZE = int(os.getenv("TRANSCRIBE_QUEUE_SIZE", "32"))
+# Comma-separated model names to load at startup (e.g. "base,medium.en")
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "")
+
+_STOP = object()
+
+
+class TranscriptionService:
+    """Keeps Whisper models warm and runs jobs against them on worker threads."""
+
+    def __init__(self, workers: int = TRANSCRIBE_WORKERS, queue_size: int = TRANSCRIBE_QUEUE_SIZE):
+        self._workers = max(1, workers)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._models: Dict[str, Any] = {}
+        self._model_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._threads: list = []
+        self.device: Optional[str] = None
+
+    def _get_device(self) -> str:
+        if self.device is None:
+            import torch
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self.device
+
+    def _model_lock(self, model_name: str) -> threading.Lock:
+        with self._lock:
+            return self._model_locks.setdefault(model_name, threading.Lock())
+
+    def load_model(self, model_name: str):
+        """Return the named Whisper model, loading it on first use only."""
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+        with self._model_lock(model_name):
+            model = self._models.get(model_name)
+            if model is None:
+                import whisper
+                logging.info(f"Loading Whisper model '{model_name}'")
+                model = whisper.load_model(model_name, device=self._get_device())
+                self._models[model_name] = model
+        return model
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._workers):
+                t = threading.Thread(target=self._worker, name=f"transcribe-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                future, model_name, fn = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    model = self.load_model(model_name)
+                    # A model instance is not safe to share between concurrent transcribe() calls
+                    with self._model_lock(model_name):
+                        result = fn(model)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, model_name: str, fn: Callable[[Any], Any], block: bool = True, timeout: Optional[float] = None) -> Future:
+        """
+        Queue fn(model) to run with the named model loaded. Returns a Future with fn's result.
+        Blocks while the queue is full (raises queue.Full if block is False or timeout expires).
+        """
+        self._start()
+        future: Future = Future()
+        self._queue.put((future, model_name, fn), block=block, timeout=timeout)
+        return future
+
+    def preload(self, model_names) -> None:
+        for name in model_names:
+            if name:
+                self.load_model(name)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(_STOP)
+
+
+transcription_service = TranscriptionService()
@@ -0,0 +1,168 @@
+"""One transcript per media file: word JSON, SRT and plain text from a single Whisper run."""
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+from transcription import transcription_service
+
+# Model used for the transcript made at upload time
+UPLOAD_MODEL = os.getenv("WHISPER_UPLOAD_MODEL", "base")
+
+# Relative quality of Whisper model sizes (".en" variants rank with their multilingual size)
+_MODEL_RANK = {"tiny": 0, "base": 1, "small": 2, "medium": 3, "turbo": 4, "large": 4}
+
+
+def model_rank(model_name: Optional[str]) -> int:
+    """Rank a Whisper model name by size. Transcripts made before the model was recorded count as base."""
+    name = (model_name or "base").lower()
+    name = re.sub(r"\.en$", "", name)
+    name = re.sub(r"-v\d+$", "", name)
+    return _MODEL_RANK.get(name, _MODEL_RANK["base"])
+
+
+class Transcript(BaseModel):
+    """A stored transcript and the paths of its sidecar files."""
+    media_path: str
+    model: Optional[str] = None
+    json_path: str
+    srt_path: str
+    txt_path: str
+
+    def read_text(self) -> str:
+        with open(self.txt_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def read_subtitles(self) -> str:
+        with open(self.srt_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def read_result(self) -> dict:
+        with open(self.json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def transcript_paths(media_path: str) -> Tuple[str, str, str]:
+    """Sidecar paths (json, srt, txt) for a media file: same directory and basename."""
+    base = os.path.splitext(media_path)[0]
+    return base + ".json", base + ".srt", base + ".txt"
+
+
+def _unshare(path: str) -> None:
+    """Remove a sidecar about to be rewritten if it is linked to the media store (read-only, shared by other names)."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return
+    if info.st_nlink > 1 or not info.st_mode & 0o200:
+        os.remove(path)
+
+
+def write_transcript(media_path: str, result: dict, model_name: str) -> Transcript:
+    """Write all sidecars for one Whisper result. The model name is recorded in the JSON."""
+    from whisper.utils import get_writer
+    json_path, srt_path, txt_path = transcript_paths(media_path)
+    for path in (json_path, srt_path, txt_path):
+        _unshare(path)
+    output_dir = os.path.dirname(json_path)
+    result = dict(result, model=model_name)
+    get_writer("srt", output_dir)(result, media_path)
+    with open(txt_path, "w", encoding="utf-8") as f:
+        f.write(result.get("text", ""))
+    # JSON last: its presence (with the model) marks the transcript as complete
+    get_writer("json", output_dir)(result, media_path)
+    return Transcript(media_path=media_path, model=model_name, json_path=json_path, srt_path=srt_path, txt_path=txt_path)
+
+
+def _copy_outcome(source: Future, target: Future) -> None:
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class TranscriptStore:
+    """Finds, creates and shares transcripts so each media file is transcribed once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # media path -> (model name, future) for transcriptions in progress
+        self._in_flight: Dict[str, Tuple[str, Future]] = {}
+
+    def get(self, media_path: str) -> Optional[Transcript]:
+        """Return the stored transcript, or None if there is no complete one."""
+        json_path, srt_path, txt_path = transcript_paths(media_path)
+        if not os.path.exists(json_path):
+            return None
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                model = json.load(f).get("model")
+        except (OSError, ValueError):
+            return None
+        return Transcript(media_path=media_path, model=model, json_path=json_path, srt_path=srt_path, txt_path=txt_path)
+
+    def ensure(self, media_path: str, model_name: str, min_model: Optional[str] = None) -> Future:
+        """
+        Return a Future for a transcript of at least `min_model` quality (default: model_name).
+        Reuses a stored transcript or one already being made when good enough; otherwise queues a
+        Whisper run with `model_name` on the transcription service.
+        """
+        required = model_rank(min_model or model_name)
+        with self._lock:
+            in_flight = self._in_flight.get(media_path)
+            if in_flight is not None and model_rank(in_flight[0]) >= required:
+                return in_flight[1]
+            existing = self.get(media_path)
+            if existing is not None and model_rank(existing.model) >= required and os.path.exists(existing.srt_path) and os.path.exists(existing.txt_path):
+                done: Future = Future()
+                done.set_result(existing)
+                return done
+            # Older sidecars only have the JSON; regenerate SRT/TXT from it instead of re-running Whisper
+            if existing is not None and model_rank(existing.model) >= required:
+                done = Future()
+                done.set_result(write_transcript(media_path, existing.read_result(), existing.model or "base"))
+                return done
+
+            # Reserved here, submitted below: submit blocks while the queue is full, and the
+            # worker that frees a slot needs this lock to finish its own transcript
+            future = Future()
+            self._in_flight[media_path] = (model_name, future)
+
+        def run(model):
+            result = model.transcribe(
+                media_path, word_timestamps=True, verbose=None,
+                fp16=transcription_service.device == "cuda",
+                **({"language": "en"} if model_name.endswith(".en") else {}),
+            )
+            return write_transcript(media_path, result, model_name)
+
+        logging.info(f"Transcribing {media_path} with Whisper '{model_name}'")
+        future.add_done_callback(lambda f: self._finished(media_path, f))
+        try:
+            queued = transcription_service.submit(model_name, run)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        queued.add_done_callback(lambda f: _copy_outcome(f, future))
+        return future
+
+    def _finished(self, media_path: str, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(media_path, (None, None))[1] is future:
+                del self._in_flight[media_path]
+
+    def delete(self, media_path: str) -> None:
+        """Remove a media file's transcript sidecars."""
+        for path in transcript_paths(media_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+transcript_store = TranscriptStore()
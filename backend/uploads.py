@@ -0,0 +1,265 @@
+"""Resumable chunked uploads: streamed to disk with large buffers, hashed while writing, probed early."""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+import media_probe
+
+# Chunk size suggested to clients (they may send any size; offsets are what count)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Bytes gathered in memory before each disk write
+UPLOAD_WRITE_BUFFER = int(os.getenv("UPLOAD_WRITE_BUFFER", str(4 * 1024 * 1024)))
+# Probe the container once this much has arrived, to reject too-long or unsupported media early
+UPLOAD_PROBE_BYTES = int(os.getenv("UPLOAD_PROBE_BYTES", str(8 * 1024 * 1024)))
+# Unfinished uploads untouched for this long are deleted
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+UPLOADING = "uploading"
+COMPLETE = "complete"
+REJECTED = "rejected"
+
+
+class UploadRejected(ValueError):
+    """The upload was refused (too long, unsupported, checksum mismatch); it cannot be resumed."""
+
+
+class OffsetMismatch(ValueError):
+    """A chunk was sent for the wrong offset; the client should resume from `expected`."""
+
+    def __init__(self, expected: int):
+        super().__init__(f"Upload is at offset {expected}")
+        self.expected = expected
+
+
+class UploadSession(BaseModel):
+    id: str
+    filename: str
+    size: Optional[int] = None  # total bytes, if the client announced it
+    received: int = 0
+    max_duration: Optional[float] = None
+    duration: Optional[float] = None  # from the early probe
+    probed: bool = False
+    sha256: Optional[str] = None  # set when complete
+    status: str = UPLOADING
+    error: Optional[str] = None
+    updated: float = 0.0
+
+
+def check_probe(info: Optional[media_probe.MediaInfo], max_duration: Optional[float]) -> None:
+    """Raise UploadRejected if probed media is unusable or longer than max_duration."""
+    if info is None:
+        return
+    if not info.has_video and not info.has_audio:
+        raise UploadRejected("File has no audio or video stream.")
+    if max_duration is not None and info.duration is not None and info.duration > max_duration:
+        raise UploadRejected(f"Video exceeds maximum duration of {int(max_duration // 3600)} hours (got {int(info.duration // 3600)}h).")
+
+
+class UploadManager:
+    """Upload sessions stored as <id>.json + <id>.part in one directory, so they survive restarts."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # id -> (hasher, bytes hashed); rebuilt from the .part file after a restart
+        self._hashers: Dict[str, Tuple["hashlib._Hash", int]] = {}
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def part_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _save(self, session: UploadSession) -> None:
+        session.updated = time.time()
+        tmp = self._meta_path(session.id) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(session.model_dump_json())
+        os.replace(tmp, self._meta_path(session.id))
+
+    def create(self, filename: str, size: Optional[int] = None, max_duration: Optional[float] = None) -> UploadSession:
+        os.makedirs(self.directory, exist_ok=True)
+        self.cleanup()
+        session = UploadSession(id=uuid.uuid4().hex, filename=filename, size=size, max_duration=max_duration)
+        open(self.part_path(session.id), "wb").close()
+        self._save(session)
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(upload_id), "r", encoding="utf-8") as f:
+                return UploadSession.model_validate(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    def _hasher(self, session: UploadSession):
+        """Hasher covering exactly session.received bytes of the part file."""
+        hasher, hashed = self._hashers.get(session.id, (None, -1))
+        if hasher is None or hashed != session.received:
+            hasher = hashlib.sha256()
+            remaining = session.received
+            with open(self.part_path(session.id), "rb") as f:
+                while remaining > 0:
+                    block = f.read(min(UPLOAD_WRITE_BUFFER, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+        return hasher
+
+    def _reject(self, session: UploadSession, error: str) -> None:
+        session.status = REJECTED
+        session.error = error
+        self._save(session)
+        self._hashers.pop(session.id, None)
+        try:
+            os.remove(self.part_path(session.id))
+        except OSError:
+            pass
+
+    async def _probe(self, session: UploadSession) -> None:
+        info = await asyncio.to_thread(media_probe.probe_partial, self.part_path(session.id))
+        if info is None:
+            # Inconclusive (e.g. MP4 index at the end of the file): check again when complete
+            return
+        session.probed = True
+        session.duration = info.duration
+        check_probe(info, session.max_duration)
+
+    async def write_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        """
+        Append a chunk streamed from `chunks` at `offset`. Data is buffered to UPLOAD_WRITE_BUFFER,
+        hashed and written off the event loop; progress is saved after every write, so an
+        interrupted chunk resumes from the last buffer written.
+        """
+        lock = self._lock(upload_id)
+        if lock.locked():
+            # Another request is still writing this upload; the client should re-check the offset
+            session = self.get(upload_id)
+            raise OffsetMismatch(session.received if session else 0)
+        async with lock:
+            session = self.get(upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            if session.status != UPLOADING:
+                raise UploadRejected(session.error or f"Upload is {session.status}")
+            if offset != session.received:
+                raise OffsetMismatch(session.received)
+            hasher = await asyncio.to_thread(self._hasher, session)
+            f = await asyncio.to_thread(open, self.part_path(upload_id), "r+b")
+            try:
+                # Drop bytes past the last saved offset (left by a write cut off mid-way)
+                await asyncio.to_thread(f.truncate, session.received)
+                f.seek(session.received)
+                buffer = bytearray()
+
+                async def flush():
+                    data = bytes(buffer)
+                    buffer.clear()
+                    await asyncio.to_thread(_write_and_hash, f, hasher, data)
+                    session.received += len(data)
+                    if session.size is not None and session.received > session.size:
+                        raise UploadRejected("Upload is larger than announced.")
+                    self._hashers[upload_id] = (hasher, session.received)
+                    self._save(session)
+                    if not session.probed and session.received >= UPLOAD_PROBE_BYTES:
+                        await self._probe(session)
+                        self._save(session)
+
+                try:
+                    try:
+                        async for chunk in chunks:
+                            buffer.extend(chunk)
+                            if len(buffer) >= UPLOAD_WRITE_BUFFER:
+                                await flush()
+                    except UploadRejected:
+                        raise
+                    except Exception:
+                        # Connection dropped: keep what did arrive so the client resumes after it
+                        if buffer:
+                            await flush()
+                        raise
+                    if buffer:
+                        await flush()
+                except UploadRejected as e:
+                    f.close()
+                    self._reject(session, str(e))
+                    raise
+            finally:
+                if not f.closed:
+                    f.close()
+            return session
+
+    async def finish(self, upload_id: str, sha256: Optional[str] = None) -> Tuple[UploadSession, str]:
+        """
+        Check that the upload is whole (announced size, optional client checksum, probe) and return
+        (session, path of the complete file). The caller moves the file where it belongs.
+        """
+        async with self._lock(upload_id):
+            session = self.get(upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            if session.status != UPLOADING:
+                raise UploadRejected(session.error or f"Upload is {session.status}")
+            if session.size is not None and session.received != session.size:
+                raise OffsetMismatch(session.received)
+            hasher = await asyncio.to_thread(self._hasher, session)
+            digest = hasher.hexdigest()
+            try:
+                if sha256 and sha256.lower() != digest:
+                    raise UploadRejected("Checksum mismatch.")
+                if not session.probed:
+                    info = await asyncio.to_thread(media_probe.probe_partial, self.part_path(upload_id))
+                    if info is None:
+                        raise UploadRejected("Unsupported or corrupt media file.")
+                    session.probed, session.duration = True, info.duration
+                    check_probe(info, session.max_duration)
+            except UploadRejected as e:
+                self._reject(session, str(e))
+                raise
+            session.sha256 = digest
+            session.status = COMPLETE
+            self._save(session)
+            self._hashers.pop(upload_id, None)
+            return session, self.part_path(upload_id)
+
+    def discard(self, upload_id: str) -> None:
+        """Forget an upload and delete its data."""
+        self._hashers.pop(upload_id, None)
+        self._locks.pop(upload_id, None)
+        for path in (self.part_path(upload_id), self._meta_path(upload_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def cleanup(self, now: Optional[float] = None) -> None:
+        """Delete sessions not touched within UPLOAD_SESSION_TTL."""
+        now = now or time.time()
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            session = self.get(name[:-5])
+            if session is not None and now - session.updated > UPLOAD_SESSION_TTL:
+                logging.info(f"Removing stale upload {session.id} ({session.filename})")
+                self.discard(session.id)
+
+
+def _write_and_hash(f, hasher, data: bytes) -> None:
+    f.write(data)
+    f.flush()
+    hasher.update(data)
@@ -0,0 +1,57 @@
+"""Allocates versionN.mp4 names from a persistent counter shared by every worker process."""
+import os
+import re
+import sqlite3
+from contextlib import closing
+
+# SQLite file holding the last version number handed out, per files directory
+COUNTER_PATH = os.getenv("VERSION_COUNTER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "versions.sqlite3"))
+
+_VERSION_RE = re.compile(r"^version(\d+)\.mp4$")
+
+
+def version_filename(number: int) -> str:
+    return f"version{number}.mp4"
+
+
+def highest_existing_version(directory: str) -> int:
+    """Largest N among versionN.mp4 files in directory (0 if none)."""
+    highest = 0
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = _VERSION_RE.match(name)
+            if match:
+                highest = max(highest, int(match.group(1)))
+    return highest
+
+
+def allocate_version(directory: str) -> int:
+    """
+    Reserve the next version number for directory. Safe across threads and processes: the
+    read-increment-write runs under SQLite's write lock. The counter is seeded from the files
+    already there on first use, and numbers are never reused, even after a version is deleted.
+    """
+    directory = os.path.abspath(directory)
+    with closing(sqlite3.connect(COUNTER_PATH, timeout=30, isolation_level=None)) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (directory TEXT PRIMARY KEY, last INTEGER NOT NULL)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT last FROM counters WHERE directory = ?", (directory,)).fetchone()
+            number = (row[0] if row else highest_existing_version(directory)) + 1
+            # Skip numbers taken by files written behind the counter's back (e.g. copied in)
+            while os.path.exists(os.path.join(directory, version_filename(number))):
+                number += 1
+            conn.execute(
+                "INSERT INTO counters (directory, last) VALUES (?, ?) ON CONFLICT(directory) DO UPDATE SET last = excluded.last",
+                (directory, number),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return number
+
+
+def allocate_version_filename(directory: str) -> str:
+    """Reserve the next versionN.mp4 name for directory."""
+    return version_filename(allocate_version(directory))
@@ -1,13 +1,30 @@
 
+import contextlib
+import math
 import os
-import subprocess
+import shutil
+import tempfile
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+import media_probe
+from media_probe import has_audio_stream
+from render_cache import RENDER_CACHE, RENDER_CACHE_DIR, cache_key, get_cache
+from render_graph import Clip, Crop, Filter, Fps, Pad, Render, Rotate, Scale, SetSar, Step, Track, compile_render
+from render_jobs import RenderJob, run_ffmpeg, run_parallel
+from smart_render import smart_render
+from versions import allocate_version_filename
 
 # Define global constants
 FILES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "files")
 if not os.path.exists(FILES_DIR):
     os.makedirs(FILES_DIR)
+# Set to 1 to render the clips of each export on their own ffmpeg processes, CLIP_RENDER_WORKERS
+# at a time, and join them by stream copy (instead of one filter graph in one process)
+CLIP_RENDER_PARALLEL = os.getenv("CLIP_RENDER_PARALLEL", "0") == "1"
+# Clips rendered concurrently in parallel mode, and threads given to each ffmpeg (decoder, filters and encoder)
+CLIP_RENDER_WORKERS = int(os.getenv("CLIP_RENDER_WORKERS", str(max(1, (os.cpu_count() or 2) // 4))))
+CLIP_RENDER_THREADS = int(os.getenv("CLIP_RENDER_THREADS", str(max(1, (os.cpu_count() or 2) // CLIP_RENDER_WORKERS))))
 
 
 class ClipData(BaseModel):
@@ -34,58 +51,181 @@ class SplitTimelineRequest(BaseModel):
     bottom_pan_y: float = 0.0
 
 
-def _has_audio_stream(filepath: str) -> bool:
-    """Return True if the file has at least one audio stream."""
-    try:
-        out = subprocess.run(
-            ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_type", "-of", "default=noprint_wrappers=1:nokey=1", filepath],
-            capture_output=True, text=True, timeout=10
-        )
-        return out.returncode == 0 and out.stdout is not None and "audio" in out.stdout
-    except (subprocess.TimeoutExpired, OSError):
-        return False
-
-
-def _clip_video_filter(idx: int, clip: ClipData, ts: float, te: float) -> str:
-    """Build video filter for one clip: trim, scale/crop with optional transform (pan, zoom, rotate). Output is 1080x1920."""
+def _clip_steps(clip: ClipData) -> List[Step]:
+    """Transform of one clip (pan, zoom, rotate) as render graph steps. Output is 1080x1920 at _CLIP_FPS."""
     zoom_val = clip.scale if clip.scale is not None else 1.0
     pos_x = clip.position_x if clip.position_x is not None else 0.0
     pos_y = clip.position_y if clip.position_y is not None else 0.0
     rot = clip.rotation if clip.rotation is not None else 0.0
     w = max(1080, int(1080 * zoom_val))
     h = max(1920, int(1920 * zoom_val))
-    chain = f"[{idx}:v]trim=start={ts}:end={te},setpts=PTS-STARTPTS"
-    chain += f",scale={w}:{h}:force_original_aspect_ratio=increase"
     px = int((pos_x / 100.0) * 1080)
     py = int((pos_y / 100.0) * 1920)
-    chain += f",crop=1080:1920:(iw-1080)/2-{px}:(ih-1920)/2-{py}"
+    steps = [
+        Scale(w=w, h=h, fit="increase"),
+        Crop(w=1080, h=1920, x=f"(iw-1080)/2-{px}", y=f"(ih-1920)/2-{py}"),
+    ]
     if rot != 0:
-        import math
-        rad = rot * math.pi / 180
-        chain += f",rotate={rad}:c=black"
-        chain += ",scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2:black"
-    chain += ",setsar=1"
-    return chain + f"[v{idx}]"
+        steps += [Rotate(angle=rot * math.pi / 180), Scale(w=1080, h=1920, fit="decrease"), Pad(w=1080, h=1920)]
+    return steps + [SetSar(), Fps(rate=_CLIP_FPS)]
+
+
+def _source_size(path: str) -> Optional[Tuple[int, int]]:
+    """Displayed frame size of a media file (after rotation metadata), if the probe knows it."""
+    info = media_probe.probe_media(path)
+    return info.display_size if info is not None else None
+
+
+def _graph_clip(path: str, clip: ClipData, ts: float, te: float, has_audio: bool, **fields) -> Clip:
+    return Clip(path=path, start=ts, end=te, video=_clip_steps(clip), has_audio=has_audio, size=_source_size(path), **fields)
+
+
+def _is_identity_transform(clip: ClipData) -> bool:
+    """True if _clip_steps would only conform the clip (no pan, zoom or rotation)."""
+    return (clip.scale in (None, 1.0) and not clip.position_x and not clip.position_y and not clip.rotation)
+
+
+# Conformed clip intermediates: every setting that changes their content is part of the cache key
+_CLIP_FPS = 30
+_CLIP_SAMPLE_RATE = 44100
+_CLIP_VIDEO_ARGS = ["-c:v", "libx264", "-crf", "23", "-preset", "fast", "-pix_fmt", "yuv420p"]
+_CLIP_AUDIO_ARGS = ["-c:a", "pcm_s16le", "-ar", str(_CLIP_SAMPLE_RATE), "-ac", "2"]
+_CLIP_FORMAT_VERSION = 1
+
+
+def _clip_frames(ts: float, te: float) -> int:
+    return max(1, round((te - ts) * _CLIP_FPS))
+
+
+def _clip_cache_key(path: str, clip: ClipData, ts: float, te: float) -> Optional[str]:
+    """Cache key of a clip's intermediate, or None if the source cannot be read."""
+    digest = media_probe.content_digest(path)
+    if digest is None:
+        return None
+    return cache_key(
+        source=digest,
+        trim=[round(ts, 6), round(te, 6)],
+        transform=[clip.scale if clip.scale is not None else 1.0, clip.position_x or 0.0,
+                   clip.position_y or 0.0, clip.rotation or 0.0],
+        video=_CLIP_VIDEO_ARGS, audio=_CLIP_AUDIO_ARGS, fps=_CLIP_FPS, version=_CLIP_FORMAT_VERSION,
+    )
+
+
+def _clip_command(path: str, clip: ClipData, ts: float, te: float, has_audio: bool, output_path: str,
+                  threads: int = 0) -> List[str]:
+    """
+    Render one clip to a conformed intermediate: 1080x1920 at a constant frame rate with exactly
+    _clip_frames frames, and PCM audio of exactly the same length, so intermediates join without drift.
+    threads is given to the decoder and encoder (0: ffmpeg's choice).
+    """
+    frames = _clip_frames(ts, te)
+    samples = frames * _CLIP_SAMPLE_RATE // _CLIP_FPS
+    # Pad short sources by repeating the last frame / with silence, then cut both to the exact length
+    clip = _graph_clip(path, clip, ts, te, has_audio, audio=[f"aresample={_CLIP_SAMPLE_RATE}", "apad", f"atrim=end_sample={samples}"])
+    graph = compile_render(Render(tracks=[Track(clips=[clip], video=[Filter(expr="tpad=stop_mode=clone:stop_duration=1")])]))
+    return graph.command(output_path, ["-frames:v", str(frames), "-threads", str(threads)] + _CLIP_VIDEO_ARGS + _CLIP_AUDIO_ARGS,
+                         options=["-threads", str(threads)])
+
+
+def _render_per_clip(clips: List[ClipData], clip_paths: List[str], has_audio: List[bool], ranges: List[tuple],
+                     output_path: str, job: Optional[RenderJob]) -> bool:
+    """
+    Per-clip mode: render each clip to a conformed intermediate, then join them with the concat
+    demuxer (video copied, audio encoded once). With RENDER_CACHE, intermediates are cached and only
+    clips without one are rendered; with CLIP_RENDER_PARALLEL, clips render on CLIP_RENDER_WORKERS
+    concurrent ffmpeg processes. Returns False (nothing done) with neither, or if a source cannot
+    be hashed.
+    """
+    if not (RENDER_CACHE or CLIP_RENDER_PARALLEL):
+        return False
+    scratch = None
+    if RENDER_CACHE:
+        # Hashing the sources costs a full read of each, so it is only done with the cache on
+        cache = get_cache(RENDER_CACHE_DIR or os.path.join(FILES_DIR, ".render_cache"))
+        keys = [_clip_cache_key(path, clip, ts, te) for path, clip, (ts, te) in zip(clip_paths, clips, ranges)]
+        if None in keys:
+            return False
+        paths = [cache.path(key) for key in keys]
+        pinned = cache.pin(keys)
+    else:
+        # Parallel without the cache: intermediates of this export only (hidden: not listed by /media)
+        scratch = tempfile.mkdtemp(prefix=".clips_", dir=os.path.dirname(output_path))
+        keys = [str(i) for i in range(len(clips))]
+        paths = [os.path.join(scratch, f"clip_{i:03d}.mkv") for i in range(len(clips))]
+        pinned = contextlib.nullcontext()
+    try:
+        with pinned:
+            misses = [i for i, key in enumerate(keys) if scratch is not None or cache.lookup(key) is None]
+            # The same clip may appear more than once; render it once
+            misses = [i for i in misses if keys.index(keys[i]) == i]
+            if scratch is None:
+                print(f"Render cache: {len(keys) - len(misses)} of {len(keys)} clips cached, rendering {len(misses)}")
+            total_seconds = sum(_clip_frames(ts, te) for ts, te in ranges) / _CLIP_FPS
+            # The join copies video and encodes only audio: weigh it at a tenth of the clip renders
+            join_weight = 1.0 if not misses else 0.1
+            workers, threads = (CLIP_RENDER_WORKERS, CLIP_RENDER_THREADS) if CLIP_RENDER_PARALLEL else (1, 0)
+
+            def render_clip(i: int, sub: RenderJob) -> None:
+                seconds = _clip_frames(*ranges[i]) / _CLIP_FPS
+
+                def produce(tmp: str) -> None:
+                    run_ffmpeg(_clip_command(clip_paths[i], clips[i], *ranges[i], has_audio[i], tmp, threads),
+                               job=sub, duration=seconds)
+
+                if scratch is None:
+                    cache.store(keys[i], produce)
+                else:
+                    produce(paths[i])
+
+            # Clips are independent: render them concurrently, each ffmpeg with its share of the cores
+            run_parallel([(lambda sub, i=i: render_clip(i, sub), _clip_frames(*ranges[i])) for i in misses],
+                         workers, job=job, weight=1.0 - join_weight, name="clip")
+            offset = 1.0 - join_weight
+
+            list_path = f"{os.path.splitext(output_path)[0]}.ffconcat"
+            try:
+                with open(list_path, "w", encoding="utf-8") as f:
+                    f.write("ffconcat version 1.0\n")
+                    for path, (ts, te) in zip(paths, ranges):
+                        f.write(f"file '{path}'\n")
+                        f.write(f"duration {_clip_frames(ts, te) / _CLIP_FPS:.6f}\n")
+                run_ffmpeg([
+                    "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+                    "-map", "0:v:0", "-map", "0:a:0",
+                    "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+                    "-movflags", "+faststart",
+                    output_path,
+                ], job=job, duration=total_seconds, weight=join_weight, offset=offset)
+            finally:
+                if os.path.exists(list_path):
+                    os.remove(list_path)
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch, ignore_errors=True)
+    if scratch is None:
+        cache.evict()
+    return True
 
 
 def _safe_export_basename() -> str:
-    """Return a unique safe basename for export (e.g. export_20250220_143022.mp4)."""
+    """Return a unique safe basename for export (e.g. export_20250220_143022_1a2b3c.mp4)."""
     from datetime import datetime
-    return f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+    import uuid
+    # Suffix keeps concurrent exports started in the same second apart
+    return f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.mp4"
 
 
-def render_timeline_clips(clips: List[ClipData], output_filename: Optional[str] = None) -> str:
+def render_timeline_clips(clips: List[ClipData], output_filename: Optional[str] = None, job: Optional[RenderJob] = None) -> str:
     """
     Render a list of clips (trim + vertical 1080x1920) into a single output file.
     If output_filename is None, uses version{N+1}.mp4. Otherwise uses the given basename (no path).
+    If job is given, ffmpeg progress is reported to it and the render can be cancelled.
     Returns the output filename.
     """
     if not clips:
         raise ValueError("No clips provided")
-    n = len(clips)
     if output_filename is None:
-        num_files = len([f for f in os.listdir(FILES_DIR) if f.startswith("version") and f.endswith(".mp4")])
-        output_filename = f"version{num_files+1}.mp4"
+        output_filename = allocate_version_filename(FILES_DIR)
     else:
         output_filename = os.path.basename(output_filename)
         if not output_filename.endswith(".mp4"):
@@ -104,213 +244,104 @@ def render_timeline_clips(clips: List[ClipData], output_filename: Optional[str]
     clip_paths = []
     has_audio = []
     for clip in clips:
-        filename = clip.filename
-        if filename.startswith("version") and not filename.endswith(".mp4"):
-            filename += ".mp4"
-        path = os.path.join(FILES_DIR, filename)
+        path = _media_path(clip.filename)
         clip_paths.append(path)
-        has_audio.append(_has_audio_stream(path))
-
-    inputs = []
-    for path in clip_paths:
-        inputs.extend(["-i", path])
-    for i, clip in enumerate(clips):
-        dur = max(0.001, trim_end(clip) - trim_start(clip))
-        if not has_audio[i]:
-            inputs.extend(["-f", "lavfi", "-t", str(dur), "-i", "anullsrc=r=44100:cl=stereo"])
-
-    filter_parts = []
-    next_silence = n
-    for i, clip in enumerate(clips):
-        ts, te = trim_start(clip), trim_end(clip)
-        vf = _clip_video_filter(i, clip, ts, te)
-        filter_parts.append(vf + ";")
-        if has_audio[i]:
-            filter_parts.append(f"[{i}:a]atrim=start={ts}:end={te},asetpts=PTS-STARTPTS[a{i}];")
-        else:
-            filter_parts.append(f"[{next_silence}:a]asetpts=PTS-STARTPTS[a{i}];")
-            next_silence += 1
-
-    concat_inputs = "".join([f"[v{i}][a{i}]" for i in range(n)])
-    full_filter = "".join(filter_parts) + f"{concat_inputs}concat=n={n}:v=1:a=1[outv][outa]"
-    command = ["ffmpeg", "-y"] + inputs + [
-        "-filter_complex", full_filter,
-        "-map", "[outv]", "-map", "[outa]",
-        "-c:v", "libx264", "-crf", "23", "-preset", "fast",
-        "-c:a", "aac", "-b:a", "192k",
-        output_path
-    ]
-    subprocess.run(command, check=True)
+        has_audio.append(has_audio_stream(path))
+
+    # Untransformed clips of 1080x1920 sources need no filtering: copy whole GOPs, re-encode only the cuts
+    if all(_is_identity_transform(c) for c in clips):
+        ranges = [(path, trim_start(c), trim_end(c)) for path, c in zip(clip_paths, clips)]
+        if smart_render(ranges, output_path, job=job, width=1080, height=1920):
+            return output_filename
+
+    # Clips rendered on their own (cached and/or in parallel) and joined; unchanged cached clips are reused
+    if _render_per_clip(clips, clip_paths, has_audio, [(trim_start(c), trim_end(c)) for c in clips], output_path, job):
+        return output_filename
+
+    # Each input is seeked to its first frame; nearby clips of one source share a decode
+    track = Track(clips=[_graph_clip(path, c, trim_start(c), trim_end(c), audio)
+                         for path, c, audio in zip(clip_paths, clips, has_audio)])
+    graph = compile_render(Render(tracks=[track]))
+    command = graph.command(output_path, ["-c:v", "libx264", "-crf", "23", "-preset", "fast", "-c:a", "aac", "-b:a", "192k"])
+    run_ffmpeg(command, job=job, duration=graph.duration)
     return output_filename
 
 
-def generate_video_thumbnail(filename: str) -> None:
+# Each split-screen track fills half of the 1080x1920 frame
+_SPLIT_WIDTH, _SPLIT_HEIGHT = 1080, 960
+# Length of an empty track (black and silent) when the other track is empty too
+_EMPTY_TRACK_SECONDS = 5.0
+
+
+def _media_path(filename: str) -> str:
+    """Path in FILES_DIR of a clip's file (version names may omit .mp4)."""
+    if filename.startswith("version") and not filename.endswith(".mp4"):
+        filename += ".mp4"
+    return os.path.join(FILES_DIR, filename)
+
+
+def _split_track(clips: List[ClipData], duration: float, zoom: float, pan_y: float) -> Track:
     """
-    Generate a thumbnail image for a video file. Saves as {filename}.jpg in FILES_DIR.
-    Uses first second of video so each clip gets its own frame.
+    One split-screen track: its clips (looped to duration) cut to 1080x960, then zoomed and panned
+    as a whole. An empty track is black and silent.
     """
-    video_path = os.path.join(FILES_DIR, filename)
-    if not os.path.isfile(video_path):
-        return
-    image_filename = f"{filename}.jpg"
-    image_path = os.path.join(FILES_DIR, image_filename)
-    cmd = [
-        "ffmpeg", "-y",
-        "-ss", "00:00:00.5",
-        "-i", video_path,
-        "-vframes", "1",
-        "-q:v", "2",
-        image_path
-    ]
-    try:
-        subprocess.run(cmd, check=True, capture_output=True, timeout=15)
-    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
-        pass
+    if not clips:
+        filler = Clip(path=f"color=c=black:s={_SPLIT_WIDTH}x{_SPLIT_HEIGHT}:r={_CLIP_FPS}", end=duration,
+                      input_options=["-f", "lavfi"], has_audio=False, size=(_SPLIT_WIDTH, _SPLIT_HEIGHT), video=[SetSar()])
+        return Track(clips=[filler])
+    cut_steps = [Scale(w=_SPLIT_WIDTH, h=_SPLIT_HEIGHT, fit="increase"), Crop(w=_SPLIT_WIDTH, h=_SPLIT_HEIGHT), SetSar(), Fps(rate=_CLIP_FPS)]
+    graph_clips = []
+    for clip in clips:
+        path = _media_path(clip.filename)
+        graph_clips.append(Clip(path=path, start=clip.start, end=clip.end, video=cut_steps,
+                                has_audio=has_audio_stream(path), size=_source_size(path)))
+    offset = f"(960*({pan_y}/100))"
+    if zoom > 1:
+        steps = [Scale(w=f"iw*{zoom}", h="-1"), Crop(w=_SPLIT_WIDTH, h=_SPLIT_HEIGHT, x=f"(iw-{_SPLIT_WIDTH})/2", y=f"(ih-{_SPLIT_HEIGHT})/2-({offset})")]
+    elif zoom < 1:
+        steps = [Scale(w=f"iw*{zoom}", h="-1"), Pad(w=_SPLIT_WIDTH, h=_SPLIT_HEIGHT, x=f"({_SPLIT_WIDTH}-iw)/2", y=f"({_SPLIT_HEIGHT}-ih)/2+({offset})")]
+    else:
+        # At zoom 1 the 1080x960 crop leaves no room to pan
+        steps = []
+    return Track(clips=graph_clips, video=steps, loop_to=duration)
 
 
-async def render_split_timeline(request: SplitTimelineRequest):
-    print(f"Rendering split timeline.")
-    
+def render_split_timeline_clips(request: SplitTimelineRequest, output_filename: Optional[str] = None,
+                                job: Optional[RenderJob] = None) -> str:
+    """
+    Render the top and bottom tracks stacked vertically (1080x1920), with their audio and the
+    optional BGM clips mixed, in one ffmpeg pass: one filter graph, one encode, no temp files.
+    The shorter track loops until the longer one ends. Same output naming and job handling as
+    render_timeline_clips. Returns the output filename.
+    """
     if not request.top_clips and not request.bottom_clips:
-         raise ValueError("No clips provided for either timeline")
-         
-    num_files = len([n for n in os.listdir(FILES_DIR) if n.startswith("version") and n.endswith(".mp4")])
-    output_filename = f"version{num_files+1}.mp4"
-    # Ensure FILES_DIR exists (it should, but safety first)
-    if not os.path.exists(FILES_DIR):
-        os.makedirs(FILES_DIR)
+        raise ValueError("No clips provided for either timeline")
+    if output_filename is None:
+        output_filename = allocate_version_filename(FILES_DIR)
+    output_path = os.path.join(FILES_DIR, os.path.basename(output_filename))
 
-    output_path = os.path.join(FILES_DIR, output_filename)
+    dur_top = sum(c.end - c.start for c in request.top_clips) if request.top_clips else _EMPTY_TRACK_SECONDS
+    dur_bottom = sum(c.end - c.start for c in request.bottom_clips) if request.bottom_clips else _EMPTY_TRACK_SECONDS
+    max_dur = max(dur_top, dur_bottom)
 
-    temp_top = os.path.join(FILES_DIR, f"temp_top_{num_files+1}.mp4")
-    temp_bottom = os.path.join(FILES_DIR, f"temp_bottom_{num_files+1}.mp4")
-    
-    def process_track(clips, output_temp):
-        if not clips:
-            # Create black filler
-            subprocess.run(["ffmpeg", "-y", "-f", "lavfi", "-i", "color=c=black:s=1920x1080:d=5", "-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo", "-shortest", output_temp], check=True)
-            return
-
-        inputs = []
-        filter_parts = []
-        for i, clip in enumerate(clips):
-             filename = clip.filename
-             if filename.startswith("version") and not filename.endswith(".mp4"): filename += ".mp4"
-             inputs.extend(["-i", os.path.join(FILES_DIR, filename)])
-             
-             filter_parts.append(f"[{i}:v]trim=start={clip.start}:end={clip.end},setpts=PTS-STARTPTS,scale=1080:960:force_original_aspect_ratio=increase,crop=1080:960,setsar=1[v{i}];")
-             filter_parts.append(f"[{i}:a]atrim=start={clip.start}:end={clip.end},asetpts=PTS-STARTPTS[a{i}];")
-        
-        concat_inputs = "".join([f"[v{i}][a{i}]" for i in range(len(clips))])
-        final_filter = "".join(filter_parts) + f"{concat_inputs}concat=n={len(clips)}:v=1:a=1[v][a]"
-        
-        cmd = ["ffmpeg", "-y"] + inputs + ["-filter_complex", final_filter, "-map", "[v]", "-map", "[a]", output_temp]
-        subprocess.run(cmd, check=True)
-
-    # 1. Process Top
-    process_track(request.top_clips, temp_top)
-    
-    # 2. Process Bottom
-    process_track(request.bottom_clips, temp_bottom)
-
-    # 3. Process Audio (BGM)
-    temp_audio = None
+    music = []
     if request.audio_clips:
-        temp_audio = os.path.join(FILES_DIR, f"temp_audio_{num_files+1}.mp3")
-        
-        inputs = []
-        filter_parts = []
-        for i, clip in enumerate(request.audio_clips):
-             filename = clip.filename
-             inputs.extend(["-i", os.path.join(FILES_DIR, filename)])
-             filter_parts.append(f"[{i}:a]atrim=start={clip.start}:end={clip.end},asetpts=PTS-STARTPTS[a{i}];")
-        
-        concat_inputs = "".join([f"[a{i}]" for i in range(len(request.audio_clips))])
-        final_filter = "".join(filter_parts) + f"{concat_inputs}concat=n={len(request.audio_clips)}:v=0:a=1[outa]"
-        
-        cmd = ["ffmpeg", "-y"] + inputs + ["-filter_complex", final_filter, "-map", "[outa]", temp_audio]
-        subprocess.run(cmd, check=True)
-
-    # 4. Stack
-    # Calculate durations to handle looping
-    dur_top = sum([c.end - c.start for c in request.top_clips])
-    dur_bottom = sum([c.end - c.start for c in request.bottom_clips])
-    if not request.top_clips: dur_top = 5
-    if not request.bottom_clips: dur_bottom = 5
-    
-    max_dur = max(dur_top, dur_bottom)
-    
-    inputs = []
-    
-    # Input 0: Top
-    if dur_top < max_dur:
-        inputs.extend(["-stream_loop", "-1", "-i", temp_top])
-    else:
-        inputs.extend(["-i", temp_top])
-        
-    # Input 1: Bottom
-    if dur_bottom < max_dur:
-        inputs.extend(["-stream_loop", "-1", "-i", temp_bottom])
-    else:
-        inputs.extend(["-i", temp_bottom])
-    
-    # Calculate crop/pad for top
-    def get_filter(idx, zoom, pan_y, label):
-        offset = f"(960*({pan_y}/100))"
-        chain = f"[{idx}:v]scale=1080:960:force_original_aspect_ratio=increase,crop=1080:960,setsar=1,scale=iw*{zoom}:-1[z{label}];"
-        
-        if zoom >= 1:
-            chain += f"[z{label}]crop=1080:960:(iw-1080)/2:(ih-960)/2-({offset})[{label}];"
-        else:
-            chain += f"[z{label}]pad=1080:960:(1080-iw)/2:(960-ih)/2+({offset}):black[{label}];"
-        return chain
-
-    top_filter = get_filter(0, request.top_zoom, request.top_pan_y, "topv")
-    bot_filter = get_filter(1, request.bottom_zoom, request.bottom_pan_y, "botv")
-
-    complex_filter = [
-        top_filter,
-        bot_filter,
-        "[topv][botv]vstack=inputs=2[v];"
-    ]
-    
-    # Add BGM mixing if exists
-    if temp_audio:
-        # Mix audio: [0:a] is top audio, [1:a] is bottom audio, [2:a] is bgm
-        # We need to respect looping? 
-        # Actually stream_loop applies to input. So [0:a] and [1:a] are already looped.
-        # We just need to mix them.
-        inputs.append("-i")
-        inputs.append(temp_audio)
-        
-        # amix inputs=3
-        # But maybe we want specific volumes?
-        # Simple amix for now
-        complex_filter.append(f"[0:a][1:a][2:a]amix=inputs=3:duration=longest[a]")
-    else:
-        complex_filter.append(f"[0:a][1:a]amix=inputs=2:duration=longest[a]")
-
-    full_filter = "".join(complex_filter)
-    
-    command = [
-        "ffmpeg", "-y",
-    ] + inputs + [
-        "-filter_complex", full_filter,
-        "-map", "[v]", 
-        "-map", "[a]",
+        music_clips = []
+        for clip in request.audio_clips:
+            path = os.path.join(FILES_DIR, clip.filename)
+            music_clips.append(Clip(path=path, start=clip.start, end=clip.end, has_audio=has_audio_stream(path)))
+        music.append(Track(clips=music_clips))
+    graph = compile_render(Render(
+        tracks=[
+            _split_track(request.top_clips, max_dur, request.top_zoom, request.top_pan_y),
+            _split_track(request.bottom_clips, max_dur, request.bottom_zoom, request.bottom_pan_y),
+        ],
+        music=music,
+    ))
+    command = graph.command(output_path, [
         "-c:v", "libx264", "-crf", "23", "-preset", "fast",
         "-c:a", "aac", "-b:a", "192k",
         "-t", str(max_dur),
-        output_path
-    ]
-    
-    print(f"Executing: {command}")
-    subprocess.run(command, check=True)
-    
-    # Cleanup temps
-    try:
-        if os.path.exists(temp_top): os.remove(temp_top)
-        if os.path.exists(temp_bottom): os.remove(temp_bottom)
-        if temp_audio and os.path.exists(temp_audio): os.remove(temp_audio)
-    except Exception as e:
-        print(f"Warning: Failed to clean up temp files: {e}")
+    ])
+    run_ffmpeg(command, job=job, duration=max_dur)
+    return os.path.basename(output_path)
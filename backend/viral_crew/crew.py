@@ -26,8 +26,8 @@ gemini_api_key = os.getenv('GEMINI_API_KEY')
 if 'Path' not in globals():
     from pathlib import Path
 
-def get_subtitles():
-    whisper_output_dir = Path('whisper_output')
+def get_subtitles(whisper_output_dir='whisper_output'):
+    whisper_output_dir = Path(whisper_output_dir)
     if not whisper_output_dir.exists():
         logging.error(f"Directory not found: {whisper_output_dir}")
         return None
@@ -42,12 +42,18 @@ def get_subtitles():
 
     return subtitles
 
-def main(extracts):
-    # Create the crew_output directory if it doesn't exist
-    os.makedirs("crew_output", exist_ok=True)
+def main(extracts, subtitles=None, output_dir="crew_output"):
+    """
+    Match each extract to its subtitle segment and write one .srt per extract into output_dir.
+    Pass subtitles explicitly to avoid reading the shared whisper_output directory. output_dir must be
+    relative to the working directory (CrewAI strips leading slashes from output_file).
+    """
+    # Create the output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
 
     # Read subtitles
-    subtitles = get_subtitles()
+    if subtitles is None:
+        subtitles = get_subtitles()
     if subtitles is None:
         logging.error("Failed to read subtitles. Exiting.")
         return
@@ -147,7 +153,7 @@ def main(extracts):
             description=description_block,
             expected_output=expected_output_block,
             agent=agent,
-            output_file=f'crew_output/new_file_return_subtitles_{segment_num}_{ts}.srt'
+            output_file=os.path.join(output_dir, f'new_file_return_subtitles_{segment_num}_{ts}.srt')
         )
         tasks_list.append(task)
 
@@ -24,8 +24,8 @@ if not api_key:
 client = genai.Client(api_key=api_key)
 
 
-def get_whisper_output():
-    whisper_output_dir = Path('whisper_output')
+def get_whisper_output(whisper_output_dir='whisper_output'):
+    whisper_output_dir = Path(whisper_output_dir)
     if not whisper_output_dir.exists():
         logging.error(f"Directory not found: {whisper_output_dir}")
         return None, None
@@ -151,18 +151,18 @@ def save_response_to_file(response, output_path):
         logging.error(f"Error saving response to file: {e}")
 
 
-def main():
+def main(whisper_output_dir='whisper_output', output_dir='crew_output'):
     logging.info('STARTING extracts.py (Gemini Version)')
 
-    transcript, subtitles = get_whisper_output()
+    transcript, subtitles = get_whisper_output(whisper_output_dir)
     if transcript is None or subtitles is None:
         logging.error("Failed to get whisper output")
         return None
 
     response = call_gemini_api(transcript)
     if response and 'clips' in response:
-        output_dir = Path('crew_output')
-        output_dir.mkdir(exist_ok=True)
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
         output_path = output_dir / 'api_response.json'
         save_response_to_file(response, output_path)
 
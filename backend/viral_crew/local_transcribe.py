@@ -54,19 +54,27 @@ def transcribe_file(model, srt, plain, file):
     return result, transcript, subtitles
 
 
-def transcribe_main(file):
+# Loaded models, so repeated runs in one process skip the (large) model load
+_models = {}
+
+
+def load_model(name="medium.en"):
+    if name not in _models:
+        # Use CUDA, if available
+        DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+        _models[name] = whisper.load_model(name).to(DEVICE)
+    return _models[name]
+
+
+def transcribe_main(file, model=None):
 
     # specify the type of file outputs you need from Whisper
     plain = True
     srt = True
 
-    # Whisper configuration
-
-    # Use CUDA, if available
-    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-    # Load the desired model
-    model = whisper.load_model("medium.en").to(DEVICE)
+    # Whisper configuration: callers with a resident model (the backend transcription service) pass it in
+    if model is None:
+        model = load_model("medium.en")
 
     result, transcript, subtitles = transcribe_file(model, srt, plain, file)
 
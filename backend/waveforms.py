@@ -0,0 +1,211 @@
+"""
+Waveform peaks for the timeline. The audio of a media file is decoded once to mono PCM and reduced
+to a pyramid of min/max peaks: level 0 has one (min, max) pair per WAVEFORM_SAMPLES_PER_PEAK
+samples and each further level halves the resolution. All levels go into one compact binary file,
+so any zoom level (or part of one) is a byte range of that file.
+
+File layout (little-endian): header "<4sIIII" (magic b"PEAK", sample rate, samples per peak at
+level 0, decoded samples, levels), one uint32 peak count per level, then the levels in order,
+each `count` int8 (min, max) pairs.
+"""
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+import media_probe
+from render_cache import cache_key
+from video_processor import FILES_DIR
+
+# Peak files live next to the masters in a hidden directory (not listed by /media)
+WAVEFORM_DIR = os.getenv("WAVEFORM_DIR", os.path.join(FILES_DIR, ".waveforms"))
+# Rate the audio is decoded at (peaks do not need more)
+WAVEFORM_SAMPLE_RATE = int(os.getenv("WAVEFORM_SAMPLE_RATE", "8000"))
+# Samples per peak at the finest level (8000 / 32 = 250 peaks per second)
+WAVEFORM_SAMPLES_PER_PEAK = int(os.getenv("WAVEFORM_SAMPLES_PER_PEAK", "32"))
+# Levels in the pyramid, each half the resolution of the one before
+WAVEFORM_LEVELS = int(os.getenv("WAVEFORM_LEVELS", "6"))
+
+_MAGIC = b"PEAK"
+_HEADER = struct.Struct("<4sIIII")
+# Decoded bytes read at a time (a whole number of level 0 peaks)
+_READ_PEAKS = 8192
+
+_in_flight: Dict[str, threading.Event] = {}
+_lock = threading.Lock()
+
+
+class Waveform(BaseModel):
+    """Header of a peak file: peak k of level l covers samples [k * spp * 2**l, (k + 1) * spp * 2**l)."""
+    key: str
+    sample_rate: int
+    samples_per_peak: int
+    samples: int
+    counts: List[int]
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate
+
+    @property
+    def header_size(self) -> int:
+        return _HEADER.size + 4 * len(self.counts)
+
+    def level_samples(self, level: int) -> int:
+        """Samples per peak at a level."""
+        return self.samples_per_peak << level
+
+    def offset(self, level: int) -> int:
+        """Byte offset of a level's first peak in the file."""
+        return self.header_size + 2 * sum(self.counts[:level])
+
+    def header(self) -> bytes:
+        return (_HEADER.pack(_MAGIC, self.sample_rate, self.samples_per_peak, self.samples, len(self.counts))
+                + struct.pack(f"<{len(self.counts)}I", *self.counts))
+
+
+def block_peaks(samples: np.ndarray, samples_per_peak: int) -> np.ndarray:
+    """(min, max) of each block of samples_per_peak samples (the last block may be shorter), as an (n, 2) array."""
+    full = len(samples) // samples_per_peak * samples_per_peak
+    blocks = samples[:full].reshape(-1, samples_per_peak)
+    peaks = np.stack([blocks.min(axis=1), blocks.max(axis=1)], axis=1)
+    if full < len(samples):
+        rest = samples[full:]
+        peaks = np.concatenate([peaks, [[rest.min(), rest.max()]]]).astype(samples.dtype)
+    return peaks
+
+
+def halve(peaks: np.ndarray) -> np.ndarray:
+    """The next level of the pyramid: each pair of peaks merged into one."""
+    if len(peaks) % 2:
+        peaks = np.concatenate([peaks, peaks[-1:]])
+    pairs = peaks.reshape(-1, 2, 2)
+    return np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+
+
+def peak_levels(level0: np.ndarray, levels: int) -> List[np.ndarray]:
+    """The pyramid from its finest level; stops early once a level is a single peak."""
+    pyramid = [level0]
+    while len(pyramid) < levels and len(pyramid[-1]) > 1:
+        pyramid.append(halve(pyramid[-1]))
+    return pyramid
+
+
+def decode_command(media_path: str, sample_rate: int) -> List[str]:
+    """The first audio stream as mono signed 16-bit PCM on stdout."""
+    return [
+        "ffmpeg", "-v", "error", "-i", media_path,
+        "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(sample_rate),
+        "-f", "s16le", "-",
+    ]
+
+
+def _decode_peaks(media_path: str, sample_rate: int, samples_per_peak: int) -> tuple:
+    """Level 0 peaks (int8) and the number of samples, reduced while ffmpeg decodes so the PCM is never held whole."""
+    command = decode_command(media_path, sample_rate)
+    chunks, samples = [], 0
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            while True:
+                data = process.stdout.read(2 * samples_per_peak * _READ_PEAKS)
+                if not data:
+                    break
+                pcm = np.frombuffer(data[:len(data) // 2 * 2], dtype="<i2")
+                samples += len(pcm)
+                # 8 bits are plenty for drawing; the top byte keeps the sign
+                chunks.append(block_peaks((pcm >> 8).astype(np.int8), samples_per_peak))
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(returncode, command, stderr=stderr.read())
+    if not samples:
+        raise ValueError(f"{os.path.basename(media_path)} has no audio samples")
+    return np.concatenate(chunks), samples
+
+
+def _media_dir(media_path: str) -> str:
+    return os.path.join(WAVEFORM_DIR, os.path.basename(media_path))
+
+
+def peaks_path(media_path: str, key: str) -> str:
+    return os.path.join(_media_dir(media_path), f"{key}.peaks")
+
+
+def read_waveform(path: str, key: str) -> Optional[Waveform]:
+    """The header of a peak file, or None if it is missing or not a peak file."""
+    try:
+        with open(path, "rb") as f:
+            magic, sample_rate, samples_per_peak, samples, levels = _HEADER.unpack(f.read(_HEADER.size))
+            counts = list(struct.unpack(f"<{levels}I", f.read(4 * levels)))
+    except (OSError, struct.error):
+        return None
+    if magic != _MAGIC:
+        return None
+    return Waveform(key=key, sample_rate=sample_rate, samples_per_peak=samples_per_peak, samples=samples, counts=counts)
+
+
+def generate_waveform(media_path: str) -> Waveform:
+    """
+    The peak file of a media file, made unless a current one exists. Concurrent calls for the same
+    file share one run. Raises ValueError if the file has no audio stream.
+    """
+    info = media_probe.probe_media(media_path)
+    if info is None or not info.has_audio:
+        raise ValueError(f"{os.path.basename(media_path)} has no audio to draw a waveform from")
+    stat = os.stat(media_path)
+    sample_rate, samples_per_peak, levels = WAVEFORM_SAMPLE_RATE, WAVEFORM_SAMPLES_PER_PEAK, WAVEFORM_LEVELS
+    key = cache_key(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sample_rate=sample_rate,
+                    samples_per_peak=samples_per_peak, levels=levels)[:16]
+    path = peaks_path(media_path, key)
+    while True:
+        waveform = read_waveform(path, key)
+        if waveform is not None:
+            return waveform
+        with _lock:
+            event = _in_flight.get(key)
+            owner = event is None
+            if owner:
+                event = _in_flight[key] = threading.Event()
+        if owner:
+            break
+        event.wait()
+
+    try:
+        level0, samples = _decode_peaks(media_path, sample_rate, samples_per_peak)
+        pyramid = peak_levels(level0, levels)
+        waveform = Waveform(key=key, sample_rate=sample_rate, samples_per_peak=samples_per_peak, samples=samples,
+                            counts=[len(level) for level in pyramid])
+        media_dir = _media_dir(media_path)
+        os.makedirs(media_dir, exist_ok=True)
+        tmp_path = path + ".partial"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(waveform.header())
+                for level in pyramid:
+                    f.write(np.ascontiguousarray(level, dtype=np.int8).tobytes())
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        # Peaks of earlier versions of the file
+        for name in os.listdir(media_dir):
+            if name != os.path.basename(path) and not name.endswith(".partial"):
+                os.remove(os.path.join(media_dir, name))
+        return waveform
+    finally:
+        with _lock:
+            del _in_flight[key]
+        event.set()
+
+
+def delete_waveform(media_path: str) -> None:
+    shutil.rmtree(_media_dir(media_path), ignore_errors=True)
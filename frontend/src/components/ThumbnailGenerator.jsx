@@ -15,7 +15,7 @@ export function ThumbnailGenerator() {
     React.useEffect(() => {
         const fetchSnapshots = async () => {
             try {
-                const response = await axios.get("http://127.0.0.1:8001/media");
+                const response = await axios.get("http://127.0.0.1:8001/media?type=video");
                 if (response.status === 200) {
                     const mediaWithThumbs = response.data.filter(m => m.thumbnailUrl && m.type === 'video');
                     setSnapshots(mediaWithThumbs);
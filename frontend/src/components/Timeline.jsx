@@ -7,6 +7,137 @@ const MIN_PX_PER_SEC = 20;
 const MAX_PX_PER_SEC = 200;
 const SNAP_THRESHOLD_PX = 5;
 const SNAP_PX = 28;
+// Height of the filmstrip (or waveform) behind a clip: the clip minus the keyframe strip
+const FILMSTRIP_PX = 62;
+
+// Filmstrip maps by filename, shared by every clip (and timeline) showing that media
+const filmstripCache = new Map();
+
+function loadFilmstrip(filename) {
+  if (!filmstripCache.has(filename)) {
+    filmstripCache.set(filename, fetch(`http://127.0.0.1:8001/media/${encodeURIComponent(filename)}/filmstrip`)
+      .then((response) => (response.ok ? response.json() : null))
+      .catch(() => null));
+  }
+  return filmstripCache.get(filename);
+}
+
+// Frames along a clip, cut from the media's sprite sheets: one sheet request covers the whole strip
+function ClipFilmstrip({ filename, inPoint, widthPx, pxPerSecond }) {
+  const [strip, setStrip] = useState(null);
+  useEffect(() => {
+    let active = true;
+    loadFilmstrip(filename).then((result) => active && setStrip(result));
+    return () => { active = false; };
+  }, [filename]);
+  if (!strip || !strip.count) return null;
+
+  const tileWidth = strip.tileWidth * (FILMSTRIP_PX / strip.tileHeight);
+  const perSheet = strip.columns * strip.rows;
+  const tiles = [];
+  for (let x = 0; x < widthPx; x += tileWidth) {
+    // Each tile shows the frame at its middle
+    const time = inPoint + (x + tileWidth / 2) / pxPerSecond;
+    const k = Math.min(strip.count - 1, Math.max(0, Math.floor(time / strip.interval)));
+    const cell = k % perSheet;
+    tiles.push(
+      <div
+        key={x}
+        className="timeline-filmstrip-tile"
+        style={{
+          left: `${x}px`,
+          width: `${tileWidth}px`,
+          backgroundImage: `url(${strip.sheets[Math.floor(k / perSheet)]})`,
+          backgroundSize: `${strip.columns * tileWidth}px ${strip.rows * FILMSTRIP_PX}px`,
+          backgroundPosition: `-${(cell % strip.columns) * tileWidth}px -${Math.floor(cell / strip.columns) * FILMSTRIP_PX}px`
+        }}
+      />
+    );
+  }
+  return <div className="timeline-filmstrip" aria-hidden>{tiles}</div>;
+}
+
+// Waveform metadata by filename; each level's peaks are fetched once, as a byte range of the peak file
+const waveformCache = new Map();
+const waveformLevelCache = new Map();
+
+function loadWaveform(filename) {
+  if (!waveformCache.has(filename)) {
+    waveformCache.set(filename, fetch(`http://127.0.0.1:8001/media/${encodeURIComponent(filename)}/waveform`)
+      .then((response) => (response.ok ? response.json() : null))
+      .catch(() => null));
+  }
+  return waveformCache.get(filename);
+}
+
+function loadWaveformLevel(waveform, level) {
+  const cacheKey = `${waveform.url}#${level}`;
+  if (!waveformLevelCache.has(cacheKey)) {
+    const { offset, count } = waveform.levels[level];
+    waveformLevelCache.set(cacheKey, fetch(waveform.url, { headers: { Range: `bytes=${offset}-${offset + 2 * count - 1}` } })
+      .then((response) => (response.ok ? response.arrayBuffer() : null))
+      .then((buffer) => (buffer ? new Int8Array(buffer, 0, 2 * count) : null))
+      .catch(() => null));
+  }
+  return waveformLevelCache.get(cacheKey);
+}
+
+// Min/max peaks along a clip, from the coarsest level that still has a peak per pixel
+function ClipWaveform({ filename, inPoint, widthPx, pxPerSecond }) {
+  const canvasRef = useRef(null);
+  const [waveform, setWaveform] = useState(null);
+  const [peaks, setPeaks] = useState(null);
+  useEffect(() => {
+    let active = true;
+    loadWaveform(filename).then((result) => active && setWaveform(result));
+    return () => { active = false; };
+  }, [filename]);
+
+  const level = useMemo(() => {
+    if (!waveform || !waveform.levels.length) return null;
+    let chosen = 0;
+    waveform.levels.forEach((l, i) => { if (l.peaksPerSecond >= pxPerSecond) chosen = i; });
+    return chosen;
+  }, [waveform, pxPerSecond]);
+
+  useEffect(() => {
+    if (level == null) return undefined;
+    let active = true;
+    loadWaveformLevel(waveform, level).then((result) => active && setPeaks({ level, data: result }));
+    return () => { active = false; };
+  }, [waveform, level]);
+
+  useEffect(() => {
+    const canvas = canvasRef.current;
+    if (!canvas || !peaks?.data) return;
+    const { peaksPerSecond } = waveform.levels[peaks.level];
+    const width = Math.ceil(widthPx);
+    canvas.width = width;
+    canvas.height = FILMSTRIP_PX;
+    const ctx = canvas.getContext('2d');
+    ctx.clearRect(0, 0, width, FILMSTRIP_PX);
+    ctx.fillStyle = '#25F4EE';
+    const mid = FILMSTRIP_PX / 2;
+    const count = peaks.data.length / 2;
+    for (let x = 0; x < width; x++) {
+      // Every peak under this pixel column
+      const first = Math.floor((inPoint + x / pxPerSecond) * peaksPerSecond);
+      const last = Math.max(first + 1, Math.floor((inPoint + (x + 1) / pxPerSecond) * peaksPerSecond));
+      if (first >= count) break;
+      let min = 0;
+      let max = 0;
+      for (let k = first; k < Math.min(last, count); k++) {
+        min = Math.min(min, peaks.data[2 * k]);
+        max = Math.max(max, peaks.data[2 * k + 1]);
+      }
+      const top = mid - (max / 128) * mid;
+      ctx.fillRect(x, top, 1, Math.max(1, mid - (min / 128) * mid - top));
+    }
+  }, [peaks, waveform, inPoint, widthPx, pxPerSecond]);
+
+  if (!waveform) return null;
+  return <canvas ref={canvasRef} className="timeline-waveform" aria-hidden />;
+}
 
 function formatTimecode(seconds) {
   const m = Math.floor(seconds / 60);
@@ -557,6 +688,12 @@ export function Timeline({
                   }}
                   title={`${clip.name ?? clip.filename} · ${inPoint.toFixed(1)}s – ${outPoint.toFixed(1)}s`}
                 >
+                  {clip.type === 'video' && clip.filename && (
+                    <ClipFilmstrip filename={clip.filename} inPoint={inPoint} widthPx={widthPx} pxPerSecond={pxPerSecond} />
+                  )}
+                  {clip.type === 'audio' && clip.filename && (
+                    <ClipWaveform filename={clip.filename} inPoint={inPoint} widthPx={widthPx} pxPerSecond={pxPerSecond} />
+                  )}
                   <div
                     className="resize-handle left-handle"
                     onMouseDown={(e) => handleResizeStart(e, index, 'left')}
@@ -214,8 +214,8 @@ export function VideoEditor() {
 
   const filteredMedia = allMedia.filter((item) => {
     if (activeTab === "all") return true;
-    if (activeTab === "video") return item.type === "video" || item.url.endsWith(".mp4");
-    if (activeTab === "audio") return item.type === "audio" || item.url.endsWith(".mp3");
+    if (activeTab === "video") return item.type === "video" || (item.url || '').endsWith(".mp4");
+    if (activeTab === "audio") return item.type === "audio" || (item.url || '').endsWith(".mp3");
     return true;
   });
 
@@ -240,25 +240,38 @@ export function VideoEditor() {
 
   // handleTrimChange (Removed)
 
+  const mapMediaItem = (item) => ({
+    id: item.filename,
+    name: item.filename,
+    file: {
+      name: item.filename,
+      size: item.size != null ? item.size : 0
+    },
+    // Play and scrub the low-res proxy when there is one; exports go by filename and read the master
+    url: item.proxyUrl || item.url,
+    masterUrl: item.url,
+    filename: item.filename,
+    type: item.type,
+    uploadDate: new Date(item.uploadDate * 1000),
+    durationSeconds: item.durationSeconds != null ? item.durationSeconds : null,
+    thumbnailUrl: item.thumbnailUrl || null,
+    isViralClip: item.isViralClip === true || (typeof item.filename === 'string' && /^version\d+\.mp4$/i.test(item.filename)),
+    // "processing" while the upload is normalized on the server, "failed" if that did not work
+    status: item.status || 'ready',
+    progress: item.progress != null ? item.progress : null,
+    error: item.error || null
+  });
+
+  // Catalog version of the last listing; the change feed continues from it
+  const mediaVersionRef = useRef(null);
+
   const fetchMedia = async () => {
     try {
+      // Revalidated with the ETag (Cache-Control: no-cache), so an unchanged list costs a 304
       const response = await axios.get("http://127.0.0.1:8001/media");
       if (response.status === 200) {
-        const mappedFiles = response.data.map(item => ({
-          id: item.filename,
-          name: item.filename,
-          file: {
-            name: item.filename,
-            size: item.size != null ? item.size : 0
-          },
-          url: item.url,
-          filename: item.filename,
-          type: item.type,
-          uploadDate: new Date(item.uploadDate * 1000),
-          durationSeconds: item.durationSeconds != null ? item.durationSeconds : null,
-          thumbnailUrl: item.thumbnailUrl || null,
-          isViralClip: item.isViralClip === true || (typeof item.filename === 'string' && /^version\d+\.mp4$/i.test(item.filename))
-        }));
+        mediaVersionRef.current = response.headers['x-media-version'] || null;
+        const mappedFiles = response.data.map(mapMediaItem);
         setMediaFiles(mappedFiles);
         return mappedFiles;
       }
@@ -268,10 +281,36 @@ export function VideoEditor() {
   };
 
   useEffect(() => {
+    let source = null;
     const init = async () => {
       await fetchMedia();
-    }
+      // Apply changes as they happen (uploads becoming ready, new versions, deletions) instead of re-listing
+      const since = mediaVersionRef.current ? `?since=${encodeURIComponent(mediaVersionRef.current)}` : '';
+      source = new EventSource(`http://127.0.0.1:8001/media/events${since}`);
+      source.addEventListener('upsert', (event) => {
+        const { version, item } = JSON.parse(event.data);
+        mediaVersionRef.current = version;
+        const mapped = mapMediaItem(item);
+        setMediaFiles((files) => [mapped, ...files.filter((f) => f.id !== mapped.id)]
+          .sort((a, b) => b.uploadDate - a.uploadDate));
+      });
+      source.addEventListener('remove', (event) => {
+        const { version, id } = JSON.parse(event.data);
+        mediaVersionRef.current = version;
+        setMediaFiles((files) => files.filter((f) => f.id !== id));
+      });
+      // Normalization progress of uploads still processing (not a change of the list, so no version)
+      source.addEventListener('progress', (event) => {
+        const { id, progress } = JSON.parse(event.data);
+        setMediaFiles((files) => files.map((f) => (f.id === id ? { ...f, progress } : f)));
+      });
+      // The server no longer has the changes since our version (e.g. it restarted): list again
+      source.addEventListener('reset', (event) => {
+        if (JSON.parse(event.data).version !== mediaVersionRef.current) fetchMedia();
+      });
+    };
     init();
+    return () => source && source.close();
   }, []);
 
   const toggleSplitScreen = () => {
@@ -332,17 +371,8 @@ export function VideoEditor() {
         );
 
         if (response.status === 200) {
-          const id = crypto.randomUUID();
-          const type = file.type.startsWith("video/") ? "video" : "audio";
-
-          return {
-            id,
-            file,
-            url: URL.createObjectURL(file),
-            filename: response.data.filename,
-            type,
-            uploadDate: new Date(),
-          };
+          // The server returns at once; the file is listed as "processing" until normalized
+          return response.data;
         }
       } catch (error) {
         console.error("Upload failed:", error);
@@ -356,9 +386,9 @@ export function VideoEditor() {
     );
 
     if (uploadedMediaFiles.length > 0) {
-      setMediaFiles((prev) => [...prev, ...uploadedMediaFiles]);
+      await fetchMedia();
       showToastNotification(
-        `Successfully uploaded ${uploadedMediaFiles.length} files`
+        `Uploaded ${uploadedMediaFiles.length} files, processing...`
       );
 
       if (!activeMediaId) {
@@ -1114,20 +1144,23 @@ export function VideoEditor() {
           <div className="media-list">
             {filteredMedia.map((media) => {
               const isActive = (activeMediaId === media.id) || (topVideoId === media.id) || (bottomVideoId === media.id);
+              const isPending = media.status === 'processing' || media.status === 'failed';
 
               return (
                 <div
                   key={media.id}
-                  className={`media-item ${isActive ? "active" : ""}`}
-                  onClick={() => setPreviewMedia(media)}
-                  draggable
+                  className={`media-item ${isActive ? "active" : ""} ${isPending ? media.status : ""}`}
+                  onClick={() => { if (!isPending) setPreviewMedia(media); }}
+                  draggable={!isPending}
                   onDragStart={(e) => {
                     e.dataTransfer.setData('application/json', JSON.stringify(media));
                     e.dataTransfer.effectAllowed = "copy";
                   }}
                 >
                   <div className="media-thumbnail">
-                    {media.type === "audio" ? (
+                    {isPending ? (
+                      <Clock size={24} />
+                    ) : media.type === "audio" ? (
                       <Volume2 size={24} />
                     ) : media.thumbnailUrl ? (
                       <img
@@ -1159,6 +1192,14 @@ export function VideoEditor() {
                       )}
                     </div>
                     <div className="media-meta">
+                      {media.status === 'processing' && (
+                        <span className="media-status">
+                          Processing{media.progress ? ` ${Math.round(media.progress * 100)}%` : '...'}
+                        </span>
+                      )}
+                      {media.status === 'failed' && (
+                        <span className="media-status failed" title={media.error || ''}>Processing failed</span>
+                      )}
                       <span className="file-size">
                         {media.file?.size
                           ? (media.file.size / (1024 * 1024)).toFixed(2) + " MB"
@@ -1174,7 +1215,7 @@ export function VideoEditor() {
                     </div>
                   </div>
                   <div className="media-actions" style={{ display: 'flex', gap: '4px' }}>
-                    {media.type !== 'audio' && !media.isViralClip && (
+                    {media.type !== 'audio' && !media.isViralClip && !isPending && (
                       <button
                         className="action-button viral-btn"
                         onClick={(e) => handleAutoGenerate(media.filename || media.name, e)}